@@ -8,21 +8,37 @@ import subprocess
 import csv
 import time
 import uuid
+import io
+import hashlib
+import random
 import re
+import math
+import glob
 import zipfile
+import zlib
 import tarfile
 import platform
 import shutil
-from datetime import timedelta
+import signal
+import tempfile
+import sqlite3
+import struct
+import enum
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+try:
+    import fcntl  # reflink ioctl; not available on Windows
+except ImportError:
+    fcntl = None
 
 from PySide6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton,
     QTableWidget, QTableWidgetItem, QHeaderView, QFileDialog, QComboBox,
     QMessageBox, QProgressBar, QSpinBox, QDialog, QFormLayout, QMenuBar, QMenu,
-    QCheckBox, QTabWidget, QTextEdit, QInputDialog, QAbstractItemView
+    QCheckBox, QTabWidget, QTextEdit, QInputDialog, QAbstractItemView, QProgressDialog, QTimeEdit
 )
 from PySide6.QtGui import QAction, QIcon, QFont
-from PySide6.QtCore import Qt, QThread, Signal, QTimer, QMetaObject, QEvent
+from PySide6.QtCore import Qt, QThread, Signal, Slot, QTimer, QMetaObject, QEvent, QObject, QFileSystemWatcher, QTime, QProcess
 
 import requests
 from requests.adapters import HTTPAdapter
@@ -30,6 +46,8 @@ from urllib3.util.retry import Retry
 
 # Global creation flags to prevent console windows on Windows
 CREATION_FLAGS = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+# Pausing freezes the download's process group with SIGSTOP where available
+SUPPORTS_SUSPEND = os.name == 'posix'
 
 # ---------------- Constants ----------------
 def get_app_dir():
@@ -57,8 +75,19 @@ CONFIG_DIR = os.path.join(get_user_data_dir(), ".youtube_downloader")
 os.makedirs(CONFIG_DIR, exist_ok=True)
 CONFIG_PATH = os.path.join(CONFIG_DIR, "config.json")
 QUEUE_PATH = os.path.join(CONFIG_DIR, "queue.json")
+SUBSCRIPTIONS_PATH = os.path.join(CONFIG_DIR, "subscriptions.json")
+HOST_STATS_PATH = os.path.join(CONFIG_DIR, "host_stats.json")
+PROXY_STATS_PATH = os.path.join(CONFIG_DIR, "proxy_stats.json")
+TRANSCODE_STATS_PATH = os.path.join(CONFIG_DIR, "transcode_stats.json")  # ffmpeg CPU time per output format
+ARCHIVE_DB_PATH = os.path.join(CONFIG_DIR, "archive.sqlite3")
+ARCHIVE_BLOOM_PATH = os.path.join(CONFIG_DIR, "archive.bloom")
+MEDIA_INDEX_PATH = os.path.join(CONFIG_DIR, "media.sqlite3")
+PREPARED_DIR = os.path.join(CONFIG_DIR, "prepared")  # yt-dlp -j output of upcoming items
 THUMB_CACHE_DIR = os.path.join(get_user_data_dir(), ".youtube_downloader_thumbs")
 os.makedirs(THUMB_CACHE_DIR, exist_ok=True)
+# Source streams of multi-output items, named after the item id, until every output is derived
+MEDIA_CACHE_DIR = os.path.join(get_user_data_dir(), ".youtube_downloader_cache")
+os.makedirs(MEDIA_CACHE_DIR, exist_ok=True)
 APP_DIR = get_app_dir()
 FFMPEG_BIN_DIR = os.path.join(APP_DIR, "ffmpeg_bin")
 YTDLP_BIN_DIR = os.path.join(APP_DIR, "yt-dlp_bin")
@@ -69,10 +98,392 @@ FFMPEG_NAME = "ffmpeg.exe" if platform.system().lower() == "windows" else "ffmpe
 QUALITY_OPTIONS = ["بهترین", "بدترین", "1080p", "720p", "480p", "360p", "144p"]
 FORMAT_OPTIONS = ["ویدیو و صدا", "فقط صدا"]
 VIDEO_FORMAT_OPTIONS = ["mp4", "mkv", "mov", "avi", "webm"]
+AUDIO_FORMAT_OPTIONS = ["mp3", "m4a", "opus"]  # m4a/opus are stream copies of YouTube audio
 SUBTITLE_LANGS = ["هیچ", "انگلیسی (en)", "فارسی (fa)"]
 
+# Codec prefixes each container can hold without re-encoding (None = anything)
+CONTAINER_COPY_CODECS = {
+    "mp4": (("avc1", "h264", "hvc1", "hev1", "av01"), ("mp4a", "aac", "mp3")),
+    "mov": (("avc1", "h264", "hvc1", "hev1"), ("mp4a", "aac", "mp3")),
+    "webm": (("vp8", "vp9", "vp09", "av01"), ("opus", "vorbis")),
+    "mkv": (None, None),
+    "avi": (("avc1", "h264"), ("mp3",)),
+}
+
+# Preferred audio stream per audio output, so extraction is a copy instead of a transcode
+AUDIO_FORMAT_SELECTORS = {
+    "mp3": "bestaudio/best",
+    "m4a": "bestaudio[ext=m4a]/bestaudio/best",
+    "opus": "bestaudio[acodec=opus]/bestaudio/best",
+}
+
+# Audio codecs that can be copied into each audio output, and encoder args otherwise
+AUDIO_COPY_CODECS = {"mp3": ("mp3",), "m4a": ("mp4a", "aac"), "opus": ("opus",)}
+AUDIO_ENCODER_ARGS = {
+    "mp3": ["-c:a", "libmp3lame", "-q:a", "5"],
+    "m4a": ["-c:a", "aac", "-b:a", "192k"],
+    "opus": ["-c:a", "libopus", "-b:a", "128k"],
+}
+
+# Downloads are QProcess children driven by the event loop, so this is bounded by the sites, not by threads
+MAX_CONCURRENT_DOWNLOADS = 200
+
+# ffmpeg stage runs apart from downloads so a finished transfer frees its network slot
+POSTPROCESS_WORKERS = max(1, os.cpu_count() or 1)
+FINAL_PATH_MARKER = "[final-path] "
+
+# Cancelled children get this long to exit after SIGTERM before the reaper kills them
+REAPER_GRACE_SECONDS = 3
+# Upper bound for closing the window, however many downloads are still running
+SHUTDOWN_TIMEOUT_SECONDS = 5
+SHUTDOWN_KILL_WAIT_MS = 1000          # for a worker still running once the deadline passed and it was killed
+
+# Pre-resolution: the next items the scheduler will start are extracted (-j) while others download,
+# so a freed slot goes straight to the transfer; entries are dropped well before their URLs expire
+PREFETCH_LOOKAHEAD = 3
+PREFETCH_WORKERS = 2
+PREFETCH_CHECK_MS = 2000
+PREFETCH_EXPIRY_MARGIN = 10 * 60      # seconds before the signed URLs' expiry
+PREFETCH_DEFAULT_TTL = 60 * 60        # for URLs that carry no expiry
+
+# Stall watchdog: a download with no byte progress for stall_timeout_seconds is restarted with --continue
+STALL_CHECK_INTERVAL_MS = 5000
+STALL_MAX_RESTARTS = 5
+STALL_DEMOTE_THRESHOLD = 3            # stall restarts of one item, over all its attempts, before it is scheduled last
+
+# Proxy pool: each download goes to the best-scoring proxy with a free slot (score = smoothed
+# throughput x smoothed success rate); PROXY_QUARANTINE_FAILURES failures in a row bench a proxy,
+# for twice as long each time it fails again straight after being reinstated
+PROXY_MAX_ACTIVE = 2                  # default concurrent downloads per proxy
+PROXY_QUARANTINE_FAILURES = 3
+PROXY_QUARANTINE_SECONDS = 5 * 60
+PROXY_MAX_QUARANTINE = 2 * 3600
+PROXY_SPEED_SMOOTHING = 0.2           # weight of the newest progress sample in a proxy's throughput
+
+# Disk admission: a job starts only while free space covers what it still needs (the download plus
+# a merged/converted copy where it is written, its outputs in the save folder) on top of what the
+# running jobs still need and a configurable headroom; held jobs are rechecked periodically
+DISK_WORK_FACTOR = 2
+DISK_RECHECK_MS = 30 * 1000
+DISK_HOLD_SCAN = 20                   # queued items passed over per scheduling round before giving up
+# Staged jobs download and post-process in the scratch folder; finished files are moved one item at a time
+MOVE_WORKERS = 1
+MOVE_CHUNK_SIZE = 8 * 1024 * 1024     # cross-file-system copies check for shutdown between chunks
+
+# Weekly schedule: the first rule whose window covers the current time sets the max concurrency,
+# a total bandwidth cap and whether new downloads may start; outside every rule the plain settings
+# apply. The cap is split evenly over the profile's slots, so only a profile switch that changes
+# that share restarts (with --continue) a running download
+SCHEDULE_CHECK_MS = 30 * 1000
+SCHEDULE_ETA_HORIZON = 8 * 24 * 3600  # the queue ETA walks the schedule this far, then assumes the last profile
+SCHEDULE_DAY_PRESETS = {  # datetime.weekday() numbers, Monday = 0
+    "همه روزها": [0, 1, 2, 3, 4, 5, 6],
+    "شنبه تا چهارشنبه": [0, 1, 2, 5, 6],
+    "دوشنبه تا جمعه": [0, 1, 2, 3, 4],
+    "پنجشنبه و جمعه": [3, 4],
+    "شنبه و یکشنبه": [5, 6],
+    "شنبه": [5], "یکشنبه": [6], "دوشنبه": [0], "سه‌شنبه": [1], "چهارشنبه": [2], "پنجشنبه": [3], "جمعه": [4],
+}
+
+# Failed downloads: transient errors retry on an exponential backoff, rate limits cool the whole host down
+RETRY_MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 15                 # seconds, doubled per attempt
+RETRY_MAX_DELAY = 15 * 60
+RATE_LIMIT_COOLDOWN = 5 * 60          # seconds, doubled per consecutive rate-limit hit
+RATE_LIMIT_MAX_COOLDOWN = 60 * 60
+
+ERROR_TRANSIENT = "transient"
+ERROR_RATE_LIMITED = "rate_limited"
+ERROR_UNAVAILABLE = "unavailable"
+ERROR_POSTPROCESS = "postprocess"
+ERROR_OTHER = "other"
+# Checked in this order; the first matching class wins
+ERROR_PATTERNS = [
+    # Age gates and login/membership walls are permanent for this session and must not cool the host down
+    (ERROR_UNAVAILABLE, re.compile(
+        r"Video unavailable|Private video|has been removed|members.only|not available in your country|"
+        r"account associated with this video has been terminated|HTTP Error 404|Unsupported URL|is not a valid URL|"
+        r"This live event will begin|Premieres in|Sign in to confirm your age|age.restricted|inappropriate for some users|"
+        r"login required|requires? (authentication|login)|Join this channel", re.I)),
+    (ERROR_RATE_LIMITED, re.compile(r"HTTP Error 429|Too Many Requests|Sign in to confirm you('|’)re not a bot|rate.?limit", re.I)),
+    (ERROR_POSTPROCESS, re.compile(r"Postprocessing|ffmpeg|Conversion failed|پردازش پس از دانلود", re.I)),
+    (ERROR_TRANSIENT, re.compile(
+        r"timed? ?out|Connection (reset|refused|aborted)|Remote end closed|Temporary failure in name resolution|"
+        r"Network is unreachable|IncompleteRead|HTTP Error 5\d\d|HTTP Error 403|Unable to download|Got error|"
+        r"SSL|متوقف ماند", re.I)),
+]
+
+# Queue item lifecycle. The enum value is what queue.json stores; labels are only for display.
+# Each status lists the statuses it may move to (see QueueItem.set_status)
+class ItemStatus(enum.Enum):
+    QUEUED = "queued"
+    DOWNLOADING = "downloading"
+    PAUSED = "paused"                     # also: interrupted, resumes from the partial file
+    RETRY_WAIT = "retry_wait"
+    POSTPROCESS_WAIT = "postprocess_wait"
+    POSTPROCESSING = "postprocessing"
+    MOVING = "moving"                     # out of the scratch folder into the output root
+    DONE = "done"
+    ERROR = "error"
+    CANCELLED = "cancelled"
+    TRUNCATED = "truncated"               # completed, then flagged by integrity verification
+    CORRUPT = "corrupt"
+    MISSING = "missing"
+
+    @property
+    def label(self):
+        return STATUS_LABELS[self]
+
+STATUS_LABELS = {
+    ItemStatus.QUEUED: "در صف",
+    ItemStatus.DOWNLOADING: "در حال دانلود...",
+    ItemStatus.PAUSED: "متوقف شده",
+    ItemStatus.RETRY_WAIT: "در انتظار تلاش مجدد",
+    ItemStatus.POSTPROCESS_WAIT: "در انتظار پردازش",
+    ItemStatus.POSTPROCESSING: "در حال پردازش...",
+    ItemStatus.MOVING: "در حال انتقال به پوشه مقصد",
+    ItemStatus.DONE: "دانلود شده",
+    ItemStatus.ERROR: "خطا",
+    ItemStatus.CANCELLED: "لغو شده",
+    ItemStatus.TRUNCATED: "ناقص - نیاز به دانلود مجدد",
+    ItemStatus.CORRUPT: "خراب - نیاز به دانلود مجدد",
+    ItemStatus.MISSING: "فایل یافت نشد",
+}
+COMPLETED_STATUSES = {ItemStatus.DONE, ItemStatus.TRUNCATED, ItemStatus.CORRUPT, ItemStatus.MISSING}
+# Starting fails straight to ERROR when yt-dlp/ffmpeg are missing; a suspend-paused download still
+# ends the way a running one does
+STATUS_TRANSITIONS = {
+    ItemStatus.QUEUED: {ItemStatus.DOWNLOADING, ItemStatus.PAUSED, ItemStatus.DONE, ItemStatus.ERROR, ItemStatus.CANCELLED},
+    ItemStatus.PAUSED: {ItemStatus.DOWNLOADING, ItemStatus.QUEUED, ItemStatus.RETRY_WAIT, ItemStatus.POSTPROCESS_WAIT,
+                        ItemStatus.MOVING, ItemStatus.DONE, ItemStatus.ERROR, ItemStatus.CANCELLED},
+    ItemStatus.DOWNLOADING: {ItemStatus.PAUSED, ItemStatus.RETRY_WAIT, ItemStatus.POSTPROCESS_WAIT, ItemStatus.MOVING,
+                             ItemStatus.DONE, ItemStatus.ERROR, ItemStatus.CANCELLED},
+    ItemStatus.RETRY_WAIT: {ItemStatus.DOWNLOADING, ItemStatus.PAUSED, ItemStatus.ERROR, ItemStatus.CANCELLED},
+    ItemStatus.POSTPROCESS_WAIT: {ItemStatus.POSTPROCESSING, ItemStatus.ERROR, ItemStatus.CANCELLED},
+    ItemStatus.POSTPROCESSING: {ItemStatus.MOVING, ItemStatus.DONE, ItemStatus.ERROR, ItemStatus.CANCELLED},
+    ItemStatus.MOVING: {ItemStatus.DONE, ItemStatus.ERROR},
+    ItemStatus.DONE: COMPLETED_STATUSES | {ItemStatus.QUEUED},
+    ItemStatus.ERROR: {ItemStatus.DOWNLOADING},
+    ItemStatus.CANCELLED: {ItemStatus.DOWNLOADING, ItemStatus.ERROR},
+    ItemStatus.TRUNCATED: COMPLETED_STATUSES | {ItemStatus.QUEUED},
+    ItemStatus.CORRUPT: COMPLETED_STATUSES | {ItemStatus.QUEUED},
+    ItemStatus.MISSING: COMPLETED_STATUSES | {ItemStatus.QUEUED},
+}
+# queue.json files written before ItemStatus stored the labels
+STATUS_BY_NAME = {**{status.value: status for status in ItemStatus}, **{label: status for status, label in STATUS_LABELS.items()}}
+# Picked by the scheduler / startable by hand / keeping a queue run alive (reset to PAUSED on the next start)
+WAITING_STATUSES = (ItemStatus.QUEUED, ItemStatus.PAUSED)
+STARTABLE_STATUSES = (ItemStatus.QUEUED, ItemStatus.ERROR, ItemStatus.CANCELLED, ItemStatus.PAUSED, ItemStatus.RETRY_WAIT)
+BUSY_STATUSES = (ItemStatus.DOWNLOADING, ItemStatus.POSTPROCESS_WAIT, ItemStatus.POSTPROCESSING, ItemStatus.RETRY_WAIT,
+                 ItemStatus.MOVING)
+# Queue columns that sort by a raw value when their header is clicked
+QUEUE_SORT_KEYS = {2: 'size', 3: 'duration'}
+
+# Tool bootstrap downloads: buffered chunks, resumable .tmp files, progress logged at most once per interval
+TOOL_DOWNLOAD_CHUNK = 1024 * 1024
+TOOL_DOWNLOAD_ATTEMPTS = 5
+TOOL_PROGRESS_INTERVAL = 1.0
+YTDLP_CHECKSUM_URL = "https://github.com/yt-dlp/yt-dlp/releases/latest/download/SHA2-256SUMS"
+# Published digests are recognised by their length
+CHECKSUM_ALGORITHMS = {32: "md5", 64: "sha256", 128: "sha512"}
+
+# Download archive Bloom filter: minimum sized capacity and target false-positive rate
+ARCHIVE_BLOOM_MIN_CAPACITY = 1_000_000
+ARCHIVE_BLOOM_ERROR_RATE = 0.01
+
+# Completed files are fingerprinted by one background reader, rate-limited (harder while
+# downloads or ffmpeg are running) so verification never competes with transfers for the disk
+HASH_WORKERS = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+HASH_IO_LIMIT = 64 * 1024 * 1024          # bytes/s when nothing else is running
+HASH_IO_LIMIT_BUSY = 8 * 1024 * 1024      # bytes/s while downloads or post-processing are active
+TRUNCATION_TOLERANCE = 0.02               # probed duration may fall this much short of the expected one
+TRUNCATION_MIN_SLACK = 2                  # seconds
+INTEGRITY_OK = "ok"
+INTEGRITY_TRUNCATED = "truncated"         # unreadable container or shorter than the video
+INTEGRITY_CORRUPT = "corrupt"             # contents changed since the recorded digest
+INTEGRITY_MISSING = "missing"
+INTEGRITY_STATUSES = {
+    INTEGRITY_TRUNCATED: ItemStatus.TRUNCATED,
+    INTEGRITY_CORRUPT: ItemStatus.CORRUPT,
+    INTEGRITY_MISSING: ItemStatus.MISSING,
+}
+FICLONE = 0x40049409                      # Linux ioctl sharing another file's extents (reflink)
+
+# Playlist expansion streams entries into the queue in chunks of this size / age
+FETCH_CHUNK_SIZE = 100
+FETCH_CHUNK_INTERVAL = 0.5
+
+# List export/import stream item by item; progress is reported at most this often
+TRANSFER_PROGRESS_INTERVAL = 0.25
+IMPORT_CHUNK_SIZE = 1000
+
+# Lazy import: single-video URLs are queued as placeholders and their metadata is fetched later,
+# visible rows first, then the next items the scheduler will start, then the rest in the background
+METADATA_WORKERS = 4
+METADATA_BACKGROUND_WORKERS = 1
+METADATA_BATCH_SIZE = 10              # URLs per yt-dlp invocation
+METADATA_LOOKAHEAD = 20               # queued items ahead of the scheduler resolved with priority
+METADATA_TICK_MS = 250
+PLACEHOLDER_TITLE = "در انتظار دریافت اطلاعات..."
+METADATA_KEYS = ('id', 'extractor_key', 'webpage_url', 'title', 'duration', 'filesize', 'filesize_approx',
+                 'view_count', 'upload_date', 'thumbnail')
+# Per-item format inventory (yt-dlp's order, worst first), enough to evaluate our own selectors offline
+INVENTORY_FIELDS = ('format_id', 'ext', 'height', 'vcodec', 'acodec', 'size')
+FORMAT_FILTER_RE = re.compile(r"\[(\w+)(<=|>=|!=|~=|<|>|=)'?([^'\]]*)'?\]")
+THROUGHPUT_SMOOTHING = 0.3            # weight of the newest 1 s sample in the per-slot throughput average
+YOUTUBE_VIDEO_RE = re.compile(r'(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/)|youtu\.be/)([A-Za-z0-9_-]{11})')
+
+# Subscriptions: newest-first enumeration stops at the first already-seen entry
+SUBSCRIPTION_SEEN_LIMIT = 200         # IDs remembered per source
+SUBSCRIPTION_BASELINE_ENTRIES = 30    # first sync only records what already exists
+SUBSCRIPTION_MAX_NEW_ENTRIES = 500    # safety cap when no known entry is found
+SUBSCRIPTION_CHECK_INTERVAL_MS = 60 * 1000
+
+# Queue restoration: rows painted before the window is shown, then rows per event-loop tick
+QUEUE_RESTORE_FIRST_CHUNK = 50
+QUEUE_RESTORE_CHUNK = 200
+
 # ---------------- Helper Functions ----------------
 
+HOST_ALIASES = {"youtu.be": "youtube.com", "music.youtube.com": "youtube.com"}
+
+def url_host(url):
+    host = (urlparse(url).hostname or "").lower()
+    for prefix in ("www.", "m."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    return HOST_ALIASES.get(host, host)
+
+def media_host(info):
+    """Host serving the first selected stream of an info dict (a CDN node, unlike the page host), or None."""
+    for fmt in (info or {}).get('requested_formats') or [info or {}]:
+        if fmt.get('url'):
+            return urlparse(fmt['url']).hostname
+    return None
+
+def stall_demoted(item):
+    """Whether `item` kept stalling, so the scheduler starts it after every other waiting item."""
+    return (item.get('stall_count') or 0) >= STALL_DEMOTE_THRESHOLD
+
+def stream_url_expiry(info):
+    """Earliest expiry (epoch seconds) of the signed stream URLs selected in an info dict."""
+    expiries = []
+    for fmt in info.get('requested_formats') or [info]:
+        url = fmt.get('url') or ""
+        value = parse_qs(urlparse(url).query).get('expire', [None])[0]
+        match = re.search(r'/expire/(\d+)', url) if value is None else None  # Manifest URLs use path params
+        value = match.group(1) if match else value
+        if value and value.isdigit():
+            expiries.append(int(value))
+    return min(expiries) if expiries else time.time() + PREFETCH_DEFAULT_TTL
+
+def classify_download_error(message):
+    """Map a yt-dlp/ffmpeg error text to one of the ERROR_* classes."""
+    for kind, pattern in ERROR_PATTERNS:
+        if pattern.search(message or ""):
+            return kind
+    return ERROR_OTHER
+
+def import_record_to_video_info(record):
+    """Turn a row of our own list export back into the fields _add_batch_to_table_from_thread reads."""
+    info = {'webpage_url': record['url'], 'title': record['title']}
+    # Exports carry formatted sizes/durations; NDJSON written by other tools may carry the raw numbers
+    for key, field, parse in (('filesize_str', 'filesize_approx', parse_file_size), ('duration_str', 'duration', parse_duration)):
+        value = record.get(field)
+        value = value if isinstance(value, (int, float)) else parse(str(record.get(key) or ""))
+        if value is not None:
+            info[field] = value
+    if record.get('upload_date') and record['upload_date'] != 'نامشخص':
+        info['upload_date'] = str(record['upload_date'])
+    if str(record.get('view_count', '')).isdigit():
+        info['view_count'] = int(record['view_count'])
+    if record.get('thumbnail_url') and record['thumbnail_url'] != 'نامشخص':
+        info['thumbnail'] = record['thumbnail_url']
+    return info
+
+def placeholder_video_info(url):
+    """Video info for a queue placeholder, or None if `url` may be a playlist or isn't recognised."""
+    match = YOUTUBE_VIDEO_RE.search(url)
+    if not match or 'list=' in url:
+        return None
+    video_id = match.group(1)
+    return {'webpage_url': f"https://www.youtube.com/watch?v={video_id}", 'title': PLACEHOLDER_TITLE,
+            'id': video_id, 'extractor_key': 'Youtube', 'placeholder': True}
+
+def is_playlist_url(url):
+    """Whether `url` names a playlist, which yt-dlp lists oldest-first (channel tabs list newest-first)."""
+    return 'list=' in url or urlparse(url).path.rstrip('/').endswith('/playlist')
+
+def clock_minutes(clock):
+    """Minutes after midnight of an "HH:MM" string."""
+    hours, minutes = clock.split(":")
+    return int(hours) * 60 + int(minutes)
+
+def schedule_rule_active(rule, moment):
+    """Whether the rule covers `moment`; a window ending at or before its start runs past midnight."""
+    start, end = clock_minutes(rule['start']), clock_minutes(rule['end'])
+    minute = moment.hour * 60 + moment.minute
+    weekday = moment.weekday()
+    if start < end:
+        return weekday in rule['days'] and start <= minute < end
+    return (weekday in rule['days'] and minute >= start) or ((weekday - 1) % 7 in rule['days'] and minute < end)
+
+def schedule_profile(schedule, default, moment):
+    """{'concurrency', 'rate_limit' (total bytes/s, 0 = none), 'allow_starts'} in force at `moment`."""
+    for rule in schedule:
+        if schedule_rule_active(rule, moment):
+            return {'concurrency': rule['concurrency'], 'rate_limit': rule['rate_limit'], 'allow_starts': rule['allow_starts']}
+    return default
+
+def slot_rate_limit(profile, transfers):
+    """Per-download --limit-rate share of a profile's bandwidth cap among `transfers` downloads, or None."""
+    return profile['rate_limit'] // max(1, transfers) if profile['rate_limit'] else None
+
+def schedule_segments(schedule, default, now, horizon=SCHEDULE_ETA_HORIZON):
+    """[(start, end, profile)] from `now` on; the last segment is open-ended."""
+    boundaries = set()
+    midnight = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    for day in range(int(horizon // 86400) + 2):
+        base = midnight + timedelta(days=day)
+        for rule in schedule:
+            for clock in (rule['start'], rule['end']):
+                moment = (base + timedelta(minutes=clock_minutes(clock))).timestamp()
+                if now < moment < now + horizon:
+                    boundaries.add(moment)
+    starts = [now] + sorted(boundaries)
+    return [(start, end, schedule_profile(schedule, default, datetime.fromtimestamp(start)))
+            for start, end in zip(starts, starts[1:] + [math.inf])]
+
+def schedule_eta(running_bytes, running_count, queued_bytes, slot_speed, segments, now):
+    """Seconds until the remaining bytes are through, each slot moving `slot_speed` bytes/s, or None.
+
+    Windows that allow no new starts only carry on with what is running now.
+    """
+    for start, end, profile in segments:
+        slots = profile['concurrency'] if profile['allow_starts'] else min(profile['concurrency'], running_count)
+        rate = slot_speed * slots
+        if profile['rate_limit']:
+            rate = min(rate, profile['rate_limit'])
+        movable = running_bytes + (queued_bytes if profile['allow_starts'] else 0)
+        if rate <= 0 or movable <= 0:
+            continue
+        if movable <= rate * (end - start):
+            if movable == running_bytes + queued_bytes:
+                return start + movable / rate - now
+            running_bytes = running_count = 0
+            continue
+        moved = rate * (end - start)
+        from_running = min(running_bytes, moved)
+        running_bytes -= from_running
+        queued_bytes -= moved - from_running
+    return None
+
+def retry_delay(attempt):
+    """Exponential backoff with +-20% jitter so retried items don't restart in lockstep."""
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt) * random.uniform(0.8, 1.2)
+
 def resource_path(relative_path):
     try:
         base_path = sys._MEIPASS
@@ -80,30 +491,127 @@ def resource_path(relative_path):
         base_path = os.path.abspath(os.path.dirname(__file__))
     return os.path.join(base_path, relative_path)
 
-def download_with_progress(url, download_path, tool_name):
-    """Download with progress logging."""
-    try:
-        response = requests.get(url, stream=True, timeout=(30, 300))
+def fetch_published_checksum(checksum_url, name):
+    """Return the digest listed for `name` in a checksum file ("<digest>  <name>" lines or a bare digest)."""
+    response = requests.get(checksum_url, timeout=30)
+    response.raise_for_status()
+    for line in response.text.splitlines():
+        parts = line.split()
+        if not parts or len(parts[0]) not in CHECKSUM_ALGORITHMS or not re.fullmatch(r'[0-9a-fA-F]+', parts[0]):
+            continue
+        if len(parts) == 1 or parts[-1].lstrip('*') == name:
+            return parts[0].lower()
+    raise IOError(f"checksum for {name} not found in {checksum_url}")
+
+def file_digest(path, algorithm):
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(TOOL_DOWNLOAD_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _download_range(url, download_path, tool_name):
+    """One attempt: continue `download_path` from its current size if the server still has the same file."""
+    validator_path = download_path + ".validator"
+    offset = os.path.getsize(download_path) if os.path.exists(download_path) else 0
+    headers = {}
+    if offset and os.path.exists(validator_path):
+        with open(validator_path, encoding='utf-8') as f:
+            headers['Range'] = f"bytes={offset}-"
+            headers['If-Range'] = f.read().strip()  # A changed file comes back whole (200) instead of 206
+    with requests.get(url, stream=True, timeout=(30, 300), headers=headers) as response:
+        if response.status_code == 416:
+            return  # Already complete; the checksum decides
         response.raise_for_status()
-        total_size = int(response.headers.get('content-length', 0))
-        downloaded_size = 0
-
-        with open(download_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    downloaded_size += len(chunk)
-                    if total_size > 0:
-                        percent = (downloaded_size / total_size) * 100
-                        print(f"[{tool_name}] Downloaded {percent:.1f}% ({format_file_size(downloaded_size)} / {format_file_size(total_size)})", end='\r')
-                        logging.info(f"[{tool_name}] {percent:.1f}%")
+        if response.status_code != 206:
+            offset = 0
+        validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+        if validator:
+            with open(validator_path, 'w', encoding='utf-8') as f:
+                f.write(validator)
+        elif os.path.exists(validator_path):
+            os.remove(validator_path)
+        length = int(response.headers.get('content-length', 0))
+        total_size = offset + length if length else 0
+        downloaded_size = offset
+        if offset:
+            logging.info(f"[{tool_name}] Resuming at {format_file_size(offset)}")
+        last_report = 0
+        with open(download_path, 'ab' if offset else 'wb') as f:
+            for chunk in response.iter_content(chunk_size=TOOL_DOWNLOAD_CHUNK):
+                f.write(chunk)
+                downloaded_size += len(chunk)
+                now = time.monotonic()
+                if total_size > 0 and now - last_report >= TOOL_PROGRESS_INTERVAL:
+                    last_report = now
+                    percent = (downloaded_size / total_size) * 100
+                    print(f"[{tool_name}] Downloaded {percent:.1f}% ({format_file_size(downloaded_size)} / {format_file_size(total_size)})", end='\r')
+                    logging.info(f"[{tool_name}] {percent:.1f}%")
+        if total_size and downloaded_size != total_size:
+            raise IOError(f"connection closed at {format_file_size(downloaded_size)} of {format_file_size(total_size)}")
+
+def download_with_progress(url, download_path, tool_name, checksum_url=None):
+    """Download with progress logging, resuming an earlier partial file and verifying the published checksum.
+
+    The partial file is kept when the download fails so the next attempt continues with an HTTP Range request.
+    """
+    try:
+        expected = fetch_published_checksum(checksum_url, os.path.basename(urlparse(url).path)) if checksum_url else None
+        for attempt in range(TOOL_DOWNLOAD_ATTEMPTS):
+            try:
+                _download_range(url, download_path, tool_name)
+                break
+            except (requests.RequestException, IOError) as e:
+                if attempt == TOOL_DOWNLOAD_ATTEMPTS - 1:
+                    raise
+                logging.warning(f"[{tool_name}] Download interrupted ({e}), resuming...")
+                time.sleep(2 ** attempt)
         print(f"\n[{tool_name}] Download completed.")
         logging.info(f"[{tool_name}] Download completed.")
+
+        if expected:
+            algorithm = CHECKSUM_ALGORITHMS.get(len(expected), "sha256")
+            actual = file_digest(download_path, algorithm)
+            if actual != expected:
+                os.remove(download_path)
+                raise IOError(f"checksum mismatch ({algorithm} {actual} != {expected})")
+            logging.info(f"[{tool_name}] {algorithm} verified.")
+        else:
+            logging.warning(f"[{tool_name}] No published checksum for {url}; skipping verification.")
+        if os.path.exists(download_path + ".validator"):
+            os.remove(download_path + ".validator")
     except Exception as e:
-        if os.path.exists(download_path):
-            os.remove(download_path)
         raise IOError(f"خطا در دانلود {tool_name}: {e}")
 
+def extract_members(archive_path, names, dest_dir):
+    """Stream just the files called `names` (any directory) out of a .zip or .tar.xz; returns the names written."""
+    written = set()
+
+    def write(src, name):
+        dst = os.path.join(dest_dir, name)
+        with open(dst + ".tmp", 'wb') as out:
+            shutil.copyfileobj(src, out, TOOL_DOWNLOAD_CHUNK)
+        os.replace(dst + ".tmp", dst)
+        written.add(name)
+
+    if archive_path.endswith(".zip"):
+        with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+            for info in zip_ref.infolist():
+                name = os.path.basename(info.filename)
+                if name in names and not info.is_dir():
+                    with zip_ref.open(info) as src:
+                        write(src, name)
+    else:
+        # 'r|xz' decompresses sequentially and stops as soon as every wanted member was seen
+        with tarfile.open(archive_path, 'r|xz') as tar_ref:
+            for member in tar_ref:
+                name = os.path.basename(member.name)
+                if member.isfile() and name in names:
+                    write(tar_ref.extractfile(member), name)
+                    if written == names:
+                        break
+    return written
+
 def download_yt_dlp():
     system = platform.system().lower()
     if system == "windows":
@@ -112,7 +620,7 @@ def download_yt_dlp():
         url = "https://github.com/yt-dlp/yt-dlp/releases/latest/download/yt-dlp"
     os.makedirs(YTDLP_BIN_DIR, exist_ok=True)
     download_path = os.path.join(YTDLP_BIN_DIR, YTDLP_NAME + ".tmp")
-    download_with_progress(url, download_path, "yt-dlp")
+    download_with_progress(url, download_path, "yt-dlp", checksum_url=YTDLP_CHECKSUM_URL)
     final_path = os.path.join(YTDLP_BIN_DIR, YTDLP_NAME)
     os.replace(download_path, final_path)
     if not system == "windows":
@@ -124,8 +632,11 @@ def download_ffmpeg():
     system = platform.system().lower()
     machine = platform.machine().lower()
     
+    # Checksum files are published next to the archives (gyan.dev: .sha256, johnvansickle: .md5 only)
+    checksum_url = None
     if system == "windows":
         url = "https://www.gyan.dev/ffmpeg/builds/ffmpeg-release-essentials.zip"
+        checksum_url = url + ".sha256"
         file_ext = ".zip"
     elif system == "darwin":
         url = "https://evermeet.cx/ffmpeg/getrelease/ffmpeg/zip"
@@ -135,6 +646,7 @@ def download_ffmpeg():
             url = "https://johnvansickle.com/ffmpeg/releases/ffmpeg-release-arm64-static.tar.xz"
         else:
             url = "https://johnvansickle.com/ffmpeg/releases/ffmpeg-release-amd64-static.tar.xz"
+        checksum_url = url + ".md5"
         file_ext = ".tar.xz"
     else:
         raise OSError("سیستم عامل پشتیبانی نمی‌شود.")
@@ -142,41 +654,21 @@ def download_ffmpeg():
     os.makedirs(FFMPEG_BIN_DIR, exist_ok=True)
     download_path = os.path.join(FFMPEG_BIN_DIR, f"ffmpeg{file_ext}.tmp")
     
-    download_with_progress(url, download_path, "ffmpeg")
+    download_with_progress(url, download_path, "ffmpeg", checksum_url=checksum_url)
     
     zip_path = download_path.replace('.tmp', '')
     os.replace(download_path, zip_path)
     
+    exe = ".exe" if system == "windows" else ""
     try:
-        if file_ext == ".zip":
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(FFMPEG_BIN_DIR)
-        elif file_ext == ".tar.xz":
-            with tarfile.open(zip_path, 'r:xz') as tar_ref:
-                tar_ref.extractall(FFMPEG_BIN_DIR)
-        
-        # Copy binaries to ffmpeg_bin
-        for root, _, files in os.walk(FFMPEG_BIN_DIR):
-            for file in files:
-                if file in [FFMPEG_NAME, "ffprobe", "ffprobe.exe", "ffplay", "ffplay.exe"]:
-                    src = os.path.join(root, file)
-                    dst = os.path.join(FFMPEG_BIN_DIR, file)
-                    shutil.copy(src, dst)
-                    if not system == "windows":
-                        os.chmod(dst, 0o755)
-        
+        # ffplay is not used by the app, so only ffmpeg/ffprobe are pulled out of the archive
+        written = extract_members(zip_path, {FFMPEG_NAME, "ffprobe" + exe}, FFMPEG_BIN_DIR)
+        if FFMPEG_NAME not in written:
+            raise IOError(f"{FFMPEG_NAME} در آرشیو یافت نشد")
+        if not system == "windows":
+            for name in written:
+                os.chmod(os.path.join(FFMPEG_BIN_DIR, name), 0o755)
         os.remove(zip_path)
-        # Clean up extracted dir if any
-        extracted_dir = None
-        for root, dirs, _ in os.walk(FFMPEG_BIN_DIR):
-            for d in dirs:
-                if d.startswith("ffmpeg-"):
-                    extracted_dir = os.path.join(root, d)
-                    break
-            if extracted_dir:
-                break
-        if extracted_dir and os.path.exists(extracted_dir):
-            shutil.rmtree(extracted_dir)
     except Exception as e:
         raise IOError(f"خطا در استخراج ffmpeg: {e}")
     
@@ -309,6 +801,16 @@ def format_file_size(size_bytes):
     except (ValueError, TypeError):
         return "نامشخص"
 
+def parse_file_size(size_str):
+    """Bytes from a format_file_size() or yt-dlp size string ("12.34 MB", "1.50MiB"), or None."""
+    match = re.fullmatch(r'([\d.]+)\s*([KMG]?)i?B', (size_str or "").strip())
+    if not match:
+        return None
+    try:
+        return round(float(match.group(1)) * 1024 ** " KMG".index(match.group(2) or " "))
+    except ValueError:
+        return None
+
 def format_duration(duration_sec):
     if duration_sec is None:
         return "نامشخص"
@@ -339,18 +841,254 @@ def format_eta(eta_seconds):
     except (ValueError, TypeError):
         return ""
 
-def check_file_exists(save_folder, title, ext):
-    safe_title = "".join(c for c in title if c.isalnum() or c in " ._()")
-    file_path = os.path.join(save_folder, f"{safe_title}.{ext}")
-    return os.path.exists(file_path), file_path
+def get_output_ext(item, settings=None):
+    """Extension of the final file produced for a queue item."""
+    settings = settings or {}
+    if item.get("format") == "فقط صدا":
+        return item.get("audio_format", settings.get("audio_format", "mp3"))
+    return item.get("video_format", settings.get("video_format", "mp4"))
+
+def build_video_format_selector(quality_str, video_format):
+    """Format selector preferring streams that already fit the target container."""
+    if quality_str == "بهترین":
+        pick, height = "best", ""
+    elif quality_str == "بدترین":
+        pick, height = "worst", ""
+    else:
+        pick, height = "best", f"[height<={quality_str.replace('p', '')}]"
+
+    video_codecs, audio_codecs = CONTAINER_COPY_CODECS.get(video_format, (None, None))
+    preferred = []
+    if video_codecs:
+        video_filter = f"[vcodec~='^({'|'.join(video_codecs)})']"
+        audio_filter = f"[acodec~='^({'|'.join(audio_codecs)})']" if audio_codecs else ""
+        preferred += [
+            f"{pick}video{video_filter}{height}+{pick}audio{audio_filter}",
+            f"{pick}[ext={video_format}]{height}",
+        ]
+    # Fallbacks accept any codec; the downloader recodes those
+    preferred += [f"{pick}video{height}+{pick}audio", f"{pick}{height}"]
+    return "/".join(preferred)
+
+def codecs_fit_container(container, vcodec, acodec):
+    """True if the given streams can be remuxed into `container` without re-encoding."""
+    if container not in CONTAINER_COPY_CODECS:
+        return False
+    video_codecs, audio_codecs = CONTAINER_COPY_CODECS[container]
+
+    def fits(codec, allowed):
+        if not codec or codec == "none" or allowed is None:
+            return True
+        return codec.lower().startswith(allowed)
+
+    return fits(vcodec, video_codecs) and fits(acodec, audio_codecs)
+
+def selected_stream_codecs(info_dict):
+    """Return (vcodec, acodec) of the format(s) yt-dlp selected in `info_dict`."""
+    vcodec = acodec = None
+    for fmt in info_dict.get("requested_formats") or [info_dict]:
+        if fmt.get("vcodec") not in (None, "none"):
+            vcodec = fmt["vcodec"]
+        if fmt.get("acodec") not in (None, "none"):
+            acodec = fmt["acodec"]
+    return vcodec, acodec
+
+def build_postprocess_command(ffmpeg_path, src_path, step):
+    """Build the ffmpeg command for one post-processing step.
+
+    Returns (cmd, dst_path), or (None, src_path) if the file already is in the wanted form.
+    Steps carrying an 'output_stem' derive a new file there and never return None.
+    """
+    stem, src_ext = os.path.splitext(src_path)
+    src_ext = src_ext.lstrip('.').lower()
+    derive = 'output_stem' in step
+    if derive:
+        stem = step['output_stem']
+    if step['key'] == 'FFmpegExtractAudio':
+        target = step['preferredcodec']
+        copy = (step.get('source_codec') or '').lower().startswith(AUDIO_COPY_CODECS.get(target, ()))
+        if copy and src_ext == target and not derive:
+            return None, src_path
+        codec_args = ["-c:a", "copy"] if copy else AUDIO_ENCODER_ARGS.get(target, [])
+        args = ["-vn"] + codec_args
+    elif step['key'] == 'FFmpegVideoRemuxer':
+        target = step['preferedformat']
+        args = ["-c", "copy"]
+    elif step['key'] == 'FFmpegVideoConvertor':
+        target = step['preferedformat']
+        args = ["-c:v", "libxvid", "-vtag", "XVID"] if target == "avi" else []
+    else:
+        return None, src_path
+
+    dst_path = f"{stem}.{target}"
+    out_path = f"{stem}.temp.{target}" if dst_path == src_path else dst_path
+    cmd = [ffmpeg_path, "-y", "-hide_banner", "-loglevel", "error", "-i", src_path] + args + [out_path]
+    return cmd, dst_path
 
-def check_partial_file(save_folder, title, ext):
-    safe_title = "".join(c for c in title if c.isalnum() or c in " ._()")
-    part_path = os.path.join(save_folder, f"{safe_title}.{ext}.part")
-    return os.path.exists(part_path), part_path
+def ffmpeg_progress(fields, duration):
+    """Position, percent, speed (x realtime) and ETA from one `-progress` block; None where unknown."""
+    try:
+        # out_time_ms is in microseconds as well, despite its name
+        out_time = int(fields.get('out_time_us') or fields.get('out_time_ms')) / 1e6
+    except (TypeError, ValueError):
+        out_time = None  # N/A until the first frame is written
+    speed_match = re.match(r'\s*([\d.]+)x', fields.get('speed', ''))
+    speed = float(speed_match.group(1)) if speed_match else None
+    percent = eta = None
+    if out_time is not None and duration:
+        percent = min(100.0, max(0.0, out_time / duration * 100))
+        if speed:
+            eta = max(0.0, duration - out_time) / speed
+    return {'out_time': out_time, 'percent': percent, 'speed': speed, 'eta': eta}
+
+def output_variant_step(target, vcodec, acodec, output_stem):
+    """Post-processing step deriving the `target` format from cached source streams."""
+    if target in AUDIO_FORMAT_OPTIONS:
+        return {'key': 'FFmpegExtractAudio', 'preferredcodec': target, 'source_codec': acodec, 'output_stem': output_stem}
+    key = 'FFmpegVideoRemuxer' if codecs_fit_container(target, vcodec, acodec) else 'FFmpegVideoConvertor'
+    return {'key': key, 'preferedformat': target, 'output_stem': output_stem}
+
+def item_outputs(item, settings=None):
+    """Formats to produce for a queue item: its own format first, then its extra outputs."""
+    primary = get_output_ext(item, settings)
+    return [primary] + [fmt for fmt in dict.fromkeys(item.get('extra_outputs') or []) if fmt != primary]
+
+def cached_source_files(item_id):
+    """Files (streams, partials, subtitles) a multi-output item keeps in MEDIA_CACHE_DIR."""
+    return glob.glob(os.path.join(glob.escape(MEDIA_CACHE_DIR), glob.escape(item_id) + ".*"))
+
+def delete_cached_source(item_id):
+    for path in cached_source_files(item_id):
+        try:
+            os.remove(path)
+        except OSError as e:
+            logging.error(f"خطا در حذف فایل {path}: {e}")
+
+def item_format_selector(item, settings=None):
+    """yt-dlp -f selector for a queue item; for multi-output items the first video output decides."""
+    video_outputs = [fmt for fmt in item_outputs(item, settings) if fmt in VIDEO_FORMAT_OPTIONS]
+    if video_outputs:
+        return build_video_format_selector(item.get('quality', "بهترین"), video_outputs[0])
+    return AUDIO_FORMAT_SELECTORS.get(get_output_ext(item, settings), 'bestaudio/best')
+
+def format_inventory(info):
+    """Compact INVENTORY_FIELDS rows for the formats of a full (-j) info dict."""
+    duration = info.get('duration')
+    rows = []
+    for fmt in info.get('formats') or []:
+        vcodec, acodec = fmt.get('vcodec') or 'none', fmt.get('acodec') or 'none'
+        if vcodec == 'none' and acodec == 'none':
+            continue  # Storyboards
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size and fmt.get('tbr') and duration:
+            size = fmt['tbr'] * 1000 / 8 * duration  # tbr is in kbit/s
+        rows.append([fmt.get('format_id'), fmt.get('ext'), fmt.get('height'), vcodec, acodec, int(size) if size else None])
+    return rows
+
+def _format_matches(fmt, key, op, value):
+    actual = fmt.get(key)
+    if actual is None:
+        return False
+    if op == '~=':
+        return re.search(value, str(actual)) is not None
+    if op in ('=', '!='):
+        return (str(actual) == value) == (op == '=')
+    try:
+        actual, value = float(actual), float(value)
+    except ValueError:
+        return False
+    return {'<=': actual <= value, '>=': actual >= value, '<': actual < value, '>': actual > value}[op]
+
+def _pick_format(formats, spec):
+    base = re.match(r'(best|worst)(video|audio)?', spec)
+    if not base:
+        return None
+    kind = base.group(2)
+    filters = FORMAT_FILTER_RE.findall(spec[base.end():])
+    candidates = []
+    for fmt in formats:
+        has_video, has_audio = fmt['vcodec'] != 'none', fmt['acodec'] != 'none'
+        if (kind == 'video' and (not has_video or has_audio)) or (kind == 'audio' and (has_video or not has_audio)):
+            continue
+        if kind is None and not (has_video and has_audio):
+            continue
+        if all(_format_matches(fmt, key, op, value) for key, op, value in filters):
+            candidates.append(fmt)
+    if not candidates:
+        return None
+    return candidates[-1] if base.group(1) == 'best' else candidates[0]
+
+def select_formats(inventory, selector):
+    """Formats yt-dlp would pick for `selector`, or None.
+
+    Covers the syntax build_video_format_selector and AUDIO_FORMAT_SELECTORS produce:
+    "/" alternatives, "+" merges, best/worst[video|audio] and [key op value] filters.
+    """
+    formats = [dict(zip(INVENTORY_FIELDS, row)) for row in inventory]
+    for alternative in selector.split('/'):
+        picked = [_pick_format(formats, spec) for spec in alternative.split('+')]
+        if all(picked):
+            return picked
+    return None
+
+def quality_options(inventory):
+    """Quality choices an item really has: best/worst and each available video height."""
+    heights = sorted({row[2] for row in inventory or [] if row[2] and row[3] != 'none'}, reverse=True)
+    if not heights:
+        return QUALITY_OPTIONS
+    return QUALITY_OPTIONS[:2] + [f"{height}p" for height in heights]
+
+def closest_quality(quality, options):
+    """`quality` if offered, else the highest offered height below it (or the lowest one)."""
+    if quality in options:
+        return quality
+    match = re.fullmatch(r'(\d+)p', quality or "")
+    heights = options[2:]
+    if match and heights:
+        fitting = [option for option in heights if int(option[:-1]) <= int(match.group(1))]
+        return fitting[0] if fitting else heights[-1]
+    return options[0]
+
+def find_subtitle_files(media_path):
+    """Subtitle files yt-dlp wrote next to `media_path` (<stem>.<lang>.<ext>)."""
+    stem = os.path.splitext(media_path)[0]
+    return [p for p in glob.glob(glob.escape(stem) + ".*.*")
+            if p.rsplit('.', 1)[-1].lower() in ("vtt", "ttml", "srv1", "srv2", "srv3", "json3", "ass", "lrc")]
+
+def safe_filename(title):
+    """File name stem used in the output template; the single source for all path lookups."""
+    return "".join(c for c in title if c.isalnum() or c in " ._()")
+
+def check_file_exists(folders, title, ext, index=None):
+    """Return (exists, path) of `title` on any of the output roots; the path is on the first root if missing."""
+    name = f"{safe_filename(title)}.{ext}"
+    if index is not None and index.is_ready(folders):
+        path = index.lookup(name)
+        return path is not None, path or os.path.join(folders[0], name)
+    for folder in folders:
+        file_path = os.path.join(folder, name)
+        if os.path.exists(file_path):
+            return True, file_path
+    return False, os.path.join(folders[0], name)
+
+def check_partial_file(folders, title, ext, index=None):
+    """Return (exists, part_path, size) for a partial download of `title` on any of the output roots."""
+    safe_title = safe_filename(title)
+    part_path = os.path.join(folders[0], f"{safe_title}.{ext}.part")
+    if index is not None and index.is_ready(folders):
+        # Any .part of this title counts, including per-format parts (title.f137.mp4.part)
+        parts = index.partials(safe_title)
+        if parts:
+            return True, parts[0][0], sum(size for _, size in parts)
+        return False, part_path, 0
+    for folder in folders:
+        path = os.path.join(folder, f"{safe_title}.{ext}.part")
+        if os.path.exists(path):
+            return True, path, os.path.getsize(path)
+    return False, part_path, 0
 
 def delete_partial_files(save_folder, title, ext, force_delete=False):
-    safe_title = "".join(c for c in title if c.isalnum() or c in " ._()")
+    safe_title = safe_filename(title)
     file_path = os.path.join(save_folder, f"{safe_title}.{ext}")
     part_path = file_path + '.part'
     paths = [file_path, part_path] if force_delete else [part_path]
@@ -361,6 +1099,70 @@ def delete_partial_files(save_folder, title, ext, force_delete=False):
             except OSError as e:
                 logging.error(f"خطا در حذف فایل {path}: {e}")
 
+def path_root(path, roots):
+    """The root folder `path` lies under, or None."""
+    path = os.path.normcase(os.path.abspath(path))
+    for root in roots:
+        prefix = os.path.normcase(os.path.abspath(root))
+        if path == prefix or path.startswith(prefix.rstrip(os.sep) + os.sep):
+            return root
+    return None
+
+def root_has_rules(root):
+    return bool(root.get('formats') or root.get('sources'))
+
+def choose_output_root(roots, ext, host, needed, free, load):
+    """Output root for a new item, or None if no eligible root has `needed` bytes free.
+
+    Roots whose format/source rules all match the item take it ahead of roots without rules,
+    which still catch it when those are full; roots with rules it does not match never do. The candidate with the most weighted free
+    space per concurrent writer wins.
+    """
+    ruled = [root for root in roots if root_has_rules(root)
+             and (not root.get('formats') or ext in root['formats'])
+             and (not root.get('sources') or host in root['sources'])]
+    candidates = ([root for root in ruled if free.get(root['path'], 0) >= needed]
+                  or [root for root in roots if not root_has_rules(root) and free.get(root['path'], 0) >= needed])
+    if not candidates:
+        return None
+    best = max(candidates, key=lambda root: root.get('weight', 1) * free[root['path']] / (1 + load.get(root['path'], 0)))
+    return best['path']
+
+def move_into_folder(path, folder, should_stop=lambda: False):
+    """Move a finished file into `folder` under the same name and return its new path.
+
+    Across file systems it is copied under a temporary name first, so the final name
+    never shows a half-written file. Returns None, leaving the source in place, if
+    should_stop() turns true during the copy.
+    """
+    target = os.path.join(folder, os.path.basename(path))
+    try:
+        os.replace(path, target)
+        return target
+    except OSError:
+        pass  # Different file system
+    temp = target + ".moving"
+    stopped = False
+    try:
+        with open(path, 'rb') as src, open(temp, 'wb') as dst:
+            for chunk in iter(lambda: src.read(MOVE_CHUNK_SIZE), b''):
+                if should_stop():
+                    stopped = True
+                    break
+                dst.write(chunk)
+        if not stopped:
+            shutil.copystat(path, temp)
+            os.replace(temp, target)
+    except OSError:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    if stopped:
+        os.remove(temp)
+        return None
+    os.remove(path)
+    return target
+
 def download_thumbnail(url, save_path):
     session = requests.Session()
     retry = Retry(connect=5, read=5, redirect=5, backoff_factor=1)
@@ -379,14 +1181,768 @@ def download_thumbnail(url, save_path):
         logging.error(f"خطا در دانلود تامنیل: {e}")
         return False
 
-# ---------------- Worker Classes (Threads) ----------------
-class DownloaderThread(QThread):
+# ---------------- Queue Items ----------------
+class QueueItem:
+    """One entry of the download queue or the completed list.
+
+    Sizes (bytes) and durations (seconds) are kept as numbers and formatted only for display;
+    `status` is an ItemStatus moved along STATUS_TRANSITIONS by set_status(). The record stays
+    subscriptable (item['title'], item.get(...)) so call sites read like the dicts it replaced;
+    keys it has no field for are kept in `extra` and written back unchanged.
+    """
+    FIELDS = ('id', 'title', 'url', 'status', 'filesize', 'selected_size', 'duration', 'downloaded_bytes',
+              'view_count', 'upload_date', 'quality', 'format', 'video_format', 'audio_format', 'subtitle_lang',
+              'thumbnail_url', 'archive_id', 'download_path', 'output_paths', 'output_root', 'work_folder',
+              'extra_outputs', 'formats', 'needs_metadata', 'needs_formats', 'retry_count', 'retry_at',
+              'stall_count', 'integrity', 'sha256')
+    DISPLAY_FIELDS = ('filesize_str', 'duration_str', 'downloaded_size')  # read-only, formatted on access
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            setattr(self, name, None)
+        self.status = ItemStatus.QUEUED
+        self.downloaded_bytes = 0
+        self.extra = {}
+        for key, value in fields.items():
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a saved item, including records written with display strings instead of numbers.
+
+        A legacy string that does not parse back is kept under its old key, so nothing is dropped.
+        """
+        data = dict(data)
+        status = data.pop('status', None)
+        legacy = {}
+        for key, field, parse in (('filesize_str', 'filesize', parse_file_size),
+                                  ('duration_str', 'duration', parse_duration),
+                                  ('downloaded_size', 'downloaded_bytes', parse_file_size)):
+            if key not in data:
+                continue
+            text = data.pop(key)
+            value = parse(text)
+            if value is not None:
+                data.setdefault(field, value)
+            elif text not in (None, "", "نامشخص"):
+                legacy[key] = text
+        item = cls(**data)
+        item.extra.update(legacy)
+        item.status = STATUS_BY_NAME.get(status, ItemStatus.QUEUED)
+        if status is not None and status not in STATUS_BY_NAME:
+            logging.warning(f"Unknown status {status!r} for {item.title}, queued again")
+        return item
+
+    def to_dict(self):
+        data = dict(self.extra)
+        data.update((name, getattr(self, name)) for name in self.FIELDS if getattr(self, name) is not None)
+        data['status'] = self.status.value
+        return data
+
+    def set_status(self, status):
+        """Move to `status`. A move STATUS_TRANSITIONS does not allow is logged but still made:
+        raising from the Qt slot making it would strand the item (and its slot) halfway through."""
+        if status != self.status and status not in STATUS_TRANSITIONS[self.status]:
+            logging.error(f"Illegal status change {self.status.value} -> {status.value}: {self.title}")
+        self.status = status
+
+    @property
+    def size(self):
+        """Exact size of the selected formats when known, else the extractor's estimate."""
+        return self.selected_size or self.filesize
+
+    @property
+    def filesize_str(self):
+        return format_file_size(self.size)
+
+    @property
+    def duration_str(self):
+        return format_duration(self.duration)
+
+    @property
+    def downloaded_size(self):
+        return format_file_size(self.downloaded_bytes)
+
+    def __getitem__(self, key):
+        if key in self.FIELDS or key in self.DISPLAY_FIELDS:
+            return getattr(self, key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        if key in self.FIELDS:
+            setattr(self, key, None)
+        else:
+            self.extra.pop(key, None)
+        return value
+
+    def update(self, **fields):
+        for key, value in fields.items():
+            self[key] = value
+
+# ---------------- Save Folder Index ----------------
+class SaveFolderIndex(QObject):
+    """In-memory listing of the output roots, built with one os.scandir pass per root.
+
+    A QFileSystemWatcher triggers a (debounced, background) rescan of a root whenever
+    it changes, so existence checks during imports never touch the disk. Paths keep
+    their root, so a lookup also tells which root a file landed on.
+    """
+    updated = Signal()
+    _scan_done = Signal(str, dict, dict)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.folders = []
+        self.listings = {}  # folder -> ({normcase(name): path}, {normcase(stem): [(part_path, size)]})
+        self.pending = set()  # folders whose first scan has not come back yet
+        self.dirty = set()
+        self.ready = False
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self._schedule_rescan)
+        self.rescan_timer = QTimer(self)
+        self.rescan_timer.setSingleShot(True)
+        self.rescan_timer.setInterval(500)
+        self.rescan_timer.timeout.connect(self._rescan_dirty)
+        self._scan_done.connect(self._apply_scan)
+
+    def set_folders(self, folders):
+        folders = [folder for folder in dict.fromkeys(folders) if folder]
+        if folders == self.folders:
+            return
+        if self.watcher.directories():
+            self.watcher.removePaths(self.watcher.directories())
+        self.folders = folders
+        self.listings = {}
+        self.pending = set(folders)
+        self.ready = False
+        existing = [folder for folder in folders if os.path.isdir(folder)]
+        if existing:
+            self.watcher.addPaths(existing)
+        for folder in folders:
+            self.rescan(folder)
+
+    def is_ready(self, folders):
+        return self.ready and [folder for folder in dict.fromkeys(folders) if folder] == self.folders
+
+    def rescan(self, folder):
+        threading.Thread(target=self._scan, args=(folder,), daemon=True).start()
+
+    def _rescan_dirty(self):
+        dirty, self.dirty = self.dirty, set()
+        for folder in dirty:
+            self.rescan(folder)
+
+    def _scan(self, folder):
+        started = time.perf_counter()
+        files, parts = {}, {}
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if not entry.is_file():
+                        continue
+                    name = entry.name
+                    files[os.path.normcase(name)] = entry.path
+                    if name.endswith('.part'):
+                        parts.setdefault(os.path.normcase(self._part_stem(name)), []).append(
+                            (entry.path, entry.stat().st_size))
+        except OSError as e:
+            # Nothing can be found there; an empty listing answers that as well as the disk would
+            logging.error(f"Error indexing output root {folder}: {e}")
+            files, parts = {}, {}
+        logging.info(f"Indexed {len(files)} files in {folder} in {(time.perf_counter() - started) * 1000:.0f} ms")
+        self._scan_done.emit(folder, files, parts)
+
+    def _apply_scan(self, folder, files, parts):
+        if folder not in self.folders:
+            return
+        self.listings[folder] = (files, parts)
+        self.pending.discard(folder)
+        self.ready = not self.pending
+        self.updated.emit()
+
+    def _schedule_rescan(self, path):
+        self.dirty.add(path)
+        self.rescan_timer.start()
+
+    @staticmethod
+    def _part_stem(name):
+        # "title.mp4.part" / "title.f137.mp4.part" -> "title"
+        stem = os.path.splitext(os.path.splitext(name)[0])[0]
+        if re.search(r'\.f[\w-]+$', stem):
+            stem = stem.rsplit('.', 1)[0]
+        return stem
+
+    def lookup(self, name):
+        """Path of `name` on the first root that has it, or None."""
+        key = os.path.normcase(name)
+        for folder in self.folders:
+            path = self.listings.get(folder, ({}, {}))[0].get(key)
+            if path:
+                return path
+        return None
+
+    def partials(self, stem):
+        key = os.path.normcase(stem)
+        return [part for folder in self.folders for part in self.listings.get(folder, ({}, {}))[1].get(key, [])]
+
+    def add(self, path):
+        """Record a file we know was just created, ahead of the watcher's rescan."""
+        if not path:
+            return
+        folder = next((folder for folder in self.listings
+                       if os.path.normpath(os.path.dirname(path)) == os.path.normpath(folder)), None)
+        if folder is not None:
+            self.listings[folder][0][os.path.normcase(os.path.basename(path))] = path
+
+# ---------------- Download Archive ----------------
+def archive_key(info):
+    """yt-dlp --download-archive entry ("<extractor> <id>") for an info dict or flat entry."""
+    extractor = info.get('extractor_key') or info.get('ie_key')
+    video_id = info.get('id')
+    if not extractor or not video_id:
+        return None
+    return f"{extractor.lower()} {video_id}"
+
+class BloomFilter:
+    HEADER = struct.Struct("<4sQIQ16s")  # magic, bit count, hash count, archive rowid covered, archive identity
+    MAGIC = b"YTB2"
+
+    def __init__(self, capacity, error_rate=ARCHIVE_BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.last_rowid = 0
+        self.identity = bytes(16)  # Which archive database last_rowid refers to
+
+    @staticmethod
+    def _hash_pair(key):
+        # Two independently seeded CRC32s for double hashing; stable across runs, unlike hash()
+        data = key.encode('utf-8')
+        return zlib.crc32(data), zlib.crc32(data, 0x9E3779B9) | 1
+
+    def add(self, key):
+        h1, h2 = self._hash_pair(key)
+        for i in range(self.hashes):
+            pos = (h1 + i * h2) % self.size
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        # Misses usually stop at the first or second probe
+        h1, h2 = self._hash_pair(key)
+        bits, size = self.bits, self.size
+        for i in range(self.hashes):
+            pos = (h1 + i * h2) % size
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.size, self.hashes, self.last_rowid, self.identity))
+            f.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            magic, size, hashes, last_rowid, identity = cls.HEADER.unpack(f.read(cls.HEADER.size))
+            if magic != cls.MAGIC:
+                raise ValueError("Invalid bloom filter file")
+            bloom = cls.__new__(cls)
+            bloom.size, bloom.hashes, bloom.last_rowid, bloom.identity = size, hashes, last_rowid, identity
+            bloom.capacity = int(size * (math.log(2) ** 2) / -math.log(ARCHIVE_BLOOM_ERROR_RATE))
+            bloom.bits = bytearray(f.read())
+        if len(bloom.bits) != (size + 7) // 8:
+            raise ValueError("Truncated bloom filter file")
+        return bloom
+
+class DownloadArchive:
+    """Persistent set of downloaded "<extractor> <id>" keys (yt-dlp archive format).
+
+    Keys live in SQLite; an in-memory Bloom filter answers most misses without
+    touching the database. The filter is saved on exit together with the last
+    rowid it covers, so startup only replays rows added since then. A random
+    identity stored in the database ties the two together: a recreated
+    database starts its rowids over, so its filter is rebuilt.
+    """
+
+    def __init__(self, db_path, bloom_path):
+        self.bloom_path = bloom_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS archive (key TEXT NOT NULL UNIQUE)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value BLOB NOT NULL)")
+        self.conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('identity', ?)", (uuid.uuid4().bytes,))
+        self.conn.commit()
+        self.identity = bytes(self.conn.execute("SELECT value FROM meta WHERE name = 'identity'").fetchone()[0])
+        self.bloom = None
+        self.closing = False
+
+    def load(self):
+        """Load or rebuild the Bloom filter; meant to run in a background thread."""
+        started = time.perf_counter()
+        with self.lock:
+            if self.closing:
+                return
+            count = self.conn.execute("SELECT count(*) FROM archive").fetchone()[0]
+        bloom = None
+        if os.path.exists(self.bloom_path):
+            try:
+                bloom = BloomFilter.load(self.bloom_path)
+                if count > bloom.capacity or bloom.identity != self.identity:
+                    bloom = None
+            except (OSError, ValueError, struct.error) as e:
+                logging.error(f"Discarding download archive bloom filter: {e}")
+                bloom = None
+        if bloom is None:
+            bloom = BloomFilter(max(ARCHIVE_BLOOM_MIN_CAPACITY, count * 2))
+            bloom.identity = self.identity
+        with self.lock:
+            if self.closing:
+                return
+            rows = self.conn.execute("SELECT rowid, key FROM archive WHERE rowid > ? ORDER BY rowid", (bloom.last_rowid,))
+            for rowid, key in rows:
+                if self.closing:
+                    return  # close() is waiting for the lock; the filter is rebuilt next start
+                bloom.add(key)
+                bloom.last_rowid = rowid
+            self.bloom = bloom
+        logging.info(f"Download archive ready: {count} entries in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def contains(self, key):
+        bloom = self.bloom
+        if bloom is not None and key not in bloom:
+            return False
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM archive WHERE key = ?", (key,)).fetchone() is not None
+
+    def add_many(self, keys):
+        added = 0
+        with self.lock:
+            for key in keys:
+                cursor = self.conn.execute("INSERT OR IGNORE INTO archive (key) VALUES (?)", (key,))
+                if cursor.rowcount and self.bloom is not None:
+                    self.bloom.add(key)
+                    self.bloom.last_rowid = max(self.bloom.last_rowid, cursor.lastrowid)
+                added += cursor.rowcount
+            self.conn.commit()
+        return added
+
+    def add(self, key):
+        return self.add_many([key])
+
+    def import_file(self, path, batch_size=10000):
+        """Merge a yt-dlp --download-archive text file, streaming it in batches."""
+        added = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            batch = []
+            for line in f:
+                key = line.strip()
+                if key:
+                    batch.append(key)
+                if len(batch) >= batch_size:
+                    added += self.add_many(batch)
+                    batch = []
+            added += self.add_many(batch)
+        return added
+
+    def export_file(self, path):
+        """Write all keys in yt-dlp --download-archive format."""
+        with self.lock, open(path, 'w', encoding='utf-8') as f:
+            for (key,) in self.conn.execute("SELECT key FROM archive ORDER BY rowid"):
+                f.write(key + "\n")
+
+    def close(self):
+        self.closing = True  # A load() in progress gives up the lock at its next row
+        with self.lock:
+            if self.bloom is not None:
+                try:
+                    self.bloom.save(self.bloom_path)
+                except OSError as e:
+                    logging.error(f"Error saving download archive bloom filter: {e}")
+            self.conn.close()
+
+# ---------------- Media Integrity ----------------
+def parse_duration(duration_str):
+    """Seconds from a format_duration() string ("1:02:03", "1 day, 0:00:05"), or None."""
+    match = re.fullmatch(r'(?:(\d+) days?, )?(\d+):(\d\d):(\d\d)', duration_str or "")
+    if not match:
+        return None
+    days, hours, minutes, seconds = (int(g or 0) for g in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+def get_ffprobe_path(ffmpeg_path):
+    """ffprobe next to ffmpeg (ffmpeg_bin or the same PATH entry), or None."""
+    name = "ffprobe.exe" if platform.system().lower() == "windows" else "ffprobe"
+    if ffmpeg_path:
+        sibling = os.path.join(os.path.dirname(ffmpeg_path), name)
+        if os.path.exists(sibling):
+            return sibling
+    return shutil.which(name)
+
+def hash_media_file(path, rate_limit, should_stop):
+    """SHA-256 of `path`, read sequentially at no more than rate_limit() bytes/s.
+
+    Returns None if should_stop() turns true first. Pages already hashed are dropped
+    from the page cache, so a large file does not evict the active downloads' data.
+    """
+    digest = hashlib.sha256()
+    fadvise = hasattr(os, 'posix_fadvise')
+    offset = 0
+    with open(path, 'rb') as f:
+        if fadvise:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        allowed_at = time.monotonic()
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            if should_stop():
+                return None
+            digest.update(chunk)
+            if fadvise:
+                os.posix_fadvise(f.fileno(), offset, len(chunk), os.POSIX_FADV_DONTNEED)
+            offset += len(chunk)
+            # No credit is carried over from slow reads, so the limit also holds for bursts
+            allowed_at += len(chunk) / rate_limit()
+            now = time.monotonic()
+            if allowed_at > now:
+                time.sleep(allowed_at - now)
+            else:
+                allowed_at = now
+    return digest.hexdigest()
+
+def probe_media_duration(ffprobe_path, path, processes=None):
+    """(readable, duration) per ffprobe; readable is False if the container cannot be parsed.
+
+    The running ffprobe is kept in `processes` (a set) meanwhile, so shutdown can terminate it.
+    """
+    processes = set() if processes is None else processes
+    try:
+        process = subprocess.Popen([ffprobe_path, "-v", "error", "-show_entries", "format=duration",
+                                    "-of", "default=noprint_wrappers=1:nokey=1", path],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, creationflags=CREATION_FLAGS)
+    except OSError as e:
+        logging.error(f"ffprobe failed for {path}: {e}")
+        return True, None  # Unknown, not evidence of damage
+    processes.add(process)
+    try:
+        stdout, _ = process.communicate(timeout=60)
+    except subprocess.TimeoutExpired as e:
+        process.kill()
+        process.communicate()
+        logging.error(f"ffprobe failed for {path}: {e}")
+        return True, None
+    finally:
+        processes.discard(process)
+    if process.returncode != 0:
+        return False, None
+    try:
+        return True, float(stdout.strip())
+    except ValueError:
+        return True, None
+
+def clone_file(src, dst):
+    """Create `dst` sharing `src`'s data: a copy-on-write reflink where the filesystem
+    supports it (Btrfs, XFS, ...), a hardlink otherwise. Returns the method used."""
+    if fcntl is not None and sys.platform.startswith('linux'):
+        try:
+            with open(src, 'rb') as s, open(dst, 'wb') as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            return "reflink"
+        except OSError:
+            if os.path.exists(dst):
+                os.remove(dst)
+    os.link(src, dst)
+    return "hardlink"
+
+def replace_with_clone(src, dst):
+    """Swap `dst` for a clone of `src` in one rename; `dst` is left as is if cloning fails."""
+    tmp_path = dst + ".dedupe.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        method = clone_file(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return method
+
+class MediaIndex:
+    """SHA-256 digests of completed files, keyed by path, with the output root each landed on.
+
+    A row is trusted while the file keeps the recorded size and mtime, so a routine
+    check only re-hashes files that changed; byte-identical files share (size, digest).
+    """
+
+    def __init__(self, db_path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS media (path TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+                          "mtime_ns INTEGER NOT NULL, digest TEXT NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS media_digest ON media (size, digest)")
+        if "root" not in {column[1] for column in self.conn.execute("PRAGMA table_info(media)")}:
+            self.conn.execute("ALTER TABLE media ADD COLUMN root TEXT")  # Indexes from before storage tiers
+        self.conn.commit()
+
+    def lookup(self, path):
+        """(size, mtime_ns, digest) recorded for `path`, or None."""
+        with self.lock:
+            return self.conn.execute("SELECT size, mtime_ns, digest FROM media WHERE path = ?", (path,)).fetchone()
+
+    def record(self, path, size, mtime_ns, digest, root=None):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO media (path, size, mtime_ns, digest, root) VALUES (?, ?, ?, ?, ?)",
+                              (path, size, mtime_ns, digest, root))
+            self.conn.commit()
+
+    def usage(self, root):
+        """Bytes recorded on `root`; rows from before roots were recorded count by path prefix."""
+        prefix = (root.rstrip(os.sep) + os.sep).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM media WHERE root = ? "
+                                     "OR (root IS NULL AND path LIKE ? ESCAPE '\\')", (root, prefix)).fetchone()[0]
+
+    def duplicates(self, size, digest, path):
+        """[(path, mtime_ns)] of other files recorded with the same contents."""
+        with self.lock:
+            return self.conn.execute("SELECT path, mtime_ns FROM media WHERE size = ? AND digest = ? AND path != ?",
+                                     (size, digest, path)).fetchall()
+
+    def forget(self, path):
+        with self.lock:
+            self.conn.execute("DELETE FROM media WHERE path = ?", (path,))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# ---------------- Proxy Pool ----------------
+def redact_proxy(proxy):
+    """Proxy URL with any user:password@ part masked, for logs and the stats view."""
+    parsed = urlparse(proxy)
+    if parsed.password is None:
+        return proxy
+    return proxy.replace(f"{parsed.username}:{parsed.password}@", f"{parsed.username}:***@", 1)
+
+class ProxyPool:
+    """Egress proxies scored by measured throughput and error rate.
+
+    Stats persist across runs; which downloads are active on a proxy does not. All calls
+    come from the GUI thread. `clock` is only there so the scoring can be driven by hand.
+    """
+
+    def __init__(self, proxies, capacity, stats_path=None, clock=time.time):
+        self.stats_path = stats_path
+        self.clock = clock
+        self.stats = load_json_file(stats_path, {}) if stats_path else {}
+        self.active = {}  # proxy -> downloads currently using it
+        self.configure(proxies, capacity)
+
+    def configure(self, proxies, capacity):
+        self.proxies = list(dict.fromkeys(p.strip() for p in proxies if p.strip()))
+        self.capacity = max(1, capacity)
+        for proxy in self.proxies:
+            self.stats.setdefault(proxy, {"speed": 0, "successes": 0, "failures": 0, "consecutive_failures": 0,
+                                          "strikes": 0, "quarantined_until": 0})
+
+    def quarantined(self, proxy):
+        return self.stats[proxy]['quarantined_until'] > self.clock()
+
+    def usable(self, proxy):
+        return proxy in self.proxies and not self.quarantined(proxy)
+
+    def score(self, proxy):
+        stats = self.stats[proxy]
+        # Untested proxies borrow the best measured speed so each one gets tried
+        speed = stats['speed'] or max((self.stats[p]['speed'] for p in self.proxies), default=0) or 1
+        return speed * (stats['successes'] + 1) / (stats['successes'] + stats['failures'] + 2)
+
+    def _candidates(self, spare_only):
+        return [p for p in self.proxies if not self.quarantined(p)
+                and (not spare_only or self.active.get(p, 0) < self.capacity)]
+
+    def has_capacity(self):
+        return bool(self._candidates(spare_only=True))
+
+    def best(self):
+        """Best-scoring usable proxy regardless of load (what an upcoming download will likely get)."""
+        candidates = self._candidates(spare_only=False)
+        return max(candidates, key=self.score) if candidates else None
+
+    def acquire(self, preferred=None):
+        """Claim a slot on `preferred` if it has one, else on the best-scoring proxy that does."""
+        candidates = self._candidates(spare_only=True)
+        if not candidates:
+            return None
+        if preferred in candidates:
+            proxy = preferred
+        else:
+            # Equal scores go to the less loaded proxy
+            proxy = max(candidates, key=lambda p: (self.score(p), -self.active.get(p, 0)))
+        self.active[proxy] = self.active.get(proxy, 0) + 1
+        return proxy
+
+    def sample(self, proxy, speed):
+        """Fold a download's reported bytes/s into the proxy's throughput estimate."""
+        if proxy not in self.stats or not speed:
+            return
+        stats = self.stats[proxy]
+        stats['speed'] = speed if not stats['speed'] else (
+            PROXY_SPEED_SMOOTHING * speed + (1 - PROXY_SPEED_SMOOTHING) * stats['speed'])
+
+    def record_failure(self, proxy):
+        """Count a failure against `proxy`; returns True if that put it in quarantine."""
+        if proxy not in self.stats:
+            return False
+        stats = self.stats[proxy]
+        stats['failures'] += 1
+        stats['consecutive_failures'] += 1
+        benched = stats['consecutive_failures'] >= PROXY_QUARANTINE_FAILURES
+        if benched:
+            seconds = min(PROXY_MAX_QUARANTINE, PROXY_QUARANTINE_SECONDS * 2 ** stats['strikes'])
+            stats['quarantined_until'] = self.clock() + seconds
+            stats['strikes'] += 1
+            # On probation once reinstated: one more failure benches it again
+            stats['consecutive_failures'] = PROXY_QUARANTINE_FAILURES - 1
+        self.save()
+        return benched
+
+    def release(self, proxy, ok):
+        """Free a slot; `ok` is True/False for outcomes the proxy is accountable for, None otherwise."""
+        if proxy in self.active:
+            self.active[proxy] -= 1
+            if self.active[proxy] <= 0:
+                del self.active[proxy]
+        if ok is True and proxy in self.stats:
+            stats = self.stats[proxy]
+            stats['successes'] += 1
+            stats['consecutive_failures'] = 0
+            stats['strikes'] = 0
+            self.save()
+        elif ok is False:
+            return self.record_failure(proxy)
+        return False
+
+    def reclaim(self, proxy):
+        """Take a slot on `proxy` back even past its capacity (a suspended download resuming on it)."""
+        self.active[proxy] = self.active.get(proxy, 0) + 1
+
+    def reinstate(self, proxy):
+        if proxy in self.stats:
+            self.stats[proxy].update(quarantined_until=0, consecutive_failures=0, strikes=0)
+            self.save()
+
+    def next_release(self):
+        """Earliest time a quarantined proxy comes back, or None."""
+        now = self.clock()
+        times = [self.stats[p]['quarantined_until'] for p in self.proxies if self.stats[p]['quarantined_until'] > now]
+        return min(times, default=None)
+
+    def save(self):
+        if self.stats_path:
+            save_json_file(self.stats_path, self.stats)
+
+# ---------------- Process Reaper ----------------
+def terminate_process(process, group=False, force=False):
+    """SIGTERM (or SIGKILL with `force`) a child, or its whole process group with `group`."""
+    try:
+        if group and SUPPORTS_SUSPEND:
+            os.killpg(process.pid, signal.SIGKILL if force else signal.SIGTERM)
+        elif force:
+            process.kill()
+        else:
+            process.terminate()
+    except OSError:
+        pass  # Already gone
+
+def shutdown_pool(pool, deadline):
+    """Cancel `pool`'s queued tasks and wait for its running ones until `deadline` (a time.monotonic() value).
+    Returns False if some are still running then."""
+    pool.shutdown(wait=False, cancel_futures=True)
+    threads = list(pool._threads)  # Executor.shutdown() has no timeout of its own
+    for thread in threads:
+        thread.join(max(0, deadline - time.monotonic()))
+    return not any(thread.is_alive() for thread in threads)
+
+class ProcessReaper:
+    """Watch signalled children from one background thread instead of blocking on each in turn.
+
+    Children still alive REAPER_GRACE_SECONDS after being handed over are killed.
+    The workers notice the exit themselves (their pipe closes) and report it to the UI.
+    """
+
+    def __init__(self, grace=REAPER_GRACE_SECONDS):
+        self.grace = grace
+        self.lock = threading.Lock()
+        self.pending = {}  # process -> (kill deadline, signal whole group)
+        self.wakeup = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def reap(self, process, group=False):
+        with self.lock:
+            if process not in self.pending:
+                self.pending[process] = (time.monotonic() + self.grace, group)
+        self.wakeup.set()
+
+    def kill_all(self):
+        with self.lock:
+            for process, (_, group) in self.pending.items():
+                terminate_process(process, group, force=True)
+
+    def _run(self):
+        while True:
+            self.wakeup.wait()
+            with self.lock:
+                now = time.monotonic()
+                for process, (deadline, group) in list(self.pending.items()):
+                    if process.poll() is not None:
+                        del self.pending[process]
+                    elif now >= deadline:
+                        logging.warning(f"Process {process.pid} did not exit after SIGTERM, killing it")
+                        terminate_process(process, group, force=True)
+                        self.pending[process] = (now + self.grace, group)
+                if not self.pending:
+                    self.wakeup.clear()
+            time.sleep(0.1)
+
+# ---------------- Workers ----------------
+class DownloadJob(QObject):
+    """One download driven from the GUI event loop.
+
+    Its yt-dlp children are QProcesses whose output is parsed as it arrives, so any number of
+    downloads run without a thread (and a blocked readline) each. start() returns at once like
+    QThread.start(); everything else is a reaction to process output or exit.
+    """
     download_progress = Signal(dict)
     postprocess_progress = Signal(dict)
     download_finished = Signal(dict)
     download_error = Signal(str, str)
     download_cancelled = Signal(str)
     download_step = Signal(str, str)
+    download_stalled = Signal(str, int)  # id, restart number
     log_line = Signal(str)
 
     def __init__(self, id, url, ydl_opts, yt_dlp_path, ffmpeg_path, parent=None):
@@ -398,38 +1954,223 @@ class DownloaderThread(QThread):
         self.ffmpeg_path = ffmpeg_path
         self.is_cancelled = False
         self.is_paused = False
-        self.lock = threading.Lock()
+        self.is_suspended = False
+        self.is_stalled = False
+        self.stall_restarts = 0
+        self.rate_limit = ydl_opts.get('rate_limit')  # bytes/s for --limit-rate, None = unlimited
+        self.applied_rate_limit = None  # what the running process was started with
+        self.rate_changed = False
+        self.last_progress = None  # monotonic time of the last byte progress; None while not transferring
         self.process = None
+        self.pid = None
+        self.output = b""  # received text after the last complete line
         self.filename = None
+        self.info_dict = None
+        self.cmd = None
+        self.source = None
+        self.postprocess_steps = []
+        self.final_path = None
+        self.last_error = None
+        self.done = False  # the final signal (finished/error/cancelled) was sent
+        # Children still alive REAPER_GRACE_SECONDS after SIGTERM are killed
+        self.kill_timer = QTimer(self)
+        self.kill_timer.setSingleShot(True)
+        self.kill_timer.timeout.connect(self.terminate)
+
+    def start(self):
+        QTimer.singleShot(0, self._begin)
+
+    def isRunning(self):
+        return not self.done
+
+    def wait(self, msecs=-1):
+        """Block until the child has exited (shutdown only); True if it has."""
+        if self.process is not None and self.process.state() != QProcess.NotRunning:
+            return self.process.waitForFinished(msecs)
+        return True
 
-    def run(self):
-        with self.lock:
-            if self.is_cancelled or self.is_paused:
-                self.download_cancelled.emit(self.id)
-                return
+    def terminate(self):
+        """Kill the child outright (shutdown only)."""
+        self._signal(force=True)
 
-        self.download_step.emit(self.id, "استخراج اطلاعات...")
+    def suspend(self):
+        """Freeze the yt-dlp process tree in place. Returns False if not possible."""
+        if not SUPPORTS_SUSPEND or not self._child_running():
+            return False
+        try:
+            os.killpg(self.pid, signal.SIGSTOP)
+        except OSError as e:
+            logging.error(f"Error suspending download {self.id}: {e}")
+            return False
+        self.is_suspended = True
+        return True
 
-        # Extract info using yt-dlp -J
+    def resume(self):
+        if not self.is_suspended:
+            return False
+        self.is_suspended = False
+        if self.last_progress is not None:
+            self.last_progress = time.monotonic()  # Time spent frozen is not a stall
         try:
-            cmd_extract = [self.yt_dlp_path, "-j", self.url]
-            result = subprocess.run(cmd_extract, capture_output=True, text=True, check=True, creationflags=CREATION_FLAGS)
-            info_dict = json.loads(result.stdout.strip())
-            self.log_line.emit(f"Extracted info for {info_dict.get('title', 'Unknown')}")
-        except subprocess.CalledProcessError as e:
-            self.download_error.emit(f"خطا در استخراج اطلاعات: {e.stderr}", self.id)
+            os.killpg(self.pid, signal.SIGCONT)
+        except OSError as e:
+            logging.error(f"Error resuming download {self.id}: {e}")
+            return False
+        return True
+
+    def restart_stalled(self):
+        """Kill a transfer that stopped making progress; it is started again with --continue.
+        Returns False if there was nothing to restart."""
+        if self.is_suspended or not self._child_running():
+            return False
+        self.is_stalled = True
+        self.last_progress = None
+        self._terminate()
+        return True
+
+    def set_rate_limit(self, rate):
+        """Change the bandwidth share; a transferring process is restarted with --continue to apply it."""
+        self.rate_limit = rate
+        # Suspended downloads pick it up when resumed; ffmpeg work (last_progress None) is left alone
+        if (rate == self.applied_rate_limit or self.is_suspended or self.last_progress is None
+                or not self._child_running()):
             return
-        except Exception as e:
-            self.download_error.emit(f"خطای غیرمنتظره در استخراج: {e}", self.id)
+        self.rate_changed = True
+        self.last_progress = None
+        self._terminate()
+
+    def stop_process(self):
+        """Terminate the child now; the job reports the end once it has exited."""
+        if not self._child_running():
             return
+        self._terminate()
+        if self.is_suspended:
+            # A stopped process only acts on SIGTERM once continued
+            try:
+                os.killpg(self.pid, signal.SIGCONT)
+            except OSError:
+                pass
+            self.is_suspended = False
 
-        with self.lock:
-            if self.is_cancelled or self.is_paused:
-                self.download_cancelled.emit(self.id)
-                return
+    def _child_running(self):
+        # pid 0 would make killpg() signal our own process group
+        return bool(self.pid) and self.process is not None and self.process.state() != QProcess.NotRunning
+
+    def _terminate(self):
+        self._signal()
+        self.kill_timer.start(REAPER_GRACE_SECONDS * 1000)
+
+    def _signal(self, force=False):
+        """SIGTERM (SIGKILL with `force`) the child's process group."""
+        if not self._child_running():
+            return
+        if force:
+            logging.warning(f"Process {self.pid} did not exit after SIGTERM, killing it")
+        if SUPPORTS_SUSPEND:
+            try:
+                os.killpg(self.pid, signal.SIGKILL if force else signal.SIGTERM)
+            except OSError:
+                pass  # Already gone
+        else:
+            self.process.kill()  # QProcess.terminate() only posts WM_CLOSE, which console children ignore
+
+    def _launch(self, args, phase):
+        # QProcess opens no console window on Windows for a GUI parent. Slots find their process
+        # with sender(): closures over it would tie the QProcess into a reference cycle
+        process = QProcess(self)
+        if phase == 'download':
+            process.setProcessChannelMode(QProcess.MergedChannels)
+            process.readyReadStandardOutput.connect(self._on_output)
+        if SUPPORTS_SUSPEND:
+            # Own session/process group so ffmpeg children are suspended and killed along with yt-dlp (Qt 6.7+)
+            process.setUnixProcessParameters(QProcess.UnixProcessFlag.CreateNewSession)
+        process.finished.connect(self._on_extracted if phase == 'extract' else self._on_download_exited)
+        process.errorOccurred.connect(self._on_process_error)
+        if self.process is not None:
+            self.process.deleteLater()  # The previous attempt's, which has exited
+        self.process = process
+        self.output = b""
+        self.kill_timer.stop()
+        process.start(args[0], args[1:])
+        self.pid = process.processId()
+
+    def _on_process_error(self, error):
+        # Other errors are followed by finished(); a child that never started is not
+        if error == QProcess.FailedToStart and self.sender() is self.process:
+            self._finish(self.download_error, f"خطای غیرمنتظره در اجرای yt-dlp: {self.process.errorString()}", self.id)
+
+    def _finish(self, signal_, *args):
+        self.done = True
+        self.kill_timer.stop()
+        # A pre-resolved info file is used by one attempt only; retries extract afresh
+        info_json = self.ydl_opts.get('info_json')
+        if info_json and os.path.exists(info_json):
+            os.remove(info_json)
+        signal_.emit(*args)
+
+    def _begin(self):
+        if self.is_cancelled or self.is_paused:
+            self._finish(self.download_cancelled, self.id)
+            return
+        # Items pre-resolved by the lookahead stage skip extraction
+        info_dict = self._load_prepared_info()
+        if info_dict is not None:
+            self._start_download(info_dict)
+            return
+        self.download_step.emit(self.id, "استخراج اطلاعات...")
+        # yt-dlp -j runs as the job's process too, so stop_process() can interrupt it. It goes through the
+        # assigned proxy: the info request is where bot and rate-limit checks happen, and its errors count against it
+        proxy_args = ["--proxy", self.ydl_opts['proxy']] if self.ydl_opts.get('proxy') else []
+        self._launch([self.yt_dlp_path, "-j", "-f", str(self.ydl_opts['format'])] + proxy_args + [self.url], 'extract')
+
+    def _load_prepared_info(self):
+        info_json = self.ydl_opts.get('info_json')
+        if not info_json:
+            return None
+        try:
+            with open(info_json, 'r', encoding='utf-8') as f:
+                info_dict = json.load(f)
+        except (OSError, ValueError) as e:
+            self.log_line.emit(f"Ignoring pre-resolved info {info_json}: {e}")
+            self.ydl_opts.pop('info_json')
+            return None
+        self.log_line.emit(f"Using pre-resolved info for {info_dict.get('title', 'Unknown')}")
+        return info_dict
+
+    def _on_extracted(self, exit_code, exit_status):
+        process = self.sender()
+        if process is not self.process:
+            return
+        if self.is_cancelled or self.is_paused:
+            self._finish(self.download_cancelled, self.id)
+            return
+        stdout = bytes(process.readAllStandardOutput()).decode('utf-8', 'replace')
+        if exit_status != QProcess.NormalExit or exit_code != 0:
+            stderr = bytes(process.readAllStandardError()).decode('utf-8', 'replace')
+            self._finish(self.download_error, f"خطا در استخراج اطلاعات: {stderr}", self.id)
+            return
+        try:
+            info_dict = json.loads(stdout.strip())
+        except ValueError as e:
+            self._finish(self.download_error, f"خطای غیرمنتظره در استخراج: {e}", self.id)
+            return
+        self.log_line.emit(f"Extracted info for {info_dict.get('title', 'Unknown')}")
+        self._start_download(info_dict)
 
+    def _start_download(self, info_dict):
+        if self.is_cancelled or self.is_paused:
+            self._finish(self.download_cancelled, self.id)
+            return
+        self.info_dict = info_dict
         self.download_step.emit(self.id, "شروع دانلود...")
+        try:
+            self._build_command(info_dict)
+        except Exception as e:
+            self._finish(self.download_error, f"خطا در فرآیند دانلود: {e}", self.id)
+            return
+        self._launch_download()
 
+    def _build_command(self, info_dict):
         # Build CLI args
         cli_args = [
             "--output", self.ydl_opts['outtmpl']['default'],
@@ -442,13 +2183,33 @@ class DownloaderThread(QThread):
             cli_args += ["--ffmpeg-location", self.ffmpeg_path]
         if self.ydl_opts.get('proxy'):
             cli_args += ["--proxy", self.ydl_opts['proxy']]
-        # Postprocessors
-        if self.ydl_opts.get('format') == 'bestaudio/best':
-            cli_args += ["--extract-audio", "--audio-format", "mp3"]
-        else:
-            pp = self.ydl_opts['postprocessors'][0]
-            if pp['key'] == 'FFmpegVideoConvertor':
-                cli_args += ["--recode-video", pp['preferedformat']]
+        # Report the real output path once yt-dlp has moved the file into place
+        cli_args += ["--no-quiet", "--print", f"after_move:{FINAL_PATH_MARKER}%(filepath)s"]
+        # Stream-copy merges/remuxes stay here; CPU-bound ffmpeg work is handed to the post-processing stage
+        postprocess_steps = []
+        vcodec, acodec = selected_stream_codecs(info_dict)
+        pp = self.ydl_opts['postprocessors'][0]
+        output_stem = self.ydl_opts.get('output_stem')
+        if self.ydl_opts.get('outputs'):
+            # Multi-output: the streams are fetched once into the cache as they are (mkv takes any
+            # codecs, so merging is a copy) and every output is derived from them locally
+            if info_dict.get('requested_formats'):
+                cli_args += ["--merge-output-format", "mkv"]
+            for target in self.ydl_opts['outputs']:
+                postprocess_steps.append(output_variant_step(target, vcodec, acodec, output_stem))
+            self.log_line.emit(f"Deriving {', '.join(self.ydl_opts['outputs'])} from one download of {vcodec}/{acodec}")
+        elif pp['key'] == 'FFmpegExtractAudio':
+            postprocess_steps.append(dict(pp, source_codec=acodec))
+        elif pp['key'] in ('FFmpegVideoRemuxer', 'FFmpegVideoConvertor'):
+            target = pp['preferedformat']
+            if pp['key'] == 'FFmpegVideoRemuxer' and codecs_fit_container(target, vcodec, acodec):
+                if info_dict.get('requested_formats'):
+                    cli_args += ["--merge-output-format", target]
+                cli_args += ["--remux-video", target]
+                self.log_line.emit(f"Remuxing {vcodec}/{acodec} into {target} (no re-encode)")
+            else:
+                postprocess_steps.append({'key': 'FFmpegVideoConvertor', 'preferedformat': target})
+                self.log_line.emit(f"Recoding {vcodec}/{acodec} to {target}: codecs not supported by container")
         # Subtitles
         if self.ydl_opts.get('writesubtitles', False):
             cli_args += ["--write-subs", "--write-auto-sub"]
@@ -456,48 +2217,93 @@ class DownloaderThread(QThread):
                 cli_args += ["--sub-langs", ",".join(self.ydl_opts['subtitleslangs'])]
             pp_sub = next((p for p in self.ydl_opts.get('postprocessors', []) if p['key'] == 'FFmpegSubtitlesConvertor'), None)
             if pp_sub:
-                cli_args += ["--convert-subs", pp_sub['format']]
+                postprocess_steps.append(dict(pp_sub, output_stem=output_stem) if self.ydl_opts.get('outputs') else pp_sub)
+        self.postprocess_steps = postprocess_steps
 
-        cmd = [self.yt_dlp_path] + cli_args + [self.url]
+        # --load-info-json skips yt-dlp's own extraction, so bytes start moving right away
+        self.source = ["--load-info-json", self.ydl_opts['info_json']] if self.ydl_opts.get('info_json') else [self.url]
+        self.cmd = [self.yt_dlp_path] + cli_args
 
-        self.process = subprocess.Popen(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-            text=True, bufsize=1, universal_newlines=True, creationflags=CREATION_FLAGS
-        )
-
-        try:
-            for line in iter(self.process.stdout.readline, ''):
-                line = line.strip()
-                if not line:
-                    continue
-                self.log_line.emit(line)
-                with self.lock:
-                    if self.is_cancelled or self.is_paused:
-                        self.process.terminate()
-                        self.process.wait()
-                        self.download_cancelled.emit(self.id)
-                        return
+    def _launch_download(self):
+        if self.is_cancelled or self.is_paused:
+            self._finish(self.download_cancelled, self.id)
+            return
+        self.applied_rate_limit = self.rate_limit
+        rate_args = ["--limit-rate", str(self.rate_limit)] if self.rate_limit else []
+        self.last_error = None
+        self._launch(self.cmd + rate_args + self.source, 'download')
+        self.last_progress = time.monotonic()
+
+    def _on_output(self, flush=False):
+        """Parse the complete lines received so far; only the newest progress line of a read is reported."""
+        # yt-dlp redraws its progress line with \r
+        lines = re.split(rb'\r\n|\r|\n', self.output + bytes(self.process.readAllStandardOutput()))
+        self.output = b"" if flush else lines.pop()
+        progress = None
+        for raw in lines:
+            line = raw.decode('utf-8', 'replace').strip()
+            if not line:
+                continue
+            if line.startswith("ERROR:"):
+                self.last_error = line
+            if line.startswith(FINAL_PATH_MARKER):
+                self.final_path = line[len(FINAL_PATH_MARKER):]
+                continue
+            self.log_line.emit(line)
+
+            if '[download]' in line:
+                d = self.parse_progress_line(line)
+                if d:
+                    # yt-dlp only redraws the line when bytes arrived; the 0.1% it shows can take minutes on big files
+                    if not self.is_stalled:
+                        self.last_progress = time.monotonic()
+                    progress = d
+
+            if '[Merger]' in line or '[Video Remuxing]' in line or '[FFmpeg]' in line:
+                self.last_progress = None  # ffmpeg output is silent, not stalled
+                self.postprocess_progress.emit({'id': self.id, 'status': 'postprocess', 'filename': self.filename or 'Unknown'})
+        if progress:
+            self.download_progress.emit(progress)
+
+    def _on_download_exited(self, exit_code, exit_status):
+        if self.sender() is not self.process:
+            return
+        self._on_output(flush=True)
+        self.kill_timer.stop()
+        if self.is_cancelled or self.is_paused:
+            # Terminated from outside via stop_process()
+            self._finish(self.download_cancelled, self.id)
+            return
+        if self.rate_changed and not self.is_stalled:
+            # Restarted for a new bandwidth share; not a stall
+            self.rate_changed = False
+            self._launch_download()
+            return
+        if self.is_stalled:
+            self.is_stalled = False
+            self.rate_changed = False
+            if self.stall_restarts >= STALL_MAX_RESTARTS:
+                self._finish(self.download_error, f"دانلود پس از {STALL_MAX_RESTARTS} بار شروع مجدد همچنان متوقف ماند.", self.id)
+                return
+            # cmd already carries --continue, so the partial file is picked up where it stopped
+            self.stall_restarts += 1
+            self.download_stalled.emit(self.id, self.stall_restarts)
+            self._launch_download()
+            return
 
-                if '[download]' in line:
-                    d = self.parse_progress_line(line)
-                    if d:
-                        self.download_progress.emit(d)
-
-                if '[Merger]' in line or '[Video Remuxing]' in line or '[FFmpeg]' in line:
-                    self.postprocess_progress.emit({'id': self.id, 'status': 'postprocess', 'filename': self.filename or 'Unknown'})
-
-            self.process.wait()
-            if self.process.returncode == 0:
-                info_dict['id'] = self.id
-                # Guess filepath from outtmpl
-                safe_title = re.sub(r'[^\w\s-]', '', info_dict.get('title', 'Unknown')).strip()
-                ext = 'mp3' if self.ydl_opts.get('format') == 'bestaudio/best' else self.ydl_opts['postprocessors'][0]['preferedformat'] if self.ydl_opts.get('postprocessors') else 'mp4'
-                info_dict['filepath'] = os.path.join(self.ydl_opts['outtmpl']['default'].rsplit('.', 1)[0], f"{safe_title}.{ext}")
-                self.download_finished.emit(info_dict)
+        if exit_status == QProcess.NormalExit and exit_code == 0:
+            info_dict = self.info_dict
+            info_dict['id'] = self.id
+            if self.final_path:
+                info_dict['filepath'] = self.final_path
             else:
-                self.download_error.emit("خطا در دانلود (return code != 0)", self.id)
-        except Exception as e:
-            self.download_error.emit(f"خطا در فرآیند دانلود: {e}", self.id)
+                # Older yt-dlp without --print after_move: derive it from outtmpl
+                outtmpl = self.ydl_opts['outtmpl']['default']
+                info_dict['filepath'] = outtmpl.replace('%(ext)s', info_dict.get('ext', 'mp4'))
+            info_dict['postprocess_steps'] = self.postprocess_steps
+            self._finish(self.download_finished, info_dict)
+        else:
+            self._finish(self.download_error, f"خطا در دانلود: {self.last_error}" if self.last_error else "خطا در دانلود (return code != 0)", self.id)
 
     def parse_progress_line(self, line):
         d = {'id': self.id, 'status': 'downloading'}
@@ -505,10 +2311,11 @@ class DownloaderThread(QThread):
         percent_match = re.search(r'\[download\]\s+([\d.]+)%', line)
         if percent_match:
             d['_percent_str'] = percent_match.group(1) + '%'
-        # Downloaded size
-        size_match = re.search(r'of\s+([\d.]+[KMG]i?B)', line)
-        if size_match:
-            d['downloaded_bytes'] = size_match.group(1)
+        # Downloaded size, from the percentage of the (possibly estimated, "~") total
+        size_match = re.search(r'of\s+~?\s*([\d.]+[KMG]i?B)', line)
+        total = parse_file_size(size_match.group(1)) if size_match else None
+        if total is not None and percent_match:
+            d['downloaded_bytes'] = round(total * float(percent_match.group(1)) / 100)
         # Speed
         speed_match = re.search(r'at\s+([\d.]+[KMG]i?B/s)', line)
         if speed_match:
@@ -534,11 +2341,144 @@ class DownloaderThread(QThread):
             self.filename = dest_match.group(1).strip()
         return d if '_percent_str' in d else None
 
+class PostProcessThread(QThread):
+    postprocess_progress = Signal(dict)
+    encode_progress = Signal(dict)  # id, index, total, percent, speed, eta of the running ffmpeg
+    encode_stats = Signal(str, float, float)  # output format, CPU seconds, media seconds
+    postprocess_finished = Signal(str, list)  # id, output paths (primary first)
+    postprocess_error = Signal(str, str)
+    postprocess_cancelled = Signal(str)
+    log_line = Signal(str)
+
+    def __init__(self, id, filepath, steps, ffmpeg_path, duration=None, parent=None):
+        super().__init__(parent)
+        self.id = id
+        self.filepath = filepath
+        self.steps = steps
+        self.ffmpeg_path = ffmpeg_path
+        self.duration = duration  # Seconds of media, for percent/ETA; None if unknown
+        self.step_index = 0
+        self.is_cancelled = False
+        self.lock = threading.Lock()
+        self.process = None
+
+    def cancel(self):
+        """Returns the signalled ffmpeg process (None if there was none) for a ProcessReaper to watch."""
+        with self.lock:
+            self.is_cancelled = True
+            if self.process and self.process.poll() is None:
+                self.process.terminate()
+                return self.process
+            return None
+
+    def terminate(self):
+        """Kill ffmpeg outright (shutdown only). Unlike QThread.terminate(), the thread itself is left
+        to return from run(): killing it in the middle of Python code can leave the GIL held."""
+        with self.lock:
+            self.is_cancelled = True
+            if self.process and self.process.poll() is None:
+                terminate_process(self.process, force=True)
+
+    def run(self):
+        # Steps transform the file in a chain; steps with an 'output_stem' instead each derive
+        # one output from the untouched source, which is removed once all of them succeeded
+        path = self.filepath
+        outputs = []
+        try:
+            for index, step in enumerate(self.steps):
+                self.step_index = index
+                self.postprocess_progress.emit({'id': self.id, 'status': 'postprocess', 'step': step['key'],
+                                                'index': index, 'total': len(self.steps), 'filename': path})
+                derive = 'output_stem' in step
+                if step['key'] == 'FFmpegSubtitlesConvertor':
+                    source_stem = os.path.splitext(path)[0]
+                    for sub_path in find_subtitle_files(path):
+                        sub_stem = os.path.splitext(sub_path)[0]
+                        if derive:
+                            sub_stem = step['output_stem'] + sub_stem[len(source_stem):]
+                        if not self._run_ffmpeg([self.ffmpeg_path, "-y", "-hide_banner", "-loglevel", "error", "-i", sub_path,
+                                                 sub_stem + "." + step['format']]):
+                            return
+                        os.remove(sub_path)
+                    continue
+
+                cmd, dst_path = build_postprocess_command(self.ffmpeg_path, path, step)
+                if cmd is None:
+                    continue
+                if not self._run_ffmpeg(cmd):
+                    return
+                out_path = cmd[-1]
+                if derive:
+                    outputs.append(dst_path)
+                    continue
+                if out_path != dst_path:
+                    os.replace(out_path, dst_path)
+                elif dst_path != path:
+                    os.remove(path)
+                path = dst_path
+            if outputs:
+                os.remove(path)
+            self.postprocess_finished.emit(self.id, outputs or [path])
+        except Exception as e:
+            self.postprocess_error.emit(f"خطا در پردازش پس از دانلود: {e}", self.id)
+
+    def _run_ffmpeg(self, cmd):
+        # -progress writes key=value blocks to stdout, each closed by a progress= line
+        cmd = cmd[:1] + ["-progress", "pipe:1", "-nostats"] + cmd[1:]
+        with self.lock:
+            if self.is_cancelled:
+                self.postprocess_cancelled.emit(self.id)
+                return False
+            self.log_line.emit(f"[PostProcess] {' '.join(cmd)}")
+            process = self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                                      text=True, creationflags=CREATION_FLAGS)
+        errors = []
+        reader = threading.Thread(target=lambda: errors.append(process.stderr.read()), daemon=True)
+        reader.start()
+        fields, progress = {}, {}
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            fields[key] = value
+            if key == 'progress':
+                progress = ffmpeg_progress(fields, self.duration)
+                self.encode_progress.emit(dict(progress, id=self.id, index=self.step_index, total=len(self.steps)))
+                fields = {}
+        cpu_seconds = self._reap(process)
+        reader.join()
+        stderr = errors[0] if errors else ""
+        if cpu_seconds is not None and process.returncode == 0:
+            output_format = os.path.splitext(cmd[-1])[1].lstrip('.').lower()
+            self.encode_stats.emit(output_format, cpu_seconds, progress.get('out_time') or 0.0)
+        if self.is_cancelled:
+            if os.path.exists(cmd[-1]):
+                os.remove(cmd[-1])
+            self.postprocess_cancelled.emit(self.id)
+            return False
+        if self.process.returncode != 0:
+            self.postprocess_error.emit(f"خطا در ffmpeg: {stderr.strip()[-500:]}", self.id)
+            return False
+        return True
+
+    @staticmethod
+    def _reap(process):
+        """Wait for `process`; returns the CPU seconds it used, or None where that is not measurable."""
+        if not hasattr(os, 'wait4'):
+            process.wait()
+            return None
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+        except ChildProcessError:
+            # Already reaped by a cancel()/reaper poll
+            process.wait()
+            return None
+        process.returncode = os.waitstatus_to_exitcode(status)
+        return usage.ru_utime + usage.ru_stime
+
 class SettingsDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("تنظیمات")
-        self.setFixedSize(400, 380)
+        self.setFixedSize(400, 780)
         self.parent_app = parent
 
         main_layout = QFormLayout()
@@ -552,6 +2492,25 @@ class SettingsDialog(QDialog):
         folder_layout.addWidget(folder_button)
         main_layout.addRow("پوشه ذخیره:", folder_layout)
 
+        self.scratch_label = QLineEdit(self.parent_app.settings.get("scratch_folder", ""))
+        self.scratch_label.setPlaceholderText("غیرفعال")
+        self.scratch_label.setToolTip("پوشه‌ای روی دیسک سریع (SSD محلی یا tmpfs) برای دانلود و پردازش؛ "
+                                      "فایل‌های نهایی سپس در پس‌زمینه به پوشه ذخیره منتقل می‌شوند.")
+        scratch_button = QPushButton("انتخاب پوشه")
+        scratch_button.clicked.connect(self.select_scratch_folder)
+        scratch_layout = QHBoxLayout()
+        scratch_layout.addWidget(self.scratch_label)
+        scratch_layout.addWidget(scratch_button)
+        main_layout.addRow("پوشه موقت سریع:", scratch_layout)
+
+        self.disk_headroom_spin = QSpinBox()
+        self.disk_headroom_spin.setRange(0, 100 * 1024)
+        self.disk_headroom_spin.setSingleStep(256)
+        self.disk_headroom_spin.setSuffix(" MB")
+        self.disk_headroom_spin.setToolTip("دانلود تنها زمانی شروع می‌شود که پس از کسر حجم تخمینی آن، این مقدار فضای آزاد باقی بماند.")
+        self.disk_headroom_spin.setValue(self.parent_app.settings.get("disk_headroom_mb", 512))
+        main_layout.addRow("حداقل فضای آزاد:", self.disk_headroom_spin)
+
         self.format_combo = QComboBox()
         self.format_combo.addItems(FORMAT_OPTIONS)
         self.format_combo.setCurrentText(self.parent_app.settings.get("format", "ویدیو و صدا"))
@@ -562,14 +2521,53 @@ class SettingsDialog(QDialog):
         self.video_format_combo.setCurrentText(self.parent_app.settings.get("video_format", "mp4"))
         main_layout.addRow("فرمت خروجی ویدیو:", self.video_format_combo)
 
+        self.audio_format_combo = QComboBox()
+        self.audio_format_combo.addItems(AUDIO_FORMAT_OPTIONS)
+        self.audio_format_combo.setCurrentText(self.parent_app.settings.get("audio_format", "mp3"))
+        self.audio_format_combo.setToolTip("m4a و opus بدون تبدیل مجدد (کپی مستقیم صدا) ذخیره می‌شوند.")
+        main_layout.addRow("فرمت خروجی صدا:", self.audio_format_combo)
+
         self.concurrency_spin = QSpinBox()
-        self.concurrency_spin.setRange(1, 10)
+        self.concurrency_spin.setRange(1, MAX_CONCURRENT_DOWNLOADS)
         self.concurrency_spin.setValue(self.parent_app.settings.get("concurrency", 3))
         main_layout.addRow("حداکثر دانلود همزمان:", self.concurrency_spin)
+
+        self.pause_suspend_spin = QSpinBox()
+        self.pause_suspend_spin.setRange(0, 120)
+        self.pause_suspend_spin.setSuffix(" دقیقه")
+        self.pause_suspend_spin.setToolTip("مکث کوتاه فرآیند را معلق می‌کند؛ پس از این مدت فرآیند بسته می‌شود. صفر = همیشه بستن.")
+        self.pause_suspend_spin.setValue(self.parent_app.settings.get("pause_suspend_minutes", 5))
+        self.pause_suspend_spin.setEnabled(SUPPORTS_SUSPEND)
+        main_layout.addRow("مهلت مکث سریع:", self.pause_suspend_spin)
+
+        self.stall_timeout_spin = QSpinBox()
+        self.stall_timeout_spin.setRange(0, 3600)
+        self.stall_timeout_spin.setSuffix(" ثانیه")
+        self.stall_timeout_spin.setToolTip("اگر در این مدت هیچ داده‌ای دریافت نشود، دانلود با ادامه فایل ناقص از نو شروع می‌شود. صفر = غیرفعال.")
+        self.stall_timeout_spin.setValue(self.parent_app.settings.get("stall_timeout_seconds", 60))
+        main_layout.addRow("مهلت توقف اتصال:", self.stall_timeout_spin)
+
+        self.subscription_hours_spin = QSpinBox()
+        self.subscription_hours_spin.setRange(1, 168)
+        self.subscription_hours_spin.setSuffix(" ساعت")
+        self.subscription_hours_spin.setValue(self.parent_app.settings.get("subscription_sync_hours", 24))
+        main_layout.addRow("فاصله همگام‌سازی اشتراک‌ها:", self.subscription_hours_spin)
         
         self.proxy_input = QLineEdit(self.parent_app.settings.get("proxy", ""))
         self.proxy_input.setPlaceholderText("http://proxy.example.com:8080")
         main_layout.addRow("پروکسی:", self.proxy_input)
+
+        self.proxy_pool_input = QTextEdit()
+        self.proxy_pool_input.setAcceptRichText(False)
+        self.proxy_pool_input.setFixedHeight(60)
+        self.proxy_pool_input.setPlaceholderText("یک پروکسی در هر خط؛ در صورت پر بودن، به جای پروکسی بالا استفاده می‌شود")
+        self.proxy_pool_input.setPlainText("\n".join(self.parent_app.settings.get("proxy_pool", [])))
+        main_layout.addRow("مجموعه پروکسی‌ها:", self.proxy_pool_input)
+
+        self.proxy_capacity_spin = QSpinBox()
+        self.proxy_capacity_spin.setRange(1, 10)
+        self.proxy_capacity_spin.setValue(self.parent_app.settings.get("proxy_max_active", PROXY_MAX_ACTIVE))
+        main_layout.addRow("دانلود هم‌زمان هر پروکسی:", self.proxy_capacity_spin)
         
         self.subtitle_lang_combo = QComboBox()
         self.subtitle_lang_combo.addItems(SUBTITLE_LANGS)
@@ -584,6 +2582,22 @@ class SettingsDialog(QDialog):
         self.delete_partial_on_cancel.setChecked(self.parent_app.settings.get("delete_partial_on_cancel", False))
         main_layout.addRow(self.delete_partial_on_cancel)
 
+        self.use_download_archive = QCheckBox("رد کردن ویدیوهای موجود در آرشیو دانلود")
+        self.use_download_archive.setChecked(self.parent_app.settings.get("use_download_archive", True))
+        main_layout.addRow(self.use_download_archive)
+
+        self.lazy_import_metadata = QCheckBox("وارد کردن سریع لیست (دریافت اطلاعات در پس‌زمینه)")
+        self.lazy_import_metadata.setChecked(self.parent_app.settings.get("lazy_import_metadata", True))
+        main_layout.addRow(self.lazy_import_metadata)
+
+        self.fetch_format_inventory = QCheckBox("دریافت فهرست فرمت‌ها برای نمایش حجم دقیق و کیفیت‌های موجود")
+        self.fetch_format_inventory.setChecked(self.parent_app.settings.get("fetch_format_inventory", True))
+        main_layout.addRow(self.fetch_format_inventory)
+
+        self.dedupe_completed = QCheckBox("جایگزینی فایل‌های تکراری با لینک (hardlink/reflink)")
+        self.dedupe_completed.setChecked(self.parent_app.settings.get("dedupe_completed", True))
+        main_layout.addRow(self.dedupe_completed)
+
         button_layout = QHBoxLayout()
         self.ok_btn = QPushButton("تایید")
         self.cancel_btn = QPushButton("لغو")
@@ -600,17 +2614,21 @@ class SettingsDialog(QDialog):
         if folder:
             self.folder_label.setText(folder)
 
+    def select_scratch_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "انتخاب پوشه موقت")
+        self.scratch_label.setText(folder)  # Cancelling clears it, i.e. turns staging off
+
 class SaveDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("ذخیره اطلاعات")
-        self.setFixedSize(400, 300)
+        self.setFixedSize(400, 320)
         self.checkboxes = {}
 
         main_layout = QVBoxLayout()
         form_layout = QFormLayout()
 
-        fields = ["عنوان", "URL", "حجم", "تعداد بازدید", "تاریخ آپلود", "کیفیت", "مسیر ذخیره", "لینک تامنیل"]
+        fields = ["عنوان", "URL", "حجم", "تعداد بازدید", "تاریخ آپلود", "کیفیت", "مسیر ذخیره", "پوشه ذخیره‌سازی", "لینک تامنیل", "SHA-256"]
         for field in fields:
             checkbox = QCheckBox(field)
             checkbox.setChecked(True)
@@ -633,46 +2651,457 @@ class SaveDialog(QDialog):
     def get_selected_fields(self):
         return [field for field, checkbox in self.checkboxes.items() if checkbox.isChecked()]
 
-class App(QWidget):
-    ui_update_signal = Signal(str, bool)
-    video_info_loaded = Signal(list)  # تغییر به لیست برای batch
-    update_progress = Signal(str, float, str, str, str)  # id, percent, downloaded_str, speed_str, eta_str
-    log_signal = Signal(str)
+class OutputsDialog(QDialog):
+    def __init__(self, selected, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("خروجی‌های اضافه")
+        self.checkboxes = {}
 
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("دانلودکننده یوتیوب")
-        self.setGeometry(100, 100, 1200, 700)
-        self.settings = {}
-        self.download_queue = []
-        self.completed_downloads = []
-        self.active_downloads = []
-        self.id_to_row = {}
-        self.downloading_all = False
-        self.yt_dlp_version = None
-        self.ffmpeg_version = None
-        self.yt_dlp_path = None
-        self.ffmpeg_path = None
-        self.thread_pool = ThreadPoolExecutor(max_workers=4)
-        self.fetch_cancelled = False
-        self.ask_delete_partial = False
-        self.progress_emit_counter = {}  # To rate-limit progress emits
+        main_layout = QVBoxLayout()
+        hint = QLabel("ویدیو یک بار دانلود می‌شود و هر خروجی انتخاب‌شده به صورت محلی از همان فایل ساخته می‌شود.")
+        hint.setWordWrap(True)
+        main_layout.addWidget(hint)
+        form_layout = QFormLayout()
+        for fmt in VIDEO_FORMAT_OPTIONS + AUDIO_FORMAT_OPTIONS:
+            checkbox = QCheckBox(fmt)
+            checkbox.setChecked(fmt in selected)
+            self.checkboxes[fmt] = checkbox
+            form_layout.addRow(checkbox)
+        main_layout.addLayout(form_layout)
 
-        self.ui_update_signal.connect(self.update_ui_from_thread)
+        button_layout = QHBoxLayout()
+        self.ok_btn = QPushButton("تایید")
+        self.cancel_btn = QPushButton("لغو")
+        button_layout.addWidget(self.ok_btn)
+        button_layout.addWidget(self.cancel_btn)
+
+        self.ok_btn.clicked.connect(self.accept)
+        self.cancel_btn.clicked.connect(self.reject)
+        main_layout.addLayout(button_layout)
+        self.setLayout(main_layout)
+
+    def get_selected_outputs(self):
+        return [fmt for fmt, checkbox in self.checkboxes.items() if checkbox.isChecked()]
+
+class SubscriptionsDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("اشتراک‌ها")
+        self.resize(700, 400)
+        self.parent_app = parent
+
+        main_layout = QVBoxLayout()
+        self.table = QTableWidget(0, 4)
+        self.table.setHorizontalHeaderLabels(["عنوان", "لینک", "آخرین همگام‌سازی", "موارد جدید"])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        main_layout.addWidget(self.table)
+
+        button_layout = QHBoxLayout()
+        self.add_btn = QPushButton("افزودن")
+        self.remove_btn = QPushButton("حذف")
+        self.sync_btn = QPushButton("همگام‌سازی اکنون")
+        self.close_btn = QPushButton("بستن")
+        for button in (self.add_btn, self.remove_btn, self.sync_btn, self.close_btn):
+            button_layout.addWidget(button)
+        main_layout.addLayout(button_layout)
+
+        self.add_btn.clicked.connect(self.add_subscription)
+        self.remove_btn.clicked.connect(self.remove_selected)
+        self.sync_btn.clicked.connect(self.sync_now)
+        self.close_btn.clicked.connect(self.accept)
+        self.setLayout(main_layout)
+        self.refresh()
+
+    def refresh(self):
+        subscriptions = self.parent_app.subscriptions
+        self.table.setRowCount(len(subscriptions))
+        for row, sub in enumerate(subscriptions):
+            last_sync = time.strftime("%Y-%m-%d %H:%M", time.localtime(sub['last_sync'])) if sub.get('last_sync') else "هرگز"
+            self.table.setItem(row, 0, QTableWidgetItem(sub.get('title') or ""))
+            self.table.setItem(row, 1, QTableWidgetItem(sub['url']))
+            self.table.setItem(row, 2, QTableWidgetItem(last_sync))
+            self.table.setItem(row, 3, QTableWidgetItem(str(sub.get('new_total', 0))))
+
+    def add_subscription(self):
+        url, ok = QInputDialog.getText(self, "افزودن اشتراک", "آدرس کانال یا لیست پخش:")
+        if ok and url.strip():
+            self.parent_app.add_subscription(url.strip())
+            self.refresh()
+
+    def remove_selected(self):
+        rows = sorted((index.row() for index in self.table.selectionModel().selectedRows()), reverse=True)
+        for row in rows:
+            self.parent_app.remove_subscription(self.parent_app.subscriptions[row]['url'])
+        self.refresh()
+
+    def sync_now(self):
+        self.parent_app.sync_due_subscriptions(force=True)
+
+class StorageRootsDialog(QDialog):
+    def __init__(self, roots, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("پوشه‌های ذخیره‌سازی")
+        self.resize(850, 350)
+
+        main_layout = QVBoxLayout()
+        main_layout.addWidget(QLabel("هر مورد در پوشه‌ای با بیشترین فضای آزاد وزن‌دار به ازای هر دانلود در حال نوشتن ذخیره می‌شود.\n"
+                                     "پوشه‌هایی که قانون فرمت یا منبع دارند فقط موارد منطبق را می‌پذیرند و بر پوشه‌های بدون قانون مقدم‌اند."))
+        self.table = QTableWidget(0, 5)
+        self.table.setHorizontalHeaderLabels(["مسیر", "ظرفیت", "وزن", "فرمت‌ها (مثلاً mp3, m4a)", "منابع (مثلاً youtube.com)"])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        main_layout.addWidget(self.table)
+
+        button_layout = QHBoxLayout()
+        self.add_btn = QPushButton("افزودن پوشه")
+        self.remove_btn = QPushButton("حذف")
+        self.ok_btn = QPushButton("تایید")
+        self.cancel_btn = QPushButton("انصراف")
+        for button in (self.add_btn, self.remove_btn, self.ok_btn, self.cancel_btn):
+            button_layout.addWidget(button)
+        main_layout.addLayout(button_layout)
+
+        self.add_btn.clicked.connect(self.choose_root)
+        self.remove_btn.clicked.connect(self.remove_selected)
+        self.ok_btn.clicked.connect(self.accept)
+        self.cancel_btn.clicked.connect(self.reject)
+        self.setLayout(main_layout)
+        for root in roots:
+            self.add_root(root)
+
+    def choose_root(self):
+        folder = QFileDialog.getExistingDirectory(self, "انتخاب پوشه ذخیره‌سازی")
+        if folder:
+            self.add_root({'path': folder, 'capacity_gb': 0, 'weight': 1, 'formats': [], 'sources': []})
+
+    def add_root(self, root):
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        path_item = QTableWidgetItem(root['path'])
+        path_item.setFlags(path_item.flags() & ~Qt.ItemIsEditable)
+        self.table.setItem(row, 0, path_item)
+        capacity_spin = QSpinBox()
+        capacity_spin.setRange(0, 1024 * 1024)
+        capacity_spin.setSuffix(" GB")
+        capacity_spin.setSpecialValueText("کل دیسک")
+        capacity_spin.setValue(root.get('capacity_gb', 0))
+        self.table.setCellWidget(row, 1, capacity_spin)
+        weight_spin = QSpinBox()
+        weight_spin.setRange(1, 100)
+        weight_spin.setValue(root.get('weight', 1))
+        self.table.setCellWidget(row, 2, weight_spin)
+        self.table.setItem(row, 3, QTableWidgetItem(", ".join(root.get('formats', []))))
+        self.table.setItem(row, 4, QTableWidgetItem(", ".join(root.get('sources', []))))
+
+    def remove_selected(self):
+        for row in sorted((index.row() for index in self.table.selectionModel().selectedRows()), reverse=True):
+            self.table.removeRow(row)
+
+    @staticmethod
+    def _split(text):
+        return [part.strip().lower() for part in text.split(",") if part.strip()]
+
+    def get_roots(self):
+        return [{
+            'path': self.table.item(row, 0).text(),
+            'capacity_gb': self.table.cellWidget(row, 1).value(),
+            'weight': self.table.cellWidget(row, 2).value(),
+            'formats': [fmt.lstrip('.') for fmt in self._split(self.table.item(row, 3).text())],
+            'sources': [url_host("https://" + host) for host in self._split(self.table.item(row, 4).text())],
+        } for row in range(self.table.rowCount())]
+
+class ScheduleDialog(QDialog):
+    def __init__(self, schedule, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("زمان‌بندی دانلود")
+        self.resize(800, 350)
+
+        main_layout = QVBoxLayout()
+        main_layout.addWidget(QLabel("اولین ردیفی که زمان فعلی را پوشش دهد اعمال می‌شود؛ خارج از همه ردیف‌ها تنظیمات عادی برقرار است.\n"
+                                     "بازه‌ای که پایانش پیش از شروعش باشد تا روز بعد ادامه می‌یابد."))
+        self.table = QTableWidget(0, 6)
+        self.table.setHorizontalHeaderLabels(["روزها", "از", "تا", "دانلود همزمان", "پهنای باند کل", "شروع دانلود جدید"])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        main_layout.addWidget(self.table)
+
+        button_layout = QHBoxLayout()
+        self.add_btn = QPushButton("افزودن")
+        self.remove_btn = QPushButton("حذف")
+        self.ok_btn = QPushButton("تایید")
+        self.cancel_btn = QPushButton("انصراف")
+        for button in (self.add_btn, self.remove_btn, self.ok_btn, self.cancel_btn):
+            button_layout.addWidget(button)
+        main_layout.addLayout(button_layout)
+
+        self.add_btn.clicked.connect(lambda: self.add_rule())
+        self.remove_btn.clicked.connect(self.remove_selected)
+        self.ok_btn.clicked.connect(self.accept)
+        self.cancel_btn.clicked.connect(self.reject)
+        self.setLayout(main_layout)
+        for rule in schedule:
+            self.add_rule(rule)
+
+    def add_rule(self, rule=None):
+        rule = rule or {'days': SCHEDULE_DAY_PRESETS["شنبه تا چهارشنبه"], 'start': "08:00", 'end': "17:00",
+                        'concurrency': 1, 'rate_limit': 512 * 1024, 'allow_starts': True}
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        days_combo = QComboBox()
+        days_combo.addItems(list(SCHEDULE_DAY_PRESETS))
+        preset = next((name for name, days in SCHEDULE_DAY_PRESETS.items() if days == sorted(rule['days'])), None)
+        if preset:
+            days_combo.setCurrentText(preset)
+        self.table.setCellWidget(row, 0, days_combo)
+        for column, clock in ((1, rule['start']), (2, rule['end'])):
+            time_edit = QTimeEdit(QTime.fromString(clock, "HH:mm"))
+            time_edit.setDisplayFormat("HH:mm")
+            self.table.setCellWidget(row, column, time_edit)
+        concurrency_spin = QSpinBox()
+        concurrency_spin.setRange(1, MAX_CONCURRENT_DOWNLOADS)
+        concurrency_spin.setValue(rule['concurrency'])
+        self.table.setCellWidget(row, 3, concurrency_spin)
+        rate_spin = QSpinBox()
+        rate_spin.setRange(0, 10 * 1024 * 1024)
+        rate_spin.setSingleStep(128)
+        rate_spin.setSuffix(" KB/s")
+        rate_spin.setSpecialValueText("نامحدود")
+        rate_spin.setValue(rule['rate_limit'] // 1024)
+        self.table.setCellWidget(row, 4, rate_spin)
+        allow_check = QCheckBox()
+        allow_check.setChecked(rule['allow_starts'])
+        self.table.setCellWidget(row, 5, allow_check)
+
+    def remove_selected(self):
+        for row in sorted((index.row() for index in self.table.selectionModel().selectedRows()), reverse=True):
+            self.table.removeRow(row)
+
+    def get_schedule(self):
+        return [{
+            'days': SCHEDULE_DAY_PRESETS[self.table.cellWidget(row, 0).currentText()],
+            'start': self.table.cellWidget(row, 1).time().toString("HH:mm"),
+            'end': self.table.cellWidget(row, 2).time().toString("HH:mm"),
+            'concurrency': self.table.cellWidget(row, 3).value(),
+            'rate_limit': self.table.cellWidget(row, 4).value() * 1024,
+            'allow_starts': self.table.cellWidget(row, 5).isChecked(),
+        } for row in range(self.table.rowCount())]
+
+class ProxyStatsDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("وضعیت پروکسی‌ها")
+        self.resize(800, 300)
+        self.parent_app = parent
+
+        main_layout = QVBoxLayout()
+        self.table = QTableWidget(0, 7)
+        self.table.setHorizontalHeaderLabels(["پروکسی", "وضعیت", "دانلود فعال", "سرعت", "موفق", "خطا", "امتیاز"])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        main_layout.addWidget(self.table)
+
+        button_layout = QHBoxLayout()
+        self.reinstate_btn = QPushButton("رفع قرنطینه")
+        self.close_btn = QPushButton("بستن")
+        button_layout.addWidget(self.reinstate_btn)
+        button_layout.addWidget(self.close_btn)
+        main_layout.addLayout(button_layout)
+
+        self.reinstate_btn.clicked.connect(self.reinstate_selected)
+        self.close_btn.clicked.connect(self.accept)
+        self.setLayout(main_layout)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(1000)
+        self.refresh()
+
+    def refresh(self):
+        pool = self.parent_app.proxy_pool
+        self.table.setRowCount(len(pool.proxies))
+        for row, proxy in enumerate(pool.proxies):
+            stats = pool.stats[proxy]
+            if pool.quarantined(proxy):
+                status = "قرنطینه تا " + time.strftime("%H:%M:%S", time.localtime(stats['quarantined_until']))
+            else:
+                status = "فعال"
+            self.table.setItem(row, 0, QTableWidgetItem(redact_proxy(proxy)))
+            self.table.setItem(row, 1, QTableWidgetItem(status))
+            self.table.setItem(row, 2, QTableWidgetItem(f"{pool.active.get(proxy, 0)}/{pool.capacity}"))
+            self.table.setItem(row, 3, QTableWidgetItem(format_speed(stats['speed']) if stats['speed'] else "نامشخص"))
+            self.table.setItem(row, 4, QTableWidgetItem(str(stats['successes'])))
+            self.table.setItem(row, 5, QTableWidgetItem(str(stats['failures'])))
+            # Effective bytes/s: throughput discounted by the smoothed failure rate
+            self.table.setItem(row, 6, QTableWidgetItem(format_speed(pool.score(proxy)) if stats['speed'] else "نامشخص"))
+
+    def reinstate_selected(self):
+        pool = self.parent_app.proxy_pool
+        for index in self.table.selectionModel().selectedRows():
+            pool.reinstate(pool.proxies[index.row()])
+        self.refresh()
+        if self.parent_app.downloading_all:
+            self.parent_app._start_next_downloads()
+
+class App(QWidget):
+    ui_update_signal = Signal(str, bool)
+    video_info_loaded = Signal(list)  # تغییر به لیست برای batch
+    subscription_entries_loaded = Signal(list)
+    subscription_synced = Signal(str, list, str, bool)  # url, new ids (newest first), title, ok
+    update_progress = Signal(str, float, object, object, object)  # id, percent, downloaded bytes, bytes/s, eta seconds (None if unknown)
+    transfer_progress = Signal(int, int)  # items written, total
+    transfer_finished = Signal(str, bool)  # message, is_error
+    metadata_resolved = Signal(str, dict)  # item id, trimmed info ({} if the lookup failed)
+    metadata_batch_done = Signal(bool)  # was a background batch
+    media_verified = Signal(str, dict)  # completed item id, verification result
+    item_prepared = Signal(str, dict)  # item id, prepared entry ({} if extraction failed)
+    files_moved = Signal(str, list, str)  # item id, paths in the output root, error ("" on success)
+    root_usage_ready = Signal(dict)  # capped output root -> bytes already stored there
+    log_signal = Signal(str)
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("دانلودکننده یوتیوب")
+        self.setGeometry(100, 100, 1200, 700)
+        self.settings = {}
+        self.download_queue = []
+        self.completed_downloads = []
+        self.active_jobs = []  # DownloadJob per running (or suspend-paused) download
+        self.postprocess_queue = []  # (item_id, filepath, steps, duration) waiting for a free ffmpeg worker
+        self.active_postprocessing = []
+        self.id_to_row = {}
+        self.downloading_all = False
+        self.yt_dlp_version = None
+        self.ffmpeg_version = None
+        self.yt_dlp_path = None
+        self.ffmpeg_path = None
+        self.thread_pool = ThreadPoolExecutor(max_workers=4)
+        self.fetch_cancelled = False
+        self.fetch_stopped = False  # Stop expanding but keep what was already fetched
+        self.fetch_processes = set()
+        self.subscription_processes = set()
+        self.transfer_dialog = None
+        self.transfer_cancelled = False
+        self.unresolved = {}  # item id -> None for placeholders, in insertion order
+        self.metadata_in_flight = set()
+        self.metadata_batches = 0
+        self.metadata_background_batches = 0
+        self.metadata_processes = set()
+        self.start_after_resolve = set()
+        self.metadata_pool = ThreadPoolExecutor(max_workers=METADATA_WORKERS)
+        self.download_speeds = {}  # item id -> last reported bytes/s
+        self.download_percent = {}  # item id -> last reported percent, kept across pauses
+        self.slot_speed = None  # smoothed bytes/s of one unthrottled download, for the schedule-aware queue ETA
+        self.prepared = {}  # item id -> {'path', 'selector', 'proxy', 'expires'} of a pre-resolved item
+        self.preparing = set()
+        self.prepare_failed = set()  # not retried by the lookahead; the download extracts itself
+        self.prefetch_processes = set()
+        self.prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS)
+        # Prepared files do not outlive the session: their URLs are short-lived anyway
+        shutil.rmtree(PREPARED_DIR, ignore_errors=True)
+        os.makedirs(PREPARED_DIR, exist_ok=True)
+        self.hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS)
+        self.hash_stopping = False
+        self.probe_processes = set()
+        self.move_pool = ThreadPoolExecutor(max_workers=MOVE_WORKERS)
+        self.move_stopping = False
+        self.moving = set()  # item ids whose files are being moved out of the scratch folder
+        self.root_usage = {}  # capped output root -> bytes of our files stored there
+        self.space_held = set()  # queued item ids waiting for free disk space
+        self.space_timer = QTimer(self)
+        self.space_timer.setSingleShot(True)
+        self.space_timer.timeout.connect(self._on_space_recheck)
+        self.ffprobe_path = None
+        self.ask_delete_partial = False
+        self.progress_emit_counter = {}  # To rate-limit progress emits
+        self.suspend_tokens = {}  # item id -> token of the pending suspend-timeout fallback
+        self.rate_shares_pending = False
+        self.reaper = ProcessReaper()
+        self.retired_workers = []  # Workers that reported their end but may still be returning from run()
+        self.shutdown_stragglers = 0  # pool threads still running when closing gave up waiting for them
+        self.startup_time = time.perf_counter()
+        self.restore_cursor = 0  # First queue row whose widgets are not created yet
+        self.queue_sort = None  # (column, descending) of the last header-click sort
+
+        self.ui_update_signal.connect(self.update_ui_from_thread)
         self.video_info_loaded.connect(self._add_batch_to_table_from_thread)
+        self.subscription_entries_loaded.connect(self._add_subscription_batch)
+        self.subscription_synced.connect(self._on_subscription_synced)
         self.update_progress.connect(self._update_progress_ui)
+        self.transfer_progress.connect(self._on_transfer_progress)
+        self.transfer_finished.connect(self._on_transfer_finished)
+        self.metadata_resolved.connect(self._on_metadata_resolved)
+        self.metadata_batch_done.connect(self._on_metadata_batch_done)
+        self.media_verified.connect(self._on_media_verified)
+        self.item_prepared.connect(self._on_item_prepared)
+        self.files_moved.connect(self._on_files_moved)
+        self.root_usage_ready.connect(self._on_root_usage_ready)
         self.log_signal.connect(self.log_message)
 
+        self.save_queue_timer = QTimer(self)
+        self.save_queue_timer.setSingleShot(True)
+        self.save_queue_timer.setInterval(1000)
+        self.save_queue_timer.timeout.connect(self.save_queue)
+
         self.load_settings()
+        self.file_index = SaveFolderIndex(self)
+        self.archive = DownloadArchive(ARCHIVE_DB_PATH, ARCHIVE_BLOOM_PATH)
+        self.thread_pool.submit(self.archive.load)
+        self.media_index = MediaIndex(MEDIA_INDEX_PATH)
+        self._apply_output_roots()
         self.init_ui()
         self.load_queue()
         self.check_dependencies(silent=True)
         self.restore_queue_to_table()
 
+        self.metadata_timer = QTimer(self)
+        self.metadata_timer.timeout.connect(self._metadata_tick)
+        self.unresolved = dict.fromkeys(item['id'] for item in self.download_queue
+                                        if item.get('needs_metadata') or item.get('needs_formats'))
+        if self.unresolved:
+            self.metadata_timer.start(METADATA_TICK_MS)
+
         self.ui_timer = QTimer(self)
         self.ui_timer.timeout.connect(self._refresh_ui)
         self.ui_timer.start(1000)
 
+        self.host_stats = load_json_file(HOST_STATS_PATH, {})
+        self.transcode_stats = load_json_file(TRANSCODE_STATS_PATH, {})
+        self.host_cooldowns = {}  # host -> time.time() until which no new downloads start there
+        self.rate_limit_strikes = {}  # host -> consecutive rate-limit cooldowns, reset by a success
+        self.proxy_pool = ProxyPool(self.settings.get("proxy_pool", []),
+                                    self.settings.get("proxy_max_active", PROXY_MAX_ACTIVE), PROXY_STATS_PATH)
+        self.download_proxies = {}  # item id -> pool proxy the running download holds a slot on
+        self.suspended_proxies = {}  # item id -> pool proxy of a suspend-paused download, its slot given back
+        self.proxy_release_at = None  # pending timer for the next quarantine to end
+        self.stall_timer = QTimer(self)
+        self.stall_timer.timeout.connect(self.check_stalled_downloads)
+        self.stall_timer.start(STALL_CHECK_INTERVAL_MS)
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.timeout.connect(self._prefetch_tick)
+        self.prefetch_timer.start(PREFETCH_CHECK_MS)
+        self.profile = schedule_profile(self.settings.get("schedule", []), self._default_profile(), datetime.now())
+        self.schedule_timer = QTimer(self)
+        self.schedule_timer.timeout.connect(self._apply_schedule)
+        self.schedule_timer.start(SCHEDULE_CHECK_MS)
+
+        self.load_subscriptions()
+        self.syncing_subscriptions = set()
+        self.subscription_timer = QTimer(self)
+        self.subscription_timer.timeout.connect(self.sync_due_subscriptions)
+        self.subscription_timer.start(SUBSCRIPTION_CHECK_INTERVAL_MS)
+        QTimer.singleShot(5000, self.sync_due_subscriptions)
+
+        # Fires on the first event-loop iteration, i.e. right after show()
+        QTimer.singleShot(0, self._log_time_to_interactive)
+
+    def _log_time_to_interactive(self):
+        elapsed_ms = (time.perf_counter() - self.startup_time) * 1000
+        logging.info(f"Time-to-interactive: {elapsed_ms:.0f} ms ({len(self.download_queue)} queued items)")
+        self.log_message(f"آماده‌سازی رابط کاربری: {elapsed_ms:.0f} میلی‌ثانیه")
+
     def log_message(self, message):
         timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
         self.log_text.append(f"[{timestamp}] {message}")
@@ -687,11 +3116,23 @@ class App(QWidget):
         export_menu.addAction("TXT").triggered.connect(lambda: self.export_to_file('txt'))
         export_menu.addAction("JSON").triggered.connect(lambda: self.export_to_file('json'))
         export_menu.addAction("CSV").triggered.connect(lambda: self.export_to_file('csv'))
+        export_menu.addAction("NDJSON").triggered.connect(lambda: self.export_to_file('ndjson'))
         file_menu.addAction("خروجی لیست دانلود شده‌ها").triggered.connect(self.export_completed_list)
+        file_menu.addAction("بررسی صحت دانلود شده‌ها").triggered.connect(self.verify_all_completed)
+        archive_menu = file_menu.addMenu("آرشیو دانلود")
+        archive_menu.addAction("وارد کردن آرشیو yt-dlp").triggered.connect(self.import_download_archive)
+        archive_menu.addAction("خروجی آرشیو yt-dlp").triggered.connect(self.export_download_archive)
         file_menu.addAction("پاک کردن صف").triggered.connect(self.clear_queue)
 
+        subscriptions_menu = menu_bar.addMenu("اشتراک‌ها")
+        subscriptions_menu.addAction("مدیریت اشتراک‌ها").triggered.connect(self.show_subscriptions_dialog)
+        subscriptions_menu.addAction("همگام‌سازی اکنون").triggered.connect(lambda: self.sync_due_subscriptions(force=True))
+
         settings_menu = menu_bar.addMenu("تنظیمات")
         settings_menu.addAction("تنظیمات").triggered.connect(self.show_settings_dialog)
+        settings_menu.addAction("پوشه‌های ذخیره‌سازی").triggered.connect(self.show_storage_roots_dialog)
+        settings_menu.addAction("زمان‌بندی دانلود").triggered.connect(self.show_schedule_dialog)
+        settings_menu.addAction("وضعیت پروکسی‌ها").triggered.connect(self.show_proxy_stats_dialog)
 
         main_layout.addWidget(menu_bar)
 
@@ -703,9 +3144,13 @@ class App(QWidget):
         self.cancel_add_btn = QPushButton("لغو اضافه کردن")
         self.cancel_add_btn.clicked.connect(self.cancel_add_to_queue)
         self.cancel_add_btn.setEnabled(False)
+        self.stop_add_btn = QPushButton("توقف و نگه‌داشتن")
+        self.stop_add_btn.clicked.connect(self.stop_add_to_queue)
+        self.stop_add_btn.setEnabled(False)
         input_layout.addWidget(self.url_input)
         input_layout.addWidget(self.add_btn)
         input_layout.addWidget(self.cancel_add_btn)
+        input_layout.addWidget(self.stop_add_btn)
         main_layout.addLayout(input_layout)
 
         self.tab_widget = QTabWidget()
@@ -736,6 +3181,7 @@ class App(QWidget):
         header.setSectionResizeMode(9, QHeaderView.Interactive)
         header.setSectionResizeMode(10, QHeaderView.Interactive)
         header.setSectionResizeMode(11, QHeaderView.Interactive)
+        header.sectionClicked.connect(self.sort_queue)
         self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.table.setAlternatingRowColors(True)
         self.table.setContextMenuPolicy(Qt.CustomContextMenu)
@@ -776,6 +3222,8 @@ class App(QWidget):
 
         self.status_label = QLabel("آماده.")
         main_layout.addWidget(self.status_label)
+        self.pipeline_label = QLabel("")
+        main_layout.addWidget(self.pipeline_label)
 
         log_label = QLabel("لاگ عملیات:")
         main_layout.addWidget(log_label)
@@ -807,17 +3255,18 @@ class App(QWidget):
 
             pause_action = QAction("مکث دانلود")
             pause_action.triggered.connect(lambda: self.pause_single_download(rows[0]) if len(rows) == 1 else None)
-            pause_action.setEnabled(len(rows) == 1 and items[rows[0]]['status'] == "در حال دانلود...")
+            pause_action.setEnabled(len(rows) == 1 and items[rows[0]].status == ItemStatus.DOWNLOADING)
             menu.addAction(pause_action)
 
             resume_action = QAction("ادامه دانلود")
             resume_action.triggered.connect(lambda: self.resume_single_download(rows[0]) if len(rows) == 1 else None)
-            resume_action.setEnabled(len(rows) == 1 and items[rows[0]]['status'] == "متوقف شده")
+            resume_action.setEnabled(len(rows) == 1 and items[rows[0]].status == ItemStatus.PAUSED)
             menu.addAction(resume_action)
 
             cancel_single_action = QAction("لغو دانلود تکی")
             cancel_single_action.triggered.connect(lambda: self.cancel_single_download(rows[0]) if len(rows) == 1 else None)
-            cancel_single_action.setEnabled(len(rows) == 1 and items[rows[0]]['status'] in ["در حال دانلود...", "متوقف شده"])
+            cancel_single_action.setEnabled(len(rows) == 1 and items[rows[0]].status in (ItemStatus.DOWNLOADING, ItemStatus.PAUSED,
+                                                                                          ItemStatus.RETRY_WAIT))
             menu.addAction(cancel_single_action)
 
             cancel_all_action = QAction("لغو تمام دانلودها")
@@ -840,18 +3289,23 @@ class App(QWidget):
             download_thumb.triggered.connect(lambda: self.download_selected_thumbnails(rows))
             menu.addAction(download_thumb)
 
+            extra_outputs = QAction("خروجی‌های اضافه...")
+            extra_outputs.triggered.connect(lambda: self.set_extra_outputs(rows))
+            menu.addAction(extra_outputs)
+
             export_selected = menu.addMenu("خروجی موارد انتخابی")
             export_selected.addAction("TXT").triggered.connect(lambda: self.export_selected_items('txt'))
             export_selected.addAction("JSON").triggered.connect(lambda: self.export_selected_items('json'))
             export_selected.addAction("CSV").triggered.connect(lambda: self.export_selected_items('csv'))
+            export_selected.addAction("NDJSON").triggered.connect(lambda: self.export_selected_items('ndjson'))
 
             open_folder = QAction("باز کردن پوشه ذخیره")
-            open_folder.triggered.connect(self.open_save_folder)
+            open_folder.triggered.connect(lambda: self.open_save_folder(rows))
             menu.addAction(open_folder)
 
             open_file_path = QAction("باز کردن مسیر ویدیو")
             open_file_path.triggered.connect(lambda: self.open_video_file_path(rows))
-            if len(rows) == 1 and items[rows[0]].get('status') == "دانلود شده" and items[rows[0]].get('download_path'):
+            if len(rows) == 1 and items[rows[0]].status == ItemStatus.DONE and items[rows[0]].get('download_path'):
                 open_file_path.setEnabled(True)
             else:
                 open_file_path.setEnabled(False)
@@ -874,9 +3328,10 @@ class App(QWidget):
             export_selected.addAction("TXT").triggered.connect(lambda: self.export_selected_items('txt', "completed"))
             export_selected.addAction("JSON").triggered.connect(lambda: self.export_selected_items('json', "completed"))
             export_selected.addAction("CSV").triggered.connect(lambda: self.export_selected_items('csv', "completed"))
+            export_selected.addAction("NDJSON").triggered.connect(lambda: self.export_selected_items('ndjson', "completed"))
 
             open_folder = QAction("باز کردن پوشه ذخیره")
-            open_folder.triggered.connect(self.open_save_folder)
+            open_folder.triggered.connect(lambda: self.open_save_folder(rows, "completed"))
             menu.addAction(open_folder)
 
             open_file_path = QAction("باز کردن مسیر ویدیو")
@@ -891,6 +3346,16 @@ class App(QWidget):
             copy_all_urls.triggered.connect(lambda: self.copy_all_urls("completed"))
             menu.addAction(copy_all_urls)
 
+            verify_files = QAction("بررسی صحت فایل")
+            verify_files.triggered.connect(lambda: self.verify_completed_rows(rows))
+            verify_files.setEnabled(bool(rows))
+            menu.addAction(verify_files)
+
+            redownload = QAction("دانلود مجدد فایل‌های ناقص")
+            redownload.triggered.connect(lambda: self.redownload_completed_rows(rows))
+            redownload.setEnabled(any(items[row].get('integrity') in INTEGRITY_STATUSES for row in rows))
+            menu.addAction(redownload)
+
         menu.exec(table.viewport().mapToGlobal(position))
 
     def copy_selected_titles(self, rows, tab_type="download"):
@@ -926,7 +3391,7 @@ class App(QWidget):
                     self.log_message(f"تامنیل برای '{item['title']}' یافت نشد یا در دسترس نیست.")
                     continue
                 
-                safe_title = "".join(c for c in item['title'] if c.isalnum() or c in " ._()")
+                safe_title = safe_filename(item['title'])
                 file_path, _ = QFileDialog.getSaveFileName(self, "ذخیره تامنیل", f"{safe_title}.jpg", "تصاویر (*.jpg *.png)")
                 if file_path:
                     success = download_thumbnail(url, file_path)
@@ -943,8 +3408,12 @@ class App(QWidget):
         QApplication.clipboard().setText(urls)
         self.status_label.setText("تمامی آدرس‌ها در کلیپ‌بورد کپی شدند.")
 
-    def open_save_folder(self):
+    def open_save_folder(self, rows=(), tab_type="download"):
+        # A single selected item opens the root it was stored on
         folder = self.settings.get("save_folder")
+        if len(rows) == 1:
+            items = self.download_queue if tab_type == "download" else self.completed_downloads
+            folder = items[rows[0]].get('output_root') or folder
         if not os.path.exists(folder):
             QMessageBox.warning(self, "پوشه پیدا نشد", "پوشه ذخیره وجود ندارد.")
             return
@@ -1002,14 +3471,29 @@ class App(QWidget):
         dialog = SettingsDialog(self)
         if dialog.exec():
             self.settings["save_folder"] = dialog.folder_label.text()
+            self._apply_output_roots()
             self.settings["format"] = dialog.format_combo.currentText()
             self.settings["video_format"] = dialog.video_format_combo.currentText()
+            self.settings["audio_format"] = dialog.audio_format_combo.currentText()
+            self.settings["scratch_folder"] = dialog.scratch_label.text().strip()
+            self.settings["disk_headroom_mb"] = dialog.disk_headroom_spin.value()
             self.settings["concurrency"] = dialog.concurrency_spin.value()
+            self.settings["subscription_sync_hours"] = dialog.subscription_hours_spin.value()
+            self.settings["pause_suspend_minutes"] = dialog.pause_suspend_spin.value()
+            self.settings["stall_timeout_seconds"] = dialog.stall_timeout_spin.value()
             self.settings["proxy"] = dialog.proxy_input.text()
+            self.settings["proxy_pool"] = [line.strip() for line in dialog.proxy_pool_input.toPlainText().splitlines() if line.strip()]
+            self.settings["proxy_max_active"] = dialog.proxy_capacity_spin.value()
+            self.proxy_pool.configure(self.settings["proxy_pool"], self.settings["proxy_max_active"])
             self.settings["subtitle_lang"] = dialog.subtitle_lang_combo.currentText()
             self.settings["clear_on_exit"] = dialog.clear_data_on_exit.isChecked()
             self.settings["delete_partial_on_cancel"] = dialog.delete_partial_on_cancel.isChecked()
+            self.settings["use_download_archive"] = dialog.use_download_archive.isChecked()
+            self.settings["lazy_import_metadata"] = dialog.lazy_import_metadata.isChecked()
+            self.settings["fetch_format_inventory"] = dialog.fetch_format_inventory.isChecked()
+            self.settings["dedupe_completed"] = dialog.dedupe_completed.isChecked()
             self.save_settings()
+            self._apply_schedule()  # The plain concurrency is the profile outside scheduled windows
             self.log_message("تنظیمات ذخیره شد.")
             QMessageBox.information(self, "تنظیمات", "تنظیمات ذخیره شدند.")
 
@@ -1019,11 +3503,25 @@ class App(QWidget):
             "save_folder": os.path.join(os.path.expanduser("~"), "Downloads"),
             "format": "ویدیو و صدا",
             "video_format": "mp4",
+            "audio_format": "mp3",
+            "scratch_folder": "",
+            "disk_headroom_mb": 512,
             "concurrency": 3,
+            "subscription_sync_hours": 24,
+            "pause_suspend_minutes": 5,
+            "stall_timeout_seconds": 60,
             "proxy": "",
+            "proxy_pool": [],
+            "proxy_max_active": PROXY_MAX_ACTIVE,
             "subtitle_lang": "هیچ",
             "clear_on_exit": False,
-            "delete_partial_on_cancel": False
+            "delete_partial_on_cancel": False,
+            "use_download_archive": True,
+            "lazy_import_metadata": True,
+            "fetch_format_inventory": True,
+            "dedupe_completed": True,
+            "schedule": [],
+            "output_roots": []
         })
 
     def save_settings(self):
@@ -1031,34 +3529,130 @@ class App(QWidget):
         save_json_file(CONFIG_PATH, self.settings)
 
     def load_queue(self):
-        self.download_queue = load_json_file(QUEUE_PATH, [])
+        self.download_queue = [QueueItem.from_dict(data) for data in load_json_file(QUEUE_PATH, [])]
         for item in self.download_queue:
-            item.setdefault('id', str(uuid.uuid4()))
-            item.setdefault('subtitle_lang', self.settings.get("subtitle_lang", "هیچ"))
+            item.id = item.id or str(uuid.uuid4())
+            item.subtitle_lang = item.subtitle_lang or self.settings.get("subtitle_lang", "هیچ")
+            # Work interrupted by the last exit resumes from the partial file (a restart, not a transition)
+            if item.status in BUSY_STATUSES:
+                item.status = ItemStatus.PAUSED
         self.log_message(f"صف دانلود بارگذاری شد: {len(self.download_queue)} مورد")
 
     def save_queue(self):
-        save_json_file(QUEUE_PATH, self.download_queue)
+        self.save_queue_timer.stop()
+        save_json_file(QUEUE_PATH, [item.to_dict() for item in self.download_queue])
+
+    def schedule_save_queue(self):
+        # Not restarted while pending, so a steady stream of changes still gets written
+        if not self.save_queue_timer.isActive():
+            self.save_queue_timer.start()
 
     def import_from_file(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "وارد کردن فایل", "", "متن (*.txt);;CSV (*.csv)")
+        file_path, _ = QFileDialog.getOpenFileName(self, "وارد کردن فایل", "", "متن (*.txt);;CSV (*.csv);;NDJSON (*.ndjson *.jsonl)")
         if not file_path:
             return
-        
-        urls = []
-        if file_path.endswith('.txt'):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                urls = [line.strip() for line in f if line.strip().startswith('http')]
-        elif file_path.endswith('.csv'):
-            with open(file_path, 'r', newline='', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                urls = [row[0] for row in reader if row and row[0].strip().startswith('http')]
-        
-        if urls:
-            self.ui_update_signal.emit(f"در حال وارد کردن {len(urls)} آدرس...", False)
-            self.thread_pool.submit(self._fetch_and_add_list, urls)
+        # Read, parsed and queued in chunks from the pool; cancel/stop use the add-bar buttons
+        self.fetch_cancelled = False
+        self.fetch_stopped = False
+        self.add_btn.setEnabled(False)
+        self.cancel_add_btn.setEnabled(True)
+        self.stop_add_btn.setEnabled(True)
+        self.ui_update_signal.emit(f"در حال وارد کردن {os.path.basename(file_path)}...", False)
+        self.thread_pool.submit(self._import_file_job, file_path)
+
+    def _iter_import_records(self, f, file_path):
+        """Yield one dict with at least 'url' per usable line of a .txt/.csv/.ndjson list."""
+        if file_path.endswith('.csv'):
+            reader = csv.reader(f)
+            keys = None
+            for row in reader:
+                if not row:
+                    continue
+                if keys is None and reader.line_num == 1 and 'url' in [self._get_field_key(cell) for cell in row]:
+                    keys = [self._get_field_key(cell) for cell in row]  # Header written by our own CSV export
+                    continue
+                record = dict(zip(keys, row)) if keys else {'url': row[0].strip()}
+                if record.get('url', '').startswith('http'):
+                    yield record
+        elif file_path.endswith(('.ndjson', '.jsonl')):
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    self.log_signal.emit(f"خط نامعتبر در {os.path.basename(file_path)}: {e}")
+                    continue
+                if isinstance(record, dict):
+                    record.setdefault('url', record.get('webpage_url', ''))
+                    if str(record['url']).startswith('http'):
+                        yield record
         else:
-            QMessageBox.warning(self, "فایل خالی", "فایل انتخاب شده حاوی آدرس معتبری نیست.")
+            for line in f:
+                line = line.strip()
+                if line.startswith('http'):
+                    yield {'url': line}
+
+    def _import_file_job(self, file_path):
+        """Stream a list file into the queue. Rows exported with a title are queued as they are,
+        single-video URLs become placeholders (lazy import) and other URLs are expanded with yt-dlp."""
+        yt_path = self.yt_dlp_path
+        lazy = self.settings.get("lazy_import_metadata", True)
+        imported = 0
+        status = "وارد کردن آدرس‌ها به پایان رسید."
+        try:
+            size = max(1, os.path.getsize(file_path))
+            with open(file_path, 'rb') as raw:
+                f = io.TextIOWrapper(raw, encoding='utf-8', newline='' if file_path.endswith('.csv') else None)
+                chunk = []
+                last_emit = time.monotonic()
+                for record in self._iter_import_records(f, file_path):
+                    if self.fetch_cancelled or self.fetch_stopped:
+                        break
+                    title = record.get('title')
+                    if title and title != 'نامشخص':
+                        chunk.append(import_record_to_video_info(record))
+                        imported += 1
+                    else:
+                        placeholder = placeholder_video_info(record['url']) if lazy else None
+                        if placeholder:
+                            chunk.append(placeholder)
+                            imported += 1
+                        elif not yt_path:
+                            self.log_signal.emit(f"yt-dlp در دسترس نیست؛ رد شد: {record['url']}")
+                        else:
+                            if chunk:
+                                self.video_info_loaded.emit(chunk)  # Keep file order ahead of the yt-dlp results
+                                chunk = []
+                            try:
+                                imported = self._stream_into_queue(yt_path, record['url'], imported)
+                            except Exception as e:
+                                self.log_signal.emit(f"خطا در دریافت اطلاعات URL {record['url']}: {e}")
+                    now = time.monotonic()
+                    if len(chunk) >= IMPORT_CHUNK_SIZE or now - last_emit >= FETCH_CHUNK_INTERVAL:
+                        if chunk:
+                            self.video_info_loaded.emit(chunk)
+                            chunk = []
+                        last_emit = now
+                        # raw.tell() runs ahead by the read buffer, which is close enough for progress
+                        self.ui_update_signal.emit(f"وارد کردن: {min(100, raw.tell() * 100 // size)}% ({imported} مورد)", False)
+                if chunk and not self.fetch_cancelled:
+                    self.video_info_loaded.emit(chunk)
+            if self.fetch_cancelled:
+                status = "وارد کردن لغو شد."
+            elif self.fetch_stopped:
+                status = f"وارد کردن متوقف شد؛ {imported} مورد نگه داشته شد."
+            elif not imported:
+                status = "فایل انتخاب شده حاوی آدرس معتبری نیست."
+            else:
+                status = f"وارد کردن آدرس‌ها به پایان رسید ({imported} مورد)."
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            status = f"خطا در خواندن فایل: {e}"
+            self.log_signal.emit(status)
+        finally:
+            self.ui_update_signal.emit(status, True)
+            QMetaObject.invokeMethod(self, "reset_add_buttons", Qt.QueuedConnection)
 
     def _export_data_logic(self, data_list, file_type):
         dialog = SaveDialog(self)
@@ -1070,33 +3664,85 @@ class App(QWidget):
             QMessageBox.warning(self, "انتخابی صورت نگرفت", "حداقل یک فیلد انتخاب کنید.")
             return
 
+        if self.transfer_dialog is not None:
+            QMessageBox.warning(self, "عملیات در جریان", "یک خروجی دیگر در حال انجام است.")
+            return
+
         default_filename = "youtube_downloader_export"
         file_path, _ = QFileDialog.getSaveFileName(self, "ذخیره فایل", f"{default_filename}.{file_type}", f"فایل {file_type.upper()} (*.{file_type})")
         if not file_path:
             return
-        
+
+        self.transfer_cancelled = False
+        self.transfer_dialog = QProgressDialog(f"در حال ذخیره {os.path.basename(file_path)}...", "لغو", 0, len(data_list), self)
+        self.transfer_dialog.setWindowModality(Qt.NonModal)
+        self.transfer_dialog.setMinimumDuration(500)
+        self.transfer_dialog.canceled.connect(self._cancel_transfer)
+        # Only the list of references is copied; rows are projected and written one at a time
+        self.thread_pool.submit(self._export_job, list(data_list), fields, file_path, file_type)
+
+    def _export_job(self, data_list, fields, file_path, file_type):
+        keys = [self._get_field_key(field) for field in fields]
+        tmp_path = file_path + ".part"
+        written = 0
+        last_emit = 0
         try:
-            if file_type == 'txt':
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    for item in data_list:
-                        for field in fields:
-                            f.write(f"{field}: {item.get(self._get_field_key(field), 'نامشخص')}\n")
-                        f.write("--------------------\n")
-            elif file_type == 'json':
-                data_to_save = [{self._get_field_key(field): item.get(self._get_field_key(field), 'نامشخص') for field in fields} for item in data_list]
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(data_to_save, f, indent=4, ensure_ascii=False)
-            elif file_type == 'csv':
-                with open(file_path, 'w', newline='', encoding='utf-8') as f:
-                    writer = csv.writer(f)
+            with open(tmp_path, 'w', newline='' if file_type == 'csv' else None, encoding='utf-8') as f:
+                writer = csv.writer(f) if file_type == 'csv' else None
+                if writer:
                     writer.writerow(fields)
-                    for item in data_list:
-                        row_data = [item.get(self._get_field_key(field), 'نامشخص') for field in fields]
-                        writer.writerow(row_data)
-            self.log_message(f"اطلاعات در {os.path.basename(file_path)} ذخیره شد.")
-        except IOError as e:
-            self.log_message(f"خطا در ذخیره فایل: {e}")
-            QMessageBox.critical(self, "خطا", f"خطا در ذخیره فایل: {e}")
+                elif file_type == 'json':
+                    f.write("[")
+                for item in data_list:
+                    if self.transfer_cancelled:
+                        break
+                    values = [item.get(key, 'نامشخص') for key in keys]
+                    if file_type == 'txt':
+                        f.write("".join(f"{field}: {value}\n" for field, value in zip(fields, values)))
+                        f.write("--------------------\n")
+                    elif file_type == 'csv':
+                        writer.writerow(values)
+                    elif file_type == 'ndjson':
+                        f.write(json.dumps(dict(zip(keys, values)), ensure_ascii=False) + "\n")
+                    else:
+                        # Same layout json.dump(indent=4) gives the whole array, one element at a time
+                        element = json.dumps(dict(zip(keys, values)), indent=4, ensure_ascii=False).replace("\n", "\n    ")
+                        f.write(("," if written else "") + "\n    " + element)
+                    written += 1
+                    now = time.monotonic()
+                    if now - last_emit >= TRANSFER_PROGRESS_INTERVAL:
+                        last_emit = now
+                        self.transfer_progress.emit(written, len(data_list))
+                if file_type == 'json':
+                    f.write("\n]" if written else "]")
+            if self.transfer_cancelled:
+                os.remove(tmp_path)
+                self.transfer_finished.emit("ذخیره فایل لغو شد.", False)
+            else:
+                os.replace(tmp_path, file_path)
+                self.transfer_finished.emit(f"اطلاعات در {os.path.basename(file_path)} ذخیره شد ({written} مورد).", False)
+        except OSError as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self.transfer_finished.emit(f"خطا در ذخیره فایل: {e}", True)
+
+    def _cancel_transfer(self):
+        self.transfer_cancelled = True
+
+    def _on_transfer_progress(self, done, total):
+        if self.transfer_dialog is not None:
+            self.transfer_dialog.setMaximum(total)
+            self.transfer_dialog.setValue(done)
+
+    def _on_transfer_finished(self, message, is_error):
+        if self.transfer_dialog is not None:
+            self.transfer_dialog.canceled.disconnect(self._cancel_transfer)
+            self.transfer_dialog.reset()
+            self.transfer_dialog.deleteLater()
+            self.transfer_dialog = None
+        self.log_message(message)
+        if is_error:
+            QMessageBox.critical(self, "خطا", message)
 
     def export_to_file(self, file_type):
         if not self.download_queue:
@@ -1108,26 +3754,54 @@ class App(QWidget):
         if not self.completed_downloads:
             QMessageBox.warning(self, "لیست خالی است", "هیچ موردی در لیست دانلود شده‌ها نیست.")
             return
-        file_type, _ = QInputDialog.getItem(self, "انتخاب فرمت", "فرمت فایل را انتخاب کنید:", ["TXT", "JSON", "CSV"], 0, False)
+        file_type, _ = QInputDialog.getItem(self, "انتخاب فرمت", "فرمت فایل را انتخاب کنید:", ["TXT", "JSON", "CSV", "NDJSON"], 0, False)
         if file_type:
             self._export_data_logic(self.completed_downloads, file_type.lower())
 
+    def import_download_archive(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "وارد کردن آرشیو yt-dlp", "", "آرشیو (*.txt);;همه فایل‌ها (*)")
+        if not file_path:
+            return
+        self.status_label.setText("در حال وارد کردن آرشیو دانلود...")
+        self.thread_pool.submit(self._import_download_archive, file_path)
+
+    def _import_download_archive(self, file_path):
+        try:
+            added = self.archive.import_file(file_path)
+            self.ui_update_signal.emit(f"{added} مورد جدید به آرشیو دانلود اضافه شد.", False)
+        except (OSError, sqlite3.Error) as e:
+            self.ui_update_signal.emit(f"خطا در وارد کردن آرشیو: {e}", False)
+
+    def export_download_archive(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "خروجی آرشیو yt-dlp", "archive.txt", "آرشیو (*.txt)")
+        if not file_path:
+            return
+        try:
+            self.archive.export_file(file_path)
+            self.log_message(f"آرشیو دانلود در {os.path.basename(file_path)} ذخیره شد.")
+        except (OSError, sqlite3.Error) as e:
+            self.log_message(f"خطا در ذخیره آرشیو: {e}")
+            QMessageBox.critical(self, "خطا", f"خطا در ذخیره آرشیو: {e}")
+
     def _get_field_key(self, field_name):
         translation_map = {
             "عنوان": "title", "URL": "url", "حجم": "filesize_str",
             "تعداد بازدید": "view_count", "تاریخ آپلود": "upload_date",
-            "کیفیت": "quality", "مسیر ذخیره": "download_path",
-            "لینک تامنیل": "thumbnail_url"
+            "کیفیت": "quality", "مسیر ذخیره": "download_path", "پوشه ذخیره‌سازی": "output_root",
+            "لینک تامنیل": "thumbnail_url", "SHA-256": "sha256"
         }
         return translation_map.get(field_name, field_name.lower().replace(" ", "_"))
 
     def clear_queue(self):
-        if self.active_downloads:
+        if self.active_jobs:
             QMessageBox.warning(self, "عملیات ناموفق", "لطفاً ابتدا تمام دانلودهای فعال را لغو کنید.")
             return
         self.table.setRowCount(0)
         self.download_queue = []
         self.id_to_row = {}
+        self.restore_cursor = 0
+        self.unresolved = {}
+        self.start_after_resolve = set()
         self.save_queue()
         self.status_label.setText("صف پاک شد.")
         self.log_message("صف دانلود پاک شد.")
@@ -1138,47 +3812,268 @@ class App(QWidget):
             return
         self.add_btn.setEnabled(False)
         self.cancel_add_btn.setEnabled(True)
+        self.stop_add_btn.setEnabled(True)
         self.fetch_cancelled = False
+        self.fetch_stopped = False
         self.status_label.setText("در حال دریافت اطلاعات...")
         self.thread_pool.submit(self._fetch_and_add, url)
 
     def cancel_add_to_queue(self):
         self.fetch_cancelled = True
+        self._terminate_fetch_processes()
         self.status_label.setText("اضافه کردن لغو شد.")
         self.add_btn.setEnabled(True)
         self.cancel_add_btn.setEnabled(False)
+        self.stop_add_btn.setEnabled(False)
         self.url_input.clear()
 
+    def stop_add_to_queue(self):
+        # Entries already received are still inserted
+        self.fetch_stopped = True
+        self._terminate_fetch_processes()
+        self.stop_add_btn.setEnabled(False)
+        self.status_label.setText("توقف دریافت؛ موارد دریافت‌شده حفظ می‌شوند.")
+
+    def _terminate_fetch_processes(self, processes=None):
+        for process in list(self.fetch_processes if processes is None else processes):
+            if process.poll() is None:
+                process.terminate()
+
+    def _stream_flat_entries(self, yt_path, url, processes=None, reverse=False):
+        """Yield entries of `url` as yt-dlp prints them (one JSON object per line).
+
+        --lazy-playlist makes yt-dlp print each page as it arrives instead of
+        enumerating the whole playlist first; closing the generator early kills
+        the child, so only the pages actually consumed are fetched. `reverse`
+        needs the whole list first, so it gives that up.
+        """
+        order = ["--playlist-reverse"] if reverse else ["--lazy-playlist"]
+        cmd = [yt_path, "--flat-playlist"] + order + ["-j", url]
+        with tempfile.TemporaryFile(mode='w+', encoding='utf-8') as stderr_file:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file, text=True, encoding='utf-8',
+                                       bufsize=1, creationflags=CREATION_FLAGS)
+            processes = self.fetch_processes if processes is None else processes
+            processes.add(process)
+            try:
+                for line in process.stdout:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError as e:
+                        self.log_signal.emit(f"خطا در تجزیه خروجی yt-dlp: {e}")
+                process.wait()
+                if process.returncode != 0 and not (self.fetch_cancelled or self.fetch_stopped):
+                    stderr_file.seek(0)
+                    raise subprocess.CalledProcessError(process.returncode, cmd, stderr=stderr_file.read())
+            finally:
+                if process.poll() is None:
+                    process.terminate()
+                    process.wait()
+                processes.discard(process)
+
+    def _stream_into_queue(self, yt_path, url, fetched=0):
+        """Insert the entries of `url` into the queue chunk by chunk; returns the running count."""
+        chunk = []
+        last_emit = time.monotonic()
+        entries = self._stream_flat_entries(yt_path, url)
+        try:
+            for entry in entries:
+                if self.fetch_cancelled or self.fetch_stopped:
+                    break
+                chunk.append(entry)
+                fetched += 1
+                if len(chunk) >= FETCH_CHUNK_SIZE or time.monotonic() - last_emit >= FETCH_CHUNK_INTERVAL:
+                    self.video_info_loaded.emit(chunk)
+                    self.ui_update_signal.emit(f"در حال دریافت... {fetched} مورد", False)
+                    chunk = []
+                    last_emit = time.monotonic()
+        finally:
+            entries.close()
+            if chunk and not self.fetch_cancelled:
+                self.video_info_loaded.emit(chunk)
+        return fetched
+
+    def _apply_partial_file_state(self, item, ext):
+        partial_exists, part_path, part_size = check_partial_file(self._root_paths(), item['title'], ext, self.file_index)
+        if partial_exists:
+            item.set_status(ItemStatus.PAUSED)
+            # تخمین حجم دانلود شده از فایل part
+            item.downloaded_bytes = part_size
+
+    def _metadata_tick(self):
+        if not self.unresolved:
+            self.metadata_timer.stop()
+            return
+        while self.metadata_batches < METADATA_WORKERS:
+            batch, background = self._next_metadata_batch()
+            if not batch:
+                break
+            self.metadata_batches += 1
+            self.metadata_background_batches += background
+            self.metadata_in_flight.update(item_id for item_id, _, _ in batch)
+            self.metadata_pool.submit(self._resolve_metadata_batch, batch, background)
+
+    def _next_metadata_batch(self):
+        """Pick up to METADATA_BATCH_SIZE unresolved items: requested starts and visible rows, then the
+        scheduler's next items, then (on a single worker) whatever is left."""
+        def wanted(item_id):
+            return item_id in self.unresolved and item_id not in self.metadata_in_flight and item_id in self.id_to_row
+
+        def take(ids):
+            # (item id, url, extractor's video id that the -j output is matched on)
+            items = [self.download_queue[self.id_to_row[item_id]] for item_id in ids[:METADATA_BATCH_SIZE]]
+            return [(item['id'], item['url'], item['archive_id'].split(" ", 1)[1]) for item in items]
+
+        urgent = [item_id for item_id in self.start_after_resolve if wanted(item_id)]
+        first = self.table.rowAt(0)
+        if first != -1:
+            last = self.table.rowAt(self.table.viewport().height() - 1)
+            last = self.table.rowCount() - 1 if last == -1 else last
+            urgent += [self.download_queue[row]['id'] for row in range(first, min(last + 1, len(self.download_queue)))
+                       if not self.table.isRowHidden(row) and wanted(self.download_queue[row]['id'])]
+        if urgent:
+            return take(urgent), False
+
+        upcoming = []
+        seen = 0
+        for item in self.download_queue:
+            if item.status not in WAITING_STATUSES:
+                continue
+            seen += 1
+            if wanted(item['id']):
+                upcoming.append(item['id'])
+            if seen >= METADATA_LOOKAHEAD or len(upcoming) >= METADATA_BATCH_SIZE:
+                break
+        if upcoming:
+            return take(upcoming), False
+
+        if self.metadata_background_batches >= METADATA_BACKGROUND_WORKERS:
+            return [], False
+        rest = []
+        for item_id in list(self.unresolved):
+            if item_id not in self.id_to_row:
+                del self.unresolved[item_id]  # Removed from the queue meanwhile
+            elif item_id not in self.metadata_in_flight:
+                rest.append(item_id)
+                if len(rest) >= METADATA_BATCH_SIZE:
+                    break
+        return take(rest), True
+
+    def _resolve_metadata_batch(self, batch, background):
+        """One yt-dlp -j run over a batch of URLs; each result is sent as soon as it is printed."""
+        remaining = {video_id: item_id for item_id, _, video_id in batch}
+        try:
+            if not self.yt_dlp_path:
+                return
+            cmd = [self.yt_dlp_path, "-j", "--no-playlist", "--ignore-errors"] + [url for _, url, _ in batch]
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                                       encoding='utf-8', creationflags=CREATION_FLAGS)
+            self.metadata_processes.add(process)
+            try:
+                for line in process.stdout:
+                    try:
+                        info = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    item_id = remaining.pop(info.get('id'), None)
+                    if item_id:
+                        trimmed = {key: info.get(key) for key in METADATA_KEYS}
+                        trimmed['formats'] = format_inventory(info)
+                        self.metadata_resolved.emit(item_id, trimmed)
+                process.wait()
+            finally:
+                self.metadata_processes.discard(process)
+        except OSError as e:
+            self.log_signal.emit(f"خطا در دریافت اطلاعات: {e}")
+        finally:
+            for item_id in remaining.values():
+                self.metadata_resolved.emit(item_id, {})
+            self.metadata_batch_done.emit(background)
+
+    def _on_metadata_batch_done(self, background):
+        self.metadata_batches -= 1
+        self.metadata_background_batches -= background
+
+    def _on_metadata_resolved(self, item_id, info):
+        self.metadata_in_flight.discard(item_id)
+        self.unresolved.pop(item_id, None)
+        row = self.id_to_row.get(item_id)
+        if row is None:
+            return
+        item = self.download_queue[row]
+        placeholder = item.pop('needs_metadata', False)
+        if not item.pop('needs_formats', False) and not placeholder:
+            return
+        if info.get('formats'):
+            item['formats'] = info['formats']
+        if not placeholder:
+            self._update_item_size(item)
+            if self.table.item(row, 0) is not None:
+                self.table.setItem(row, 2, QTableWidgetItem(item.filesize_str))
+                self._refresh_quality_combo(row, item)
+            self.schedule_save_queue()
+            return
+        if info:
+            item['title'] = info.get('title') or item['title']
+            item.filesize = info.get('filesize_approx', info.get('filesize'))
+            item.duration = info.get('duration')
+            item['view_count'] = info.get('view_count') or 0
+            item['upload_date'] = info.get('upload_date') or ""
+            item['thumbnail_url'] = info.get('thumbnail') or ""
+            self._update_item_size(item)
+        else:
+            # Left to the download itself to report; the video id keeps the file name usable
+            item['title'] = item['archive_id'].split(" ", 1)[1] if item.get('archive_id') else item['url']
+            self.log_message(f"دریافت اطلاعات ناموفق بود: {item['url']}")
+        ext = get_output_ext(item, self.settings)
+        exists, path = check_file_exists(self._root_paths(), item['title'], ext, self.file_index)
+        if exists:
+            self._complete_item(item_id, path)
+            self.schedule_save_queue()
+            return
+        self._apply_partial_file_state(item, ext)
+        if self.table.item(row, 0) is not None:
+            self._refresh_quality_combo(row, item)
+            self.table.setItem(row, 0, QTableWidgetItem(item['title']))
+            self.table.setItem(row, 2, QTableWidgetItem(item.filesize_str))
+            self.table.setItem(row, 3, QTableWidgetItem(item.duration_str))
+            self.table.setItem(row, 7, QTableWidgetItem(item.status.label))
+            self.table.setItem(row, 9, QTableWidgetItem(item.downloaded_size))
+        self.schedule_save_queue()
+        if item_id in self.start_after_resolve:
+            self.start_after_resolve.discard(item_id)
+            self._start_single_download(row, item, resume=item.status == ItemStatus.PAUSED)
+        elif self.downloading_all:
+            self._start_next_downloads()
+
     def _fetch_and_add(self, url):
         yt_path = self.yt_dlp_path
         if not yt_path:
             self.ui_update_signal.emit("خطا: yt-dlp در دسترس نیست.", True)
             return
+        status = "آماده."
         try:
-            # Use --flat-playlist for playlists
-            cmd = [yt_path, "--flat-playlist", "-J", url]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True, creationflags=CREATION_FLAGS)
-            info = json.loads(result.stdout.strip()) if result.stdout.strip() else {}
-
-            if self.fetch_cancelled:
-                return
-
-            if 'entries' in info:
-                entries = info.get('entries', [])
-                self.video_info_loaded.emit(entries)  # ارسال batch کامل
-            else:
-                self.video_info_loaded.emit([info])
+            fetched = self._stream_into_queue(yt_path, url)
+            if self.fetch_stopped:
+                status = f"دریافت متوقف شد؛ {fetched} مورد نگه داشته شد."
+                self.log_signal.emit(status)
+            elif not self.fetch_cancelled:
+                status = f"{fetched} مورد دریافت شد."
         except Exception as e:
             if not self.fetch_cancelled:
-                self.ui_update_signal.emit(f"خطا در دریافت اطلاعات: {e}", True)
-                self.log_message(f"خطا در دریافت اطلاعات: {e}")
+                status = f"خطا در دریافت اطلاعات: {e}"
+                self.log_signal.emit(f"خطا در دریافت اطلاعات: {e}")
         finally:
-            self.ui_update_signal.emit("آماده.", True)
+            self.ui_update_signal.emit(status, True)
             QMetaObject.invokeMethod(self, "reset_add_buttons", Qt.QueuedConnection)
 
+    @Slot()
     def reset_add_buttons(self):
         self.add_btn.setEnabled(True)
         self.cancel_add_btn.setEnabled(False)
+        self.stop_add_btn.setEnabled(False)
         self.url_input.clear()
 
     def update_ui_from_thread(self, status_text, enable_button):
@@ -1186,14 +4081,127 @@ class App(QWidget):
         if enable_button:
             self.add_btn.setEnabled(True)
             self.cancel_add_btn.setEnabled(False)
+            self.stop_add_btn.setEnabled(False)
+
+    def load_subscriptions(self):
+        self.subscriptions = load_json_file(SUBSCRIPTIONS_PATH, [])
+
+    def save_subscriptions(self):
+        save_json_file(SUBSCRIPTIONS_PATH, self.subscriptions)
+
+    def show_storage_roots_dialog(self):
+        dialog = StorageRootsDialog(self._output_roots(), self)
+        if dialog.exec():
+            self.settings["output_roots"] = dialog.get_roots()
+            self.save_settings()
+            self._apply_output_roots()
+
+    def show_schedule_dialog(self):
+        dialog = ScheduleDialog(self.settings.get("schedule", []), self)
+        if dialog.exec():
+            self.settings["schedule"] = dialog.get_schedule()
+            self.save_settings()
+            self._apply_schedule()
+
+    def show_proxy_stats_dialog(self):
+        ProxyStatsDialog(self).exec()
+
+    def show_subscriptions_dialog(self):
+        dialog = SubscriptionsDialog(self)
+        self.subscription_synced.connect(dialog.refresh)
+        dialog.exec()
+        self.subscription_synced.disconnect(dialog.refresh)
+
+    def add_subscription(self, url):
+        if any(sub['url'] == url for sub in self.subscriptions):
+            self.log_message(f"اشتراک تکراری: {url}")
+            return
+        self.subscriptions.append({"url": url, "title": "", "seen_ids": [], "baselined": False, "last_sync": 0, "new_total": 0})
+        self.save_subscriptions()
+        self.log_message(f"اشتراک اضافه شد: {url}")
+        self.sync_due_subscriptions()
+
+    def remove_subscription(self, url):
+        self.subscriptions = [sub for sub in self.subscriptions if sub['url'] != url]
+        self.save_subscriptions()
+        self.log_message(f"اشتراک حذف شد: {url}")
 
-    def _add_batch_to_table_from_thread(self, video_infos):
+    def sync_due_subscriptions(self, force=False):
+        if not self.yt_dlp_path:
+            return
+        interval = self.settings.get("subscription_sync_hours", 24) * 3600
+        now = time.time()
+        for sub in self.subscriptions:
+            if sub['url'] in self.syncing_subscriptions:
+                continue
+            if force or now - sub.get('last_sync', 0) >= interval:
+                self.syncing_subscriptions.add(sub['url'])
+                self.thread_pool.submit(self._sync_subscription, sub['url'], list(sub.get('seen_ids', [])),
+                                        not self._subscription_baselined(sub))
+
+    @staticmethod
+    def _subscription_baselined(sub):
+        # Subscriptions saved before the flag existed had their baseline once they remembered any ID
+        return sub.get('baselined', bool(sub.get('seen_ids')))
+
+    def _sync_subscription(self, url, seen_ids, baseline):
+        """Enumerate `url` newest-first until the first entry seen on an earlier sync.
+
+        A baseline (first) sync only remembers what exists and enqueues nothing.
+        """
+        seen = set(seen_ids)
+        limit = SUBSCRIPTION_BASELINE_ENTRIES if baseline else SUBSCRIPTION_MAX_NEW_ENTRIES
+        new_entries = []
+        title = ""
+        entries = self._stream_flat_entries(self.yt_dlp_path, url, processes=self.subscription_processes,
+                                            reverse=is_playlist_url(url))
+        try:
+            for entry in entries:
+                title = title or entry.get('playlist_title') or entry.get('playlist') or entry.get('channel') or ""
+                if entry.get('id') in seen:
+                    break
+                new_entries.append(entry)
+                if len(new_entries) >= limit:
+                    break
+        except Exception as e:
+            self.log_signal.emit(f"خطا در همگام‌سازی اشتراک {url}: {e}")
+            self.subscription_synced.emit(url, [], title, False)
+            return
+        finally:
+            entries.close()
+
+        if new_entries and not baseline:
+            self.subscription_entries_loaded.emit(new_entries)
+        self.subscription_synced.emit(url, [e['id'] for e in new_entries if e.get('id')], title, True)
+
+    def _add_subscription_batch(self, video_infos):
+        self._add_batch_to_table_from_thread(video_infos, cancellable=False)
+
+    def _on_subscription_synced(self, url, new_ids, title, ok):
+        self.syncing_subscriptions.discard(url)
+        sub = next((s for s in self.subscriptions if s['url'] == url), None)
+        if sub is None:
+            return
+        if title and not sub.get('title'):
+            sub['title'] = title
+        if ok:
+            was_baseline = not self._subscription_baselined(sub)
+            sub['baselined'] = True
+            sub['seen_ids'] = (new_ids + sub.get('seen_ids', []))[:SUBSCRIPTION_SEEN_LIMIT]
+            sub['last_sync'] = time.time()
+            if not was_baseline:
+                sub['new_total'] = sub.get('new_total', 0) + len(new_ids)
+                self.log_message(f"همگام‌سازی اشتراک '{sub['title'] or url}': {len(new_ids)} مورد جدید")
+        self.save_subscriptions()
+
+    def _add_batch_to_table_from_thread(self, video_infos, cancellable=True):
         new_items = []
+        queued_urls = {item['url'] for item in self.download_queue}
         for video_info in video_infos:
-            if self.fetch_cancelled:
+            if cancellable and self.fetch_cancelled:
                 return
             url = video_info.get("webpage_url", video_info.get("url", ""))
-            if any(item['url'] == url for item in self.download_queue):
+            if url in queued_urls:
                 self.log_message(f"URL تکراری: {url}")
                 continue
 
@@ -1205,105 +4213,124 @@ class App(QWidget):
                     url = f"https://www.youtube.com/watch?v={video_id_or_url}"
                 video_info['webpage_url'] = url
 
-            filesize = video_info.get('filesize_approx', video_info.get('filesize'))
-            filesize_str = format_file_size(filesize)
-            duration_str = format_duration(video_info.get('duration'))
+            duration = video_info.get('duration')
             thumbnail_url = video_info.get('thumbnail') or video_info.get('thumbnails', [{}])[-1].get('url', '')
 
             item_id = str(uuid.uuid4())
+            queued_urls.add(url)
             
-            item = {
-                "id": item_id,
-                "title": video_info.get("title", "نامشخص"),
-                "url": url,
-                "filesize_str": filesize_str,
-                "duration_str": duration_str,
-                "view_count": video_info.get("view_count", 0),
-                "upload_date": video_info.get("upload_date", ""),
-                "status": "در صف",
-                "quality": self.settings.get("quality", "بهترین"),
-                "format": self.settings.get("format", "ویدیو و صدا"),
-                "video_format": self.settings.get("video_format", "mp4"),
-                "subtitle_lang": self.settings.get("subtitle_lang", "هیچ"),
-                "download_path": None,
-                "thumbnail_url": thumbnail_url,
-                "downloaded_size": "0 B"  # مقدار اولیه حجم دانلود شده
-            }
-
-            ext = 'mp3' if item["format"] == "فقط صدا" else item["video_format"]
-            exists, path = check_file_exists(self.settings.get("save_folder"), item['title'], ext)
-            if exists:
-                item['status'] = "دانلود شده"
-                item['download_path'] = path
+            item = QueueItem(
+                id=item_id,
+                title=video_info.get("title", "نامشخص"),
+                url=url,
+                filesize=video_info.get('filesize_approx', video_info.get('filesize')),
+                duration=round(duration) if duration is not None else None,
+                view_count=video_info.get("view_count", 0),
+                upload_date=video_info.get("upload_date", ""),
+                quality=self.settings.get("quality", "بهترین"),
+                format=self.settings.get("format", "ویدیو و صدا"),
+                video_format=self.settings.get("video_format", "mp4"),
+                audio_format=self.settings.get("audio_format", "mp3"),
+                subtitle_lang=self.settings.get("subtitle_lang", "هیچ"),
+                thumbnail_url=thumbnail_url,
+                archive_id=archive_key(video_info)
+            )
+
+            placeholder = video_info.get('placeholder', False)
+            if placeholder:
+                item['needs_metadata'] = True
+            ext = get_output_ext(item, self.settings)
+            if placeholder:
+                exists, path = False, None  # Checked once the title is known
+            else:
+                exists, path = check_file_exists(self._root_paths(), item['title'], ext, self.file_index)
+            in_archive = bool(item['archive_id']) and self.settings.get("use_download_archive", True) and self.archive.contains(item['archive_id'])
+            if in_archive:
+                self.log_message(f"در آرشیو دانلود موجود است: {item['title']}")
+            if exists or in_archive:
+                item.set_status(ItemStatus.DONE)
+                # Archived items whose file is gone have no path to open
+                item['download_path'] = path if exists else None
                 self.completed_downloads.append(item)
                 self.update_completed_table_row(self.completed_table.rowCount(), item)
             else:
-                partial_exists, part_path = check_partial_file(self.settings.get("save_folder"), item['title'], ext)
-                if partial_exists:
-                    item['status'] = "متوقف شده"
-                    # تخمین حجم دانلود شده از فایل part
-                    if os.path.exists(part_path):
-                        item['downloaded_size'] = format_file_size(os.path.getsize(part_path))
+                if not placeholder:
+                    self._apply_partial_file_state(item, ext)
+                    if item['archive_id'] and self.settings.get("fetch_format_inventory", True):
+                        item['needs_formats'] = True  # Exact size and real qualities, resolved in the background
                 new_items.append(item)
         
         # اضافه کردن batch به queue و table
         if new_items:
             start_row = self.table.rowCount()
+            restoring = self.restore_cursor < start_row
             self.table.setRowCount(start_row + len(new_items))
             for i, item in enumerate(new_items):
                 self.download_queue.append(item)
                 self.id_to_row[item['id']] = start_row + i
-                self.update_table_row(start_row + i, item)
-                self.status_label.setText(f"'{item['title']}' به صف اضافه شد.")
-                self.log_message(f"اضافه شدن به صف: {item['title']}")
-
-        self.save_queue()
+                if item.get('needs_metadata') or item.get('needs_formats'):
+                    self.unresolved[item['id']] = None
+            if len(new_items) <= FETCH_CHUNK_SIZE:
+                for i, item in enumerate(new_items):
+                    self.update_table_row(start_row + i, item)
+                    self.log_message(f"اضافه شدن به صف: {item['title']}")
+                if not restoring:
+                    self.restore_cursor = self.table.rowCount()
+            else:
+                # Large imports: rows get their widgets progressively, like the startup restore
+                self.log_message(f"اضافه شدن {len(new_items)} مورد به صف.")
+                if not restoring:
+                    self._restore_queue_chunk(QUEUE_RESTORE_FIRST_CHUNK)
+            self.status_label.setText(f"{len(new_items)} مورد به صف اضافه شد (مجموع: {len(self.download_queue)}).")
+            if self.unresolved and not self.metadata_timer.isActive():
+                self.metadata_timer.start(METADATA_TICK_MS)
 
-    def _fetch_and_add_list(self, urls):
-        yt_path = self.yt_dlp_path
-        if not yt_path:
-            self.ui_update_signal.emit("خطا: yt-dlp در دسترس نیست.", True)
-            return
-        batch_size = 500  # افزایش batch size برای لیست‌های بزرگ
-        all_entries = []
-        for i in range(0, len(urls), batch_size):
-            if self.fetch_cancelled:
-                return
-            batch = urls[i:i+batch_size]
-            for url in batch:
-                if self.fetch_cancelled:
-                    return
-                try:
-                    cmd = [yt_path, "--flat-playlist", "-J", url]
-                    result = subprocess.run(cmd, capture_output=True, text=True, check=True, creationflags=CREATION_FLAGS)
-                    info = json.loads(result.stdout.strip()) if result.stdout.strip() else {}
-                    if 'entries' in info:
-                        all_entries.extend(info.get('entries', []))
-                    else:
-                        all_entries.append(info)
-                except Exception as e:
-                    self.log_message(f"خطا در دریافت اطلاعات URL {url}: {e}")
-                time.sleep(0.05)  # sleep کم برای جلوگیری از overload
-            # ارسال batch به UI
-            self.video_info_loaded.emit(all_entries)
-            all_entries = []  # ریست برای batch بعدی
-        self.ui_update_signal.emit("وارد کردن آدرس‌ها به پایان رسید.", True)
+        # Chunks arrive rapidly during playlist expansion; write the queue once they settle
+        self.schedule_save_queue()
 
     def restore_queue_to_table(self):
+        # Rows are reserved and mapped up front (cheap); cells and widgets are
+        # created for the first screenful now and for the rest from the event loop.
         self.table.setRowCount(len(self.download_queue))
-        for row, item in enumerate(self.download_queue):
-            self.id_to_row[item['id']] = row
-            self.update_table_row(row, item)
+        self._update_id_to_row_map()
+        self.restore_cursor = 0
+        self._restore_queue_chunk(QUEUE_RESTORE_FIRST_CHUNK)
+
+    def _restore_queue_chunk(self, chunk_size=QUEUE_RESTORE_CHUNK):
+        start = self.restore_cursor
+        end = min(start + chunk_size, len(self.download_queue), self.table.rowCount())
+        for row in range(start, end):
+            self._ensure_row_populated(row)
+        self.restore_cursor = end
+        search_text = self.search_input.text()
+        if search_text:
+            self._apply_filter_to_rows(search_text, range(start, end))
+
+        total = len(self.download_queue)
+        if end < total:
+            self.status_label.setText(f"بارگذاری صف: {end} از {total}")
+            QTimer.singleShot(0, self._restore_queue_chunk)
+        else:
+            elapsed_ms = (time.perf_counter() - self.startup_time) * 1000
+            logging.info(f"Queue restored: {total} items in {elapsed_ms:.0f} ms")
+            self.status_label.setText(f"صف بارگذاری شد: {total} مورد")
+
+    def _ensure_row_populated(self, row):
+        """Create the cells of a row that progressive restoration has not reached yet."""
+        if self.table.item(row, 0) is None and 0 <= row < len(self.download_queue):
+            self.update_table_row(row, self.download_queue[row])
 
     def update_table_row(self, row, item):
         self.table.setItem(row, 0, QTableWidgetItem(item.get("title")))
         self.table.setItem(row, 1, QTableWidgetItem(item.get("url")))
-        self.table.setItem(row, 2, QTableWidgetItem(item.get("filesize_str")))
-        self.table.setItem(row, 3, QTableWidgetItem(item.get("duration_str")))
+        self.table.setItem(row, 2, QTableWidgetItem(item.filesize_str))
+        self.table.setItem(row, 3, QTableWidgetItem(item.duration_str))
         
         quality_combo = QComboBox()
-        quality_combo.addItems(QUALITY_OPTIONS)
-        quality_combo.setCurrentText(item.get("quality", "بهترین"))
+        options = quality_options(item.get('formats'))
+        quality_combo.addItems(options)
+        item['quality'] = closest_quality(item.get("quality", "بهترین"), options)
+        quality_combo.setCurrentText(item['quality'])
         quality_combo.currentTextChanged.connect(lambda text: self._update_item_field(row, 'quality', text))
         self.table.setCellWidget(row, 4, quality_combo)
         
@@ -1311,6 +4338,8 @@ class App(QWidget):
         format_combo.addItems(FORMAT_OPTIONS)
         format_combo.setCurrentText(item.get("format", self.settings.get("format", "ویدیو و صدا")))
         format_combo.currentTextChanged.connect(lambda text: self._update_item_field(row, 'format', text))
+        if item.get('extra_outputs'):
+            format_combo.setToolTip("خروجی‌های اضافه: " + ", ".join(item['extra_outputs']))
         self.table.setCellWidget(row, 5, format_combo)
         
         subtitle_combo = QComboBox()
@@ -1319,19 +4348,77 @@ class App(QWidget):
         subtitle_combo.currentTextChanged.connect(lambda text: self._update_item_field(row, 'subtitle_lang', text))
         self.table.setCellWidget(row, 6, subtitle_combo)
         
-        self.table.setItem(row, 7, QTableWidgetItem(item.get("status")))
-        self.table.setCellWidget(row, 8, QProgressBar())
-        self.table.setItem(row, 9, QTableWidgetItem(item.get("downloaded_size", "0 B")))  # ستون حجم دانلود شده
+        self.table.setItem(row, 7, QTableWidgetItem(item.status.label))
+        progress_bar = QProgressBar()
+        progress_bar.setValue(int(self.download_percent.get(item.id, 0)))
+        self.table.setCellWidget(row, 8, progress_bar)
+        self.table.setItem(row, 9, QTableWidgetItem(item.downloaded_size))  # ستون حجم دانلود شده
         self.table.setItem(row, 10, QTableWidgetItem(""))  # سرعت
         self.table.setItem(row, 11, QTableWidgetItem(""))  # زمان باقی‌مانده
 
+    def set_extra_outputs(self, rows):
+        rows = [row for row in rows if 0 <= row < len(self.download_queue)]
+        if not rows:
+            return
+        dialog = OutputsDialog(self.download_queue[rows[0]].get('extra_outputs') or [], self)
+        if not dialog.exec():
+            return
+        outputs = dialog.get_selected_outputs()
+        busy = (ItemStatus.DOWNLOADING, ItemStatus.POSTPROCESS_WAIT, ItemStatus.POSTPROCESSING)
+        for row in rows:
+            item = self.download_queue[row]
+            if item.status in busy:
+                self.log_message(f"تغییر خروجی‌ها برای مورد در حال دانلود ممکن نیست: {item['title']}")
+                continue
+            item['extra_outputs'] = outputs
+            if item.get('formats'):
+                self._update_item_size(item)
+                self.table.setItem(row, 2, QTableWidgetItem(item.filesize_str))
+            format_combo = self.table.cellWidget(row, 5)
+            if format_combo:
+                format_combo.setToolTip("خروجی‌های اضافه: " + ", ".join(outputs) if outputs else "")
+        self.save_queue()
+        self.log_message(f"خروجی‌های اضافه برای {len(rows)} مورد: {', '.join(outputs) or 'هیچ'}")
+
+    def _refresh_quality_combo(self, row, item):
+        """Offer only the qualities in the item's format inventory."""
+        quality_combo = self.table.cellWidget(row, 4)
+        if quality_combo is None:
+            return
+        options = quality_options(item.get('formats'))
+        item['quality'] = closest_quality(item.get('quality', "بهترین"), options)
+        quality_combo.blockSignals(True)
+        quality_combo.clear()
+        quality_combo.addItems(options)
+        quality_combo.setCurrentText(item['quality'])
+        quality_combo.blockSignals(False)
+        self._update_item_size(item)
+        self.table.setItem(row, 2, QTableWidgetItem(item.filesize_str))
+
+    def _update_item_size(self, item):
+        """Exact byte size of what the item's selector picks from its format inventory."""
+        if not item.get('formats'):
+            return
+        picked = select_formats(item['formats'], item_format_selector(item, self.settings))
+        if picked and all(fmt['size'] for fmt in picked):
+            item['selected_size'] = sum(fmt['size'] for fmt in picked)
+        else:
+            item.pop('selected_size', None)
+
     def _update_item_field(self, row, field, value):
         if 0 <= row < len(self.download_queue):
-            self.download_queue[row][field] = value
+            item = self.download_queue[row]
+            item[field] = value
+            if field in ('quality', 'format') and item.get('formats'):
+                self._update_item_size(item)
+                self.table.setItem(row, 2, QTableWidgetItem(item.filesize_str))
             self.save_queue()
 
     def filter_table(self, text):
-        for row in range(self.table.rowCount()):
+        self._apply_filter_to_rows(text, range(min(self.restore_cursor, self.table.rowCount())))
+
+    def _apply_filter_to_rows(self, text, rows):
+        for row in rows:
             title_item = self.table.item(row, 0)
             url_item = self.table.item(row, 1)
             match = (
@@ -1340,6 +4427,22 @@ class App(QWidget):
             )
             self.table.setRowHidden(row, not match)
 
+    def sort_queue(self, column):
+        """Reorder the queue by a raw value (size or duration); clicking the column again reverses it.
+        Items whose value is unknown go last either way."""
+        key = QUEUE_SORT_KEYS.get(column)
+        if key is None or not self.download_queue:
+            return
+        descending = self.queue_sort == (column, False)
+        self.queue_sort = (column, descending)
+        known = sorted((item for item in self.download_queue if getattr(item, key) is not None),
+                       key=lambda item: getattr(item, key), reverse=descending)
+        self.download_queue = known + [item for item in self.download_queue if getattr(item, key) is None]
+        # Rows (and the row captured by each combo box) are rebuilt the same way as at startup
+        self.table.setRowCount(0)
+        self.restore_queue_to_table()
+        self.save_queue()
+
     def start_downloads(self):
         if not self.check_dependencies(silent=False):
             return
@@ -1357,61 +4460,488 @@ class App(QWidget):
         selected_rows = [index.row() for index in self.table.selectionModel().selectedRows()]
         for row in selected_rows:
             item = self.download_queue[row]
-            if item['status'] in ["در صف", "خطا", "لغو شده", "متوقف شده"]:
-                self._start_single_download(row, item, resume=item['status'] == "متوقف شده")
+            if item.status in STARTABLE_STATUSES:
+                self._start_by_hand(row, item)
                 self.log_message(f"شروع دانلود انتخاب شده: {item['title']}")
 
     def _start_next_downloads(self):
-        concurrency = self.settings.get("concurrency", 3)
-        while len(self.active_downloads) < concurrency:
-            next_item_tuple = next(((i, item) for i, item in enumerate(self.download_queue) if item['status'] == "در صف" or item['status'] == "متوقف شده"), None)
+        # A profile lowering concurrency or pausing new starts lets running downloads finish
+        concurrency = self.profile['concurrency']
+        held = set()
+        # Suspend-paused downloads keep their job but not their slot
+        while self.profile['allow_starts'] and len(self._transferring_jobs()) < concurrency:
+            if self.proxy_pool.proxies and not self.proxy_pool.has_capacity():
+                self._schedule_proxy_release()
+                break
+            active_ids = {job.id for job in self.active_jobs}
+            next_item_tuple = self._next_queued_item(active_ids | held)
             if not next_item_tuple:
                 break
             row, item = next_item_tuple
-            self._start_single_download(row, item, resume=item['status'] == "متوقف شده")
+            if not self._fits_on_disk(item):
+                # Smaller items further down may still fit
+                held.add(item['id'])
+                if len(held) >= DISK_HOLD_SCAN:
+                    break
+                continue
+            self._start_single_download(row, item, resume=item.status == ItemStatus.PAUSED)
+        self._hold_for_space(held)
+        # Refill the lookahead right away rather than on the next timer tick
+        self._prefetch_tick()
+
+    def _work_folder(self, item):
+        """Where the item downloads and post-processes: the folder an earlier attempt left partial
+        files in, else the scratch folder when one is set, else the save folder."""
+        if item.get('work_folder') and os.path.isdir(item['work_folder']):
+            return item['work_folder']
+        scratch = self.settings.get("scratch_folder")
+        return scratch if scratch and os.path.isdir(scratch) else self._output_root(item)
+
+    def _output_roots(self):
+        """Configured storage tiers; just the save folder until some are set up."""
+        return self.settings.get("output_roots") or [
+            {'path': self.settings.get("save_folder"), 'capacity_gb': 0, 'weight': 1, 'formats': [], 'sources': []}]
+
+    def _root_paths(self):
+        return [root['path'] for root in self._output_roots()]
+
+    def _apply_output_roots(self):
+        self.file_index.set_folders(self._root_paths())
+        roots = [root['path'] for root in self._output_roots() if root.get('capacity_gb')]
+        if roots:
+            self.thread_pool.submit(self._root_usage_job, roots)
+
+    def _root_usage_job(self, roots):
+        # What earlier sessions stored on each capped root; this session's files are added as they complete
+        self.root_usage_ready.emit({root: self.media_index.usage(root) for root in roots})
+
+    def _on_root_usage_ready(self, usage):
+        self.root_usage = usage
+
+    def _root_free_space(self, root):
+        """Free bytes on a root: the disk's free space, further limited by the root's capacity."""
+        try:
+            free = shutil.disk_usage(root['path']).free
+        except OSError:
+            return 0
+        if root.get('capacity_gb'):
+            free = min(free, root['capacity_gb'] * 1024 ** 3 - self.root_usage.get(root['path'], 0))
+        return max(0, free)
+
+    def _root_load(self):
+        """Root path -> items currently writing there (downloading, post-processing or being moved in)."""
+        busy_ids = ({job.id for job in self.active_jobs} | {worker.id for worker in self.active_postprocessing}
+                    | {job[0] for job in self.postprocess_queue} | self.moving)
+        load = {}
+        for item_id in busy_ids:
+            row = self.id_to_row.get(item_id)
+            root = self.download_queue[row].get('output_root') if row is not None else None
+            if root:
+                load[root] = load.get(root, 0) + 1
+        return load
+
+    def _placed_root(self, item):
+        """The root the item was given when it started, else where it would go now (None if nowhere fits)."""
+        roots = self._output_roots()
+        if item.get('output_root') in [root['path'] for root in roots]:
+            return item['output_root']
+        needed = (item.get('selected_size') or 0) * len(item_outputs(item, self.settings))
+        free = {root['path']: self._root_free_space(root) for root in roots}
+        return choose_output_root(roots, get_output_ext(item, self.settings), url_host(item['url']),
+                                  needed + self.settings.get("disk_headroom_mb", 512) * 1024 * 1024, free, self._root_load())
+
+    def _output_root(self, item):
+        return self._placed_root(item) or self.settings.get("save_folder")
+
+    def _space_needed(self, item):
+        """[(folder, bytes)] the item still needs to finish; empty while its size is unknown."""
+        size = item.get('selected_size')
+        if not size:
+            return []
+        left = size * (1 - self.download_percent.get(item['id'], 0) / 100)
+        outputs = len(item_outputs(item, self.settings))
+        work_folder = self._work_folder(item)
+        needs = [(work_folder, left * DISK_WORK_FACTOR + size * (outputs - 1))]
+        output_root = self._output_root(item)
+        if os.path.normpath(work_folder) != os.path.normpath(output_root):
+            needs.append((output_root, size * outputs))
+        return needs
+
+    def _fits_on_disk(self, item):
+        """Whether free space covers the item's needs on top of the running downloads' and the headroom."""
+        if self._placed_root(item) is None:
+            if item['id'] not in self.space_held:
+                self.log_message(f"هیچ پوشه ذخیره‌ای فضای کافی برای این مورد ندارد؛ در انتظار: {item['title']}")
+            return False
+        needed = {}  # st_dev -> [folder, bytes]
+        for job in self.active_jobs:
+            row = self.id_to_row.get(job.id)
+            for folder, size in self._space_needed(self.download_queue[row]) if row is not None else []:
+                self._add_space_need(needed, folder, size)
+        own = self._space_needed(item) or [(self._work_folder(item), 0)]
+        for folder, size in own:
+            self._add_space_need(needed, folder, size)
+        headroom = self.settings.get("disk_headroom_mb", 512) * 1024 * 1024
+        own_devices = {os.stat(folder).st_dev for folder, _ in own if os.path.isdir(folder)}
+        for device, (folder, size) in needed.items():
+            if device not in own_devices:
+                continue
+            try:
+                free = shutil.disk_usage(folder).free
+            except OSError:
+                continue  # Left to the download to report
+            if free < size + headroom:
+                if item['id'] not in self.space_held:
+                    self.log_message(f"فضای کافی در {folder} نیست (نیاز: {format_file_size(size + headroom)}، "
+                                     f"آزاد: {format_file_size(free)})؛ در انتظار: {item['title']}")
+                return False
+        return True
+
+    def _add_space_need(self, needed, folder, size):
+        try:
+            device = os.stat(folder).st_dev
+        except OSError:
+            return
+        needed.setdefault(device, [folder, 0])[1] += size
+
+    def _hold_for_space(self, held):
+        self.space_held = held
+        if held and not self.space_timer.isActive():
+            self.space_timer.start(DISK_RECHECK_MS)
+
+    def _on_space_recheck(self):
+        if self.downloading_all and self.space_held:
+            self._start_next_downloads()
+
+    def _next_queued_item(self, active_ids):
+        upcoming = self._upcoming_items(active_ids, 1)
+        return upcoming[0] if upcoming else None
+
+    def _upcoming_items(self, active_ids, limit):
+        """The next `limit` (row, item) pairs the scheduler would start, in order."""
+        # Items that keep stalling go after everything else; rate-limited hosts are skipped
+        cooling = self._cooling_hosts()
+        preferred, fallback = [], []
+        for i, item in enumerate(self.download_queue):
+            if item.status not in WAITING_STATUSES or item['id'] in active_ids or item.get('needs_metadata'):
+                continue
+            if cooling and url_host(item['url']) in cooling:
+                continue
+            if not stall_demoted(item):
+                preferred.append((i, item))
+                if len(preferred) >= limit:
+                    break
+            elif len(fallback) < limit:
+                fallback.append((i, item))
+        return (preferred + fallback)[:limit]
+
+    def _prefetch_tick(self):
+        """Keep the next PREFETCH_LOOKAHEAD items resolved while downloads are running."""
+        now = time.time()
+        for item_id, entry in list(self.prepared.items()):
+            if entry['expires'] - PREFETCH_EXPIRY_MARGIN <= now or item_id not in self.id_to_row:
+                self._discard_prepared(item_id)
+        if not (self.downloading_all or self.active_jobs) or not self.yt_dlp_path:
+            return
+        active_ids = {job.id for job in self.active_jobs}
+        for _, item in self._upcoming_items(active_ids, PREFETCH_LOOKAHEAD):
+            item_id = item['id']
+            if item_id in self.preparing or item_id in self.prepare_failed:
+                continue
+            selector = item_format_selector(item, self.settings)
+            entry = self.prepared.get(item_id)
+            if entry and entry['selector'] == selector and self._proxy_still_usable(entry['proxy']):
+                continue
+            self._discard_prepared(item_id)  # Quality, format or proxy changed since
+            # With a pool, resolved through the proxy the download will most likely be given
+            proxy = self.proxy_pool.best() if self.proxy_pool.proxies else self.settings.get("proxy") or None
+            self.preparing.add(item_id)
+            self.prefetch_pool.submit(self._prepare_item_job, item_id, item['url'], selector, proxy)
+
+    def _prepare_item_job(self, item_id, url, selector, proxy):
+        """Runs in prefetch_pool: yt-dlp -j for an upcoming item, saved for --load-info-json."""
+        path = os.path.join(PREPARED_DIR, f"{item_id}.info.json")
+        entry = {}
+        try:
+            cmd = [self.yt_dlp_path, "-j", "--no-playlist", "-f", selector] + (["--proxy", proxy] if proxy else []) + [url]
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                                       encoding='utf-8', creationflags=CREATION_FLAGS)
+            self.prefetch_processes.add(process)
+            try:
+                stdout, _ = process.communicate()
+            finally:
+                self.prefetch_processes.discard(process)
+            if process.returncode == 0 and stdout.strip():
+                info = json.loads(stdout)
+                with open(path + ".tmp", 'w', encoding='utf-8') as f:
+                    f.write(stdout)
+                os.replace(path + ".tmp", path)
+                entry = {'path': path, 'selector': selector, 'proxy': proxy, 'expires': stream_url_expiry(info)}
+        except (OSError, ValueError) as e:
+            logging.error(f"Pre-resolving {url} failed: {e}")
+        self.item_prepared.emit(item_id, entry)
+
+    def _on_item_prepared(self, item_id, entry):
+        self.preparing.discard(item_id)
+        if not entry:
+            self.prepare_failed.add(item_id)
+        elif item_id in self.id_to_row and self.download_queue[self.id_to_row[item_id]].status in WAITING_STATUSES:
+            self.prepared[item_id] = entry
+        elif os.path.exists(entry['path']):
+            os.remove(entry['path'])  # Started or removed while it was being resolved
+
+    def _proxy_still_usable(self, proxy):
+        if self.proxy_pool.proxies:
+            return self.proxy_pool.usable(proxy)
+        return proxy == (self.settings.get("proxy") or None)
+
+    def _discard_prepared(self, item_id):
+        entry = self.prepared.pop(item_id, None)
+        if entry and os.path.exists(entry['path']):
+            os.remove(entry['path'])
+
+    def _take_prepared(self, item_id, selector, proxy):
+        """Path of a still-valid pre-resolved info file for this exact selector and proxy, or None."""
+        entry = self.prepared.pop(item_id, None)
+        self.prepare_failed.discard(item_id)
+        if entry is None:
+            return None
+        if ((entry['selector'], entry['proxy']) != (selector, proxy)
+                or entry['expires'] - PREFETCH_EXPIRY_MARGIN <= time.time() or not os.path.exists(entry['path'])):
+            if os.path.exists(entry['path']):
+                os.remove(entry['path'])
+            return None
+        return entry['path']
+
+    def _record_host_event(self, host, event):
+        stats = self.host_stats.setdefault(host, {})
+        stats[event] = stats.get(event, 0) + 1
+        save_json_file(HOST_STATS_PATH, self.host_stats)
+
+    def _cooling_hosts(self):
+        now = time.time()
+        return {host for host, until in self.host_cooldowns.items() if until > now}
+
+    def _start_host_cooldown(self, url):
+        host = url_host(url)
+        until = self.host_cooldowns.get(host, 0)
+        if until > time.time():
+            return until  # Already cooling down; other slots hitting the same limit don't extend it
+        strikes = self.rate_limit_strikes.get(host, 0)
+        self.rate_limit_strikes[host] = strikes + 1
+        seconds = min(RATE_LIMIT_MAX_COOLDOWN, RATE_LIMIT_COOLDOWN * 2 ** strikes)
+        until = time.time() + seconds
+        self.host_cooldowns[host] = until
+        self._record_host_event(host, "rate_limited")
+        QTimer.singleShot(int(seconds * 1000) + 100, self._on_host_cooldown_expired)
+        self.log_message(f"محدودیت نرخ از سوی {host}: شروع دانلودهای جدید از این میزبان به مدت {int(seconds // 60)} دقیقه متوقف شد.")
+        return until
+
+    def _default_profile(self):
+        return {'concurrency': self.settings.get("concurrency", 3), 'rate_limit': 0, 'allow_starts': True}
+
+    def _apply_schedule(self):
+        """Switch to the profile the weekly schedule gives for now, leaving running downloads alone
+        unless their bandwidth share changed."""
+        profile = schedule_profile(self.settings.get("schedule", []), self._default_profile(), datetime.now())
+        if profile == self.profile:
+            return
+        self.profile = profile
+        rate = format_speed(profile['rate_limit']) if profile['rate_limit'] else "نامحدود"
+        self.log_message(f"برنامه زمانی: حداکثر {profile['concurrency']} دانلود همزمان، پهنای باند {rate}"
+                         + ("" if profile['allow_starts'] else "، بدون شروع دانلود جدید"))
+        self._rebalance_rate_limits()
+        if self.downloading_all:
+            self._start_next_downloads()
+
+    def _transferring_jobs(self):
+        # Suspended pauses move no bytes, so they get no share of the cap
+        return [job for job in self.active_jobs if not job.is_suspended]
+
+    def _rebalance_rate_limits(self):
+        """Split the profile's bandwidth cap evenly over the running downloads.
+
+        Deferred to the event loop, so a download ending and the next one starting
+        restart the others (set_rate_limit restarts on a change) at most once.
+        """
+        if not self.rate_shares_pending:
+            self.rate_shares_pending = True
+            QTimer.singleShot(0, self._apply_rate_shares)
+
+    def _apply_rate_shares(self):
+        self.rate_shares_pending = False
+        jobs = self._transferring_jobs()
+        for job in jobs:
+            job.set_rate_limit(slot_rate_limit(self.profile, len(jobs)))
+
+    def _on_host_cooldown_expired(self):
+        if self.downloading_all:
+            self._start_next_downloads()
+
+    def _release_proxy(self, item_id, ok):
+        """Give back the pool slot a finished download held; `ok` None for outcomes that say nothing about the proxy."""
+        self.suspended_proxies.pop(item_id, None)  # Its slot was already given back
+        proxy = self.download_proxies.pop(item_id, None)
+        if proxy and self.proxy_pool.release(proxy, ok):
+            self._on_proxy_quarantined(proxy)
+
+    def _on_proxy_quarantined(self, proxy):
+        until = time.strftime("%H:%M:%S", time.localtime(self.proxy_pool.stats[proxy]['quarantined_until']))
+        self.log_message(f"پروکسی {redact_proxy(proxy)} پس از خطاهای پیاپی تا {until} کنار گذاشته شد.")
+
+    def _schedule_proxy_release(self):
+        # Every pool proxy is busy or quarantined; wake the scheduler when the next quarantine ends
+        release_at = self.proxy_pool.next_release()
+        if release_at is None or release_at == self.proxy_release_at:
+            return
+        self.proxy_release_at = release_at
+        QTimer.singleShot(int((release_at - time.time()) * 1000) + 100, self._on_proxy_released)
+
+    def _on_proxy_released(self):
+        self.proxy_release_at = None
+        if self.downloading_all:
+            self._start_next_downloads()
+
+    def _schedule_retry(self, item_id, kind):
+        """Put a failed item on a backoff timer; returns False once it is out of attempts."""
+        row = self.id_to_row.get(item_id)
+        if row is None:
+            return False
+        item = self.download_queue[row]
+        attempt = item.get('retry_count', 0)
+        if attempt >= RETRY_MAX_ATTEMPTS:
+            return False
+        item['retry_count'] = attempt + 1
+        if kind == ERROR_RATE_LIMITED:
+            retry_at = self._start_host_cooldown(item['url']) + random.uniform(0, RETRY_BASE_DELAY)
+        else:
+            retry_at = time.time() + retry_delay(attempt)
+        item['retry_at'] = retry_at
+        QTimer.singleShot(int((retry_at - time.time()) * 1000), lambda: self._retry_item(item_id, retry_at))
+        return True
+
+    def _retry_item(self, item_id, retry_at):
+        row = self.id_to_row.get(item_id)
+        if row is None:
+            return
+        item = self.download_queue[row]
+        if item.status != ItemStatus.RETRY_WAIT or item.get('retry_at') != retry_at:
+            return  # Started by hand, removed or rescheduled meanwhile
+        host = url_host(item['url'])
+        if host in self._cooling_hosts():
+            item['retry_at'] = retry_at = self.host_cooldowns[host] + random.uniform(0, RETRY_BASE_DELAY)
+            QTimer.singleShot(int((retry_at - time.time()) * 1000), lambda: self._retry_item(item_id, retry_at))
+            return
+        self.log_message(f"تلاش مجدد {item['retry_count']}/{RETRY_MAX_ATTEMPTS}: {item['title']}")
+        if self.profile['allow_starts'] and len(self._transferring_jobs()) < self.profile['concurrency']:
+            self._start_single_download(row, item, resume=True)
+        else:
+            # Waits for a free slot like any other resumable item
+            item.set_status(ItemStatus.PAUSED)
+            self.table.setItem(row, 7, QTableWidgetItem(item.status.label))
+            if self.downloading_all:
+                self._start_next_downloads()
+
+    def check_stalled_downloads(self):
+        stall_seconds = self.settings.get("stall_timeout_seconds", 60)
+        if stall_seconds <= 0:
+            return
+        now = time.monotonic()
+        for job in self.active_jobs:
+            # Suspended (paused) downloads are idle on purpose
+            if job.is_suspended or job.is_paused or job.is_cancelled:
+                continue
+            last_progress = job.last_progress
+            if last_progress is None or now - last_progress < stall_seconds:
+                continue
+            if not job.restart_stalled():
+                continue
+            # Keyed by the CDN node that stopped sending, where known
+            self._record_host_event(media_host(job.info_dict) or url_host(job.url), "stall")
+            proxy = self.download_proxies.get(job.id)
+            if proxy and self.proxy_pool.record_failure(proxy):
+                self._on_proxy_quarantined(proxy)
+            self.log_message(f"دانلود {stall_seconds} ثانیه بدون پیشرفت ماند ({url_host(job.url)}): {job.url}")
+
+    def on_download_stalled(self, item_id, restart_count):
+        row = self.id_to_row.get(item_id)
+        if row is None:
+            return
+        item = self.download_queue[row]
+        job_index = self._find_job_by_id(item_id)
+        info = self.active_jobs[job_index].info_dict if job_index >= 0 else None
+        self._record_host_event(media_host(info) or url_host(item['url']), "restart")
+        item['stall_count'] = (item.get('stall_count') or 0) + 1
+        if item['stall_count'] == STALL_DEMOTE_THRESHOLD:
+            self.log_message(f"این مورد بارها متوقف شد و از این پس پس از بقیه صف شروع می‌شود: {item['title']}")
+        self.table.setItem(row, 10, QTableWidgetItem(""))
+        self.table.setItem(row, 11, QTableWidgetItem(""))
+        self.log_message(f"شروع مجدد دانلود متوقف‌شده با ادامه فایل ناقص ({restart_count}/{STALL_MAX_RESTARTS}): {item['title']}")
 
     def _start_single_download(self, row, item, resume=False):
-        if item['status'] == "دانلود شده":
+        if item.status == ItemStatus.DONE:
+            return
+        if self._resume_suspended(row, item):
+            return
+        if item.get('needs_metadata'):
+            # Started once its title (and so its file name) is known
+            self.start_after_resolve.add(item['id'])
+            self.log_message(f"در انتظار دریافت اطلاعات پیش از شروع: {item['url']}")
+            self._metadata_tick()
+            return
+        if self.proxy_pool.proxies and not self.proxy_pool.has_capacity():
+            # Waits for a slot like any queued item
+            if item.status == ItemStatus.RETRY_WAIT:
+                item.set_status(ItemStatus.PAUSED)
+                self.table.setItem(row, 7, QTableWidgetItem(item.status.label))
+            self.log_message(f"همه پروکسی‌ها مشغول یا در قرنطینه‌اند، در انتظار: {item['title']}")
+            self._schedule_proxy_release()
             return
+        self._ensure_row_populated(row)
         
         item['quality'] = self.table.cellWidget(row, 4).currentText()
         item['format'] = self.table.cellWidget(row, 5).currentText()
         item['subtitle_lang'] = self.table.cellWidget(row, 6).currentText()
         self.save_queue()
         
-        item['status'] = "در حال دانلود..."
-        self.table.setItem(row, 7, QTableWidgetItem("در حال دانلود..."))
+        item.set_status(ItemStatus.DOWNLOADING)
+        self.table.setItem(row, 7, QTableWidgetItem(item.status.label))
         progress_bar = self.table.cellWidget(row, 8)
         if progress_bar:
             if not resume:
                 progress_bar.setValue(0)
+        if not resume:
+            self.download_percent.pop(item['id'], None)
 
-        safe_title = "".join(c for c in item['title'] if c.isalnum() or c in " ._()")
+        safe_title = safe_filename(item['title'])
+        # Placed once; resumes and the final move keep to the same root
+        item['output_root'] = self._output_root(item)
+        item['work_folder'] = work_folder = self._work_folder(item)
         ydl_opts = {
-            'outtmpl': {'default': os.path.join(self.settings.get("save_folder"), f'{safe_title}.%(ext)s')},
+            'outtmpl': {'default': os.path.join(work_folder, f'{safe_title}.%(ext)s')},
             'retries': 10,
             'fragment_retries': 10,
             'quiet': False,
             'continuedl': True,
             'nooverwrites': False  # اجازه بازنویسی فایل‌های ناقص
         }
-        if self.settings.get("proxy"):
-            ydl_opts['proxy'] = self.settings["proxy"]
-        
+
+        ydl_opts['format'] = item_format_selector(item, self.settings)
+        ydl_opts['rate_limit'] = slot_rate_limit(self.profile, len(self._transferring_jobs()) + 1)
         if item['format'] == "فقط صدا":
-            ydl_opts['format'] = 'bestaudio/best'
-            ydl_opts['postprocessors'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3'}]
+            audio_format = item.get('audio_format', self.settings.get("audio_format", "mp3"))
+            ydl_opts['postprocessors'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': audio_format}]
         else:
-            quality_str = item['quality']
             video_format = item.get('video_format', self.settings.get("video_format", "mp4"))
-            if quality_str == "بهترین":
-                ydl_opts['format'] = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]'
-            elif quality_str == "بدترین":
-                ydl_opts['format'] = 'worstvideo[ext=mp4]+worstaudio[ext=m4a]/worst[ext=mp4]'
-            else:
-                res = quality_str.replace("p", "")
-                ydl_opts['format'] = f'bestvideo[ext=mp4][height<={res}]+bestaudio[ext=m4a]/best[ext=mp4][height<={res}]'
-            ydl_opts['postprocessors'] = [{'key': 'FFmpegVideoConvertor', 'preferedformat': video_format}]
+            # Remux only; DownloadJob falls back to recoding if the selected codecs don't fit
+            ydl_opts['postprocessors'] = [{'key': 'FFmpegVideoRemuxer', 'preferedformat': video_format}]
+
+        outputs = item_outputs(item, self.settings)
+        if len(outputs) > 1:
+            # One transfer into the cache; the outputs are derived from it by the post-processing stage
+            ydl_opts['outputs'] = outputs
+            ydl_opts['output_stem'] = os.path.join(work_folder, safe_title)
+            ydl_opts['outtmpl'] = {'default': os.path.join(MEDIA_CACHE_DIR, f"{item['id']}.%(ext)s")}
 
         subtitle_lang = item['subtitle_lang']
         if subtitle_lang != "هیچ":
@@ -1423,20 +4953,36 @@ class App(QWidget):
 
         if not self.yt_dlp_path or not self.ffmpeg_path:
             self.log_message("ابزارهای لازم (yt-dlp یا ffmpeg) در دسترس نیستند.")
-            item['status'] = "خطا"
-            self.table.setItem(row, 7, QTableWidgetItem("خطا"))
+            item.set_status(ItemStatus.ERROR)
+            self.table.setItem(row, 7, QTableWidgetItem(item.status.label))
             return
 
-        downloader = DownloaderThread(item['id'], item['url'], ydl_opts, self.yt_dlp_path, self.ffmpeg_path)
+        if self.proxy_pool.proxies:
+            # Keeps the proxy a pre-resolved entry was extracted through when it has a free slot
+            preferred = self.prepared.get(item['id'], {}).get('proxy')
+            proxy = self.proxy_pool.acquire(preferred)
+            self.download_proxies[item['id']] = proxy
+        else:
+            proxy = self.settings.get("proxy") or None
+        if proxy:
+            ydl_opts['proxy'] = proxy
+
+        prepared = self._take_prepared(item['id'], ydl_opts['format'], proxy)
+        if prepared:
+            ydl_opts['info_json'] = prepared
+
+        downloader = DownloadJob(item['id'], item['url'], ydl_opts, self.yt_dlp_path, self.ffmpeg_path)
         downloader.download_progress.connect(self.on_download_progress)
         downloader.postprocess_progress.connect(self.on_postprocess_progress)
         downloader.download_finished.connect(self.on_download_finished)
         downloader.download_error.connect(self.on_download_error)
         downloader.download_cancelled.connect(self.on_download_cancelled)
         downloader.download_step.connect(self.on_download_step)
+        downloader.download_stalled.connect(self.on_download_stalled)
         downloader.log_line.connect(self.log_signal)
-        self.active_downloads.append(downloader)
+        self.active_jobs.append(downloader)
         downloader.start()
+        self._rebalance_rate_limits()
         self.progress_emit_counter[item['id']] = 0  # Reset counter
 
     def on_download_step(self, item_id, step_msg):
@@ -1452,33 +4998,37 @@ class App(QWidget):
         if d['status'] == 'downloading':
             try:
                 percent = float(d.get('_percent_str', '0%').strip().replace('%', ''))
-                downloaded_str = d.get('downloaded_bytes', '0 B')
-                speed_str = format_speed(d.get('speed'))
-                eta_str = format_eta(d.get('eta'))
+                self.download_percent[d['id']] = percent
+                self.download_speeds[d['id']] = d.get('speed') or 0
+                if d['id'] in self.download_proxies:
+                    self.proxy_pool.sample(self.download_proxies[d['id']], d.get('speed'))
 
                 # Rate-limit emits to every 5% or 1 second to prevent UI freeze
                 counter = self.progress_emit_counter.get(d['id'], 0) + 1
                 self.progress_emit_counter[d['id']] = counter
                 if counter % 5 == 0 or percent % 5 == 0:  # Emit every 5 updates or 5%
-                    self.update_progress.emit(d['id'], percent, downloaded_str, speed_str, eta_str)
+                    self.update_progress.emit(d['id'], percent, d.get('downloaded_bytes'), d.get('speed'), d.get('eta'))
             except (ValueError, AttributeError):
                 pass
 
-    def _update_progress_ui(self, item_id, percent, downloaded_str, speed_str, eta_str):
+    def _update_progress_ui(self, item_id, percent, downloaded_bytes, speed, eta):
         row = self.id_to_row.get(item_id)
         if row is None or row >= self.table.rowCount():
             return
+        item = self.download_queue[row]
+        # به‌روزرسانی item در queue برای حفظ حجم دانلود شده
+        if downloaded_bytes is not None:
+            item.downloaded_bytes = downloaded_bytes
+        speed_str = format_speed(speed)
+        eta_str = format_eta(eta)
         progress_bar = self.table.cellWidget(row, 8)
         if progress_bar:
             progress_bar.setValue(int(percent))
-        self.table.setItem(row, 9, QTableWidgetItem(downloaded_str))  # حجم دانلود شده
+        self.table.setItem(row, 9, QTableWidgetItem(item.downloaded_size))  # حجم دانلود شده
         self.table.setItem(row, 10, QTableWidgetItem(speed_str))  # سرعت
         self.table.setItem(row, 11, QTableWidgetItem(eta_str))  # زمان باقی‌مانده
-        # به‌روزرسانی item در queue برای حفظ حجم دانلود شده
-        if 0 <= row < len(self.download_queue):
-            self.download_queue[row]['downloaded_size'] = downloaded_str
-        self.save_queue()  # ذخیره فوری برای حفظ داده
-        self.log_message(f"پیشرفت دانلود [{self.download_queue[row]['title']}]: {percent:.2f}% - حجم: {downloaded_str} - سرعت: {speed_str} - باقی‌مانده: {eta_str}")
+        # Progress ticks arrive many times a second across all downloads; the queue is written at most once a second
+        self.schedule_save_queue()
 
     def on_postprocess_progress(self, d):
         row = self.id_to_row.get(d['id'])
@@ -1494,86 +5044,411 @@ class App(QWidget):
 
     def on_download_finished(self, info_dict):
         item_id = info_dict['id']
-        thread_index = self._find_thread_by_id(item_id)
-        if thread_index != -1:
-            self.active_downloads.pop(thread_index)
-        
+        # The network slot is freed here, before any ffmpeg work
+        job_index = self._find_job_by_id(item_id)
+        if job_index != -1:
+            self._retire_worker(self.active_jobs.pop(job_index))
+            self._rebalance_rate_limits()
+        self._release_proxy(item_id, True)
+
+        row = self.id_to_row.get(item_id)
+        steps = info_dict.get('postprocess_steps')
+        if row is not None and steps:
+            item = self.download_queue[row]
+            item.set_status(ItemStatus.POSTPROCESS_WAIT)
+            self.table.setItem(row, 7, QTableWidgetItem(item.status.label))
+            self.table.setItem(row, 10, QTableWidgetItem(""))
+            self.table.setItem(row, 11, QTableWidgetItem(""))
+            self.postprocess_queue.append((item_id, info_dict.get('filepath'), steps, info_dict.get('duration')))
+            self.log_message(f"دانلود خام پایان یافت، در صف پردازش: {item['title']}")
+            self._start_next_postprocessing()
+        else:
+            self._deliver_item(item_id, info_dict.get('filepath'))
+
+        self.save_queue()
+        # Refill the freed slot first, or a queue run with nothing else active counts as finished
+        if self.downloading_all:
+            self._start_next_downloads()
+        self.check_all_finished()
+
+    def _deliver_item(self, item_id, filepath, extra_paths=()):
+        """Complete an item, first moving its files out of the scratch folder if it was staged there."""
+        row = self.id_to_row.get(item_id)
+        output_root = self._output_root(self.download_queue[row]) if row is not None else None
+        if (row is None or not filepath
+                or os.path.normpath(os.path.dirname(filepath)) == os.path.normpath(output_root)):
+            self._complete_item(item_id, filepath, extra_paths)
+            return
+        item = self.download_queue[row]
+        item.set_status(ItemStatus.MOVING)
+        self.moving.add(item_id)
+        self.table.setItem(row, 7, QTableWidgetItem(item.status.label))
+        self.table.setItem(row, 10, QTableWidgetItem(""))
+        self.table.setItem(row, 11, QTableWidgetItem(""))
+        self.move_pool.submit(self._move_item_job, item_id, [filepath] + list(extra_paths), output_root)
+
+    def _move_item_job(self, item_id, paths, folder):
+        """Runs in move_pool: outputs and their subtitle files go to the save folder, outputs first."""
+        moved = []
+        should_stop = lambda: self.move_stopping
+        try:
+            for path in paths:
+                sidecars = glob.glob(glob.escape(os.path.splitext(path)[0]) + ".*.srt") + find_subtitle_files(path)
+                target = move_into_folder(path, folder, should_stop)
+                if target is None:
+                    return  # Closing: the item is reloaded as paused and a later start repeats the move
+                moved.append(target)
+                for sidecar in sidecars:
+                    if move_into_folder(sidecar, folder, should_stop) is None:
+                        return
+        except OSError as e:
+            self.files_moved.emit(item_id, moved, str(e))
+            return
+        self.files_moved.emit(item_id, moved, "")
+
+    def _on_files_moved(self, item_id, paths, error):
+        self.moving.discard(item_id)
+        if error:
+            # A later start finds the finished file in the work folder and only repeats the move
+            self._handle_download_end(item_id, ItemStatus.ERROR, f"انتقال به پوشه ذخیره ناموفق بود: {error}", is_pause=False)
+            return
+        self._complete_item(item_id, paths[0], paths[1:])
+        self.save_queue()
+        # Space freed in the scratch folder may admit a held item
+        if self.downloading_all:
+            self._start_next_downloads()
+        self.check_all_finished()
+
+    def _complete_item(self, item_id, filepath, extra_paths=()):
         row = self.id_to_row.get(item_id)
         if row is not None:
             item = self.download_queue.pop(row)
-            item['status'] = "دانلود شده"
-            item['download_path'] = info_dict.get('filepath')
+            self.download_percent.pop(item_id, None)
+            self.download_speeds.pop(item_id, None)
+            item.set_status(ItemStatus.DONE)
+            item['download_path'] = filepath
+            item['retry_count'] = 0
+            item['retry_at'] = None
+            item['stall_count'] = None
+            if extra_paths:
+                item['output_paths'] = [filepath] + list(extra_paths)
+            # Also covers files found already present at queue time
+            roots = self._root_paths()
+            item['output_root'] = path_root(filepath, roots) if filepath else None
+            if item['output_root'] in self.root_usage:
+                for path in [filepath] + list(extra_paths):
+                    if os.path.exists(path):
+                        self.root_usage[item['output_root']] += os.path.getsize(path)
+            self.rate_limit_strikes.pop(url_host(item['url']), None)
+            for path in [filepath] + list(extra_paths):
+                self.file_index.add(path)
+            if item.get('archive_id'):
+                self.archive.add(item['archive_id'])
             # حفظ حجم نهایی دانلود شده
-            item['downloaded_size'] = item.get('filesize_str', 'نامشخص')
+            item.downloaded_bytes = item.size
             self.completed_downloads.append(item)
             self.table.removeRow(row)
+            self._on_table_row_removed(row)
             self._update_id_to_row_map()
             self.update_completed_table_row(self.completed_table.rowCount(), item)
             self.log_message(f"دانلود پایان یافت: {item['title']} - مسیر: {item['download_path']}")
+            if extra_paths:
+                self.log_message(f"خروجی‌های اضافه: {', '.join(os.path.basename(p) for p in extra_paths)}")
+            self._verify_media(item)
 
+    def _verify_media(self, item, rehash=False):
+        """Hash (and probe) a completed file in the background; `rehash` ignores the recorded digest."""
+        if not item.get('download_path'):
+            return
+        self.hash_pool.submit(self._verify_media_job, item['id'], item['download_path'],
+                              item.duration, rehash,
+                              self.settings.get("dedupe_completed", True), item.get('output_root'))
+
+    def _hash_rate_limit(self):
+        return HASH_IO_LIMIT_BUSY if self.active_jobs or self.active_postprocessing else HASH_IO_LIMIT
+
+    def _verify_media_job(self, item_id, path, expected_duration, rehash, dedupe, root):
+        try:
+            result = self._check_media_file(path, expected_duration, rehash, dedupe, root)
+        except Exception as e:
+            logging.error(f"Error verifying {path}: {e}")
+            self.log_signal.emit(f"خطا در بررسی صحت فایل {os.path.basename(path)}: {e}")
+            return
+        if result is not None:
+            self.media_verified.emit(item_id, result)
+
+    def _check_media_file(self, path, expected_duration, rehash, dedupe, root=None):
+        """Runs in hash_pool. Returns the result dict, or None if interrupted or the file changed meanwhile."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.media_index.forget(path)
+            return {'integrity': INTEGRITY_MISSING}
+        known = self.media_index.lookup(path)
+        unchanged = known is not None and known[:2] == (st.st_size, st.st_mtime_ns)
+        if unchanged and not rehash:
+            digest = known[2]
+        else:
+            digest = hash_media_file(path, self._hash_rate_limit, lambda: self.hash_stopping)
+            if digest is None:
+                return None
+            after = os.stat(path)
+            if (after.st_size, after.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+                return None  # Still being written to; checked again next time
+        result = {'digest': digest, 'integrity': INTEGRITY_OK}
+        if unchanged and digest != known[2]:
+            result['integrity'] = INTEGRITY_CORRUPT  # Same size and mtime, different bytes: bit rot
+        elif st.st_size == 0:
+            result['integrity'] = INTEGRITY_TRUNCATED
+        elif self.ffprobe_path:
+            readable, duration = probe_media_duration(self.ffprobe_path, path, self.probe_processes)
+            if self.hash_stopping:
+                return None  # ffprobe was terminated by shutdown, not rejected by the file
+            slack = max(TRUNCATION_MIN_SLACK, (expected_duration or 0) * TRUNCATION_TOLERANCE)
+            if not readable or (expected_duration and duration is not None and duration + slack < expected_duration):
+                result['integrity'] = INTEGRITY_TRUNCATED
+                result['duration'] = duration
+        if result['integrity'] != INTEGRITY_OK:
+            return result  # The damaged file keeps its old digest so later checks still see the mismatch
+        self.media_index.record(path, st.st_size, st.st_mtime_ns, digest, root)
+        if dedupe:
+            self._dedupe_media_file(path, st, digest, result, root)
+        return result
+
+    def _dedupe_media_file(self, path, st, digest, result, root=None):
+        """Replace `path` with a link to an identical, unmodified earlier file on the same filesystem."""
+        for other, mtime_ns in self.media_index.duplicates(st.st_size, digest, path):
+            try:
+                other_st = os.stat(other)
+            except OSError:
+                self.media_index.forget(other)
+                continue
+            if (other_st.st_size, other_st.st_mtime_ns) != (st.st_size, mtime_ns) or other_st.st_dev != st.st_dev:
+                continue  # Changed since it was hashed, or a link cannot cross filesystems
+            if other_st.st_ino == st.st_ino:
+                return  # Already one file
+            try:
+                method = replace_with_clone(other, path)
+            except OSError as e:
+                logging.error(f"Could not deduplicate {path} against {other}: {e}")
+                continue
+            new_st = os.stat(path)
+            self.media_index.record(path, new_st.st_size, new_st.st_mtime_ns, digest, root)
+            result['deduplicated'] = (method, other, st.st_size)
+            return
+
+    def _on_media_verified(self, item_id, result):
+        row = next((i for i, item in enumerate(self.completed_downloads) if item['id'] == item_id), None)
+        if row is None:
+            return
+        item = self.completed_downloads[row]
+        if result.get('digest'):
+            item['sha256'] = result['digest']
+        integrity = result['integrity']
+        item['integrity'] = integrity
+        if integrity in INTEGRITY_STATUSES:
+            item.set_status(INTEGRITY_STATUSES[integrity])
+            self.log_message(f"{item.status.label}: {item['title']} - {item.get('download_path')}")
+        else:
+            item.set_status(ItemStatus.DONE)
+            if 'deduplicated' in result:
+                method, other, size = result['deduplicated']
+                self.log_message(f"فایل تکراری با {method} به {os.path.basename(other)} پیوند شد "
+                                 f"({format_file_size(size)} آزاد شد): {item['title']}")
+        if row < self.completed_table.rowCount():
+            self.completed_table.setItem(row, 5, QTableWidgetItem(item.status.label))
+
+    def verify_completed_rows(self, rows):
+        for row in rows:
+            if 0 <= row < len(self.completed_downloads):
+                self._verify_media(self.completed_downloads[row], rehash=True)
+        self.status_label.setText(f"بررسی صحت {len(rows)} فایل در پس‌زمینه آغاز شد.")
+
+    def verify_all_completed(self):
+        if not self.completed_downloads:
+            QMessageBox.information(self, "بررسی صحت", "هیچ دانلود تکمیل‌شده‌ای وجود ندارد.")
+            return
+        self.verify_completed_rows(range(len(self.completed_downloads)))
+
+    def redownload_completed_rows(self, rows):
+        """Move flagged completed items back to the queue, deleting their damaged files."""
+        requeued = []
+        for row in sorted(rows, reverse=True):
+            if not 0 <= row < len(self.completed_downloads):
+                continue
+            item = self.completed_downloads[row]
+            if item.get('integrity') not in INTEGRITY_STATUSES:
+                continue
+            path = item.get('download_path')
+            if path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    self.log_message(f"خطا در حذف فایل {path}: {e}")
+                    continue
+            if path:
+                self.media_index.forget(path)
+            self.completed_downloads.pop(row)
+            self.completed_table.removeRow(row)
+            item.pop('sha256', None)
+            item.pop('integrity', None)
+            item.set_status(ItemStatus.QUEUED)
+            item.update(download_path=None, downloaded_bytes=0)
+            requeued.append(item)
+        if not requeued:
+            return
+        requeued.reverse()
+        start_row = self.table.rowCount()
+        restoring = self.restore_cursor < start_row
+        self.table.setRowCount(start_row + len(requeued))
+        for i, item in enumerate(requeued):
+            self.download_queue.append(item)
+            self.id_to_row[item['id']] = start_row + i
+            self.update_table_row(start_row + i, item)
+            self.log_message(f"برای دانلود مجدد به صف اضافه شد: {item['title']}")
+        if not restoring:
+            self.restore_cursor = self.table.rowCount()
         self.save_queue()
-        self.check_all_finished()
         if self.downloading_all:
             self._start_next_downloads()
 
+    def _start_next_postprocessing(self):
+        while self.postprocess_queue and len(self.active_postprocessing) < POSTPROCESS_WORKERS:
+            item_id, filepath, steps, duration = self.postprocess_queue.pop(0)
+            worker = PostProcessThread(item_id, filepath, steps, self.ffmpeg_path, duration)
+            worker.postprocess_progress.connect(self.on_postprocess_stage_progress)
+            worker.encode_progress.connect(self.on_postprocess_encode_progress)
+            worker.encode_stats.connect(self.on_postprocess_encode_stats)
+            worker.postprocess_finished.connect(self.on_postprocess_finished)
+            worker.postprocess_error.connect(self.on_postprocess_error)
+            worker.postprocess_cancelled.connect(self.on_postprocess_cancelled)
+            worker.log_line.connect(self.log_signal)
+            self.active_postprocessing.append(worker)
+            worker.start()
+
+    def on_postprocess_stage_progress(self, d):
+        row = self.id_to_row.get(d['id'])
+        if row is None or row >= self.table.rowCount():
+            return
+        item = self.download_queue[row]
+        item.set_status(ItemStatus.POSTPROCESSING)
+        self.table.setItem(row, 7, QTableWidgetItem(item.status.label))
+        progress_bar = self.table.cellWidget(row, 8)
+        if progress_bar:
+            progress_bar.setValue(int(d['index'] / d['total'] * 100))
+        self.log_message(f"پردازش پس از دانلود [{os.path.basename(d['filename'])}]: {d['step']} ({d['index'] + 1}/{d['total']})")
+
+    def on_postprocess_encode_progress(self, d):
+        row = self.id_to_row.get(d['id'])
+        if row is None or row >= self.table.rowCount():
+            return
+        progress_bar = self.table.cellWidget(row, 8)
+        if progress_bar and d['percent'] is not None:
+            progress_bar.setValue(int((d['index'] + d['percent'] / 100) / d['total'] * 100))
+        # Speed as a multiple of realtime; ETA of the running step
+        self.table.setItem(row, 10, QTableWidgetItem(f"{d['speed']:.2f}x" if d['speed'] else ""))
+        self.table.setItem(row, 11, QTableWidgetItem(format_eta(d['eta'])))
+
+    def on_postprocess_encode_stats(self, output_format, cpu_seconds, media_seconds):
+        stats = self.transcode_stats.setdefault(output_format, {"cpu_seconds": 0.0, "media_seconds": 0.0, "runs": 0})
+        stats['cpu_seconds'] += cpu_seconds
+        stats['media_seconds'] += media_seconds
+        stats['runs'] += 1
+        save_json_file(TRANSCODE_STATS_PATH, self.transcode_stats)
+        self.log_message(f"ffmpeg [{output_format}]: {cpu_seconds:.1f} ثانیه CPU برای {format_duration(media_seconds)} رسانه"
+                         f" (مجموع {output_format}: {stats['cpu_seconds']:.1f} ثانیه CPU در {stats['runs']} اجرا)")
+
+    def _finish_postprocessing(self, item_id):
+        for worker in self.active_postprocessing:
+            if worker.id == item_id:
+                self._retire_worker(worker)
+        self.active_postprocessing = [w for w in self.active_postprocessing if w.id != item_id]
+        self._start_next_postprocessing()
+
+    def on_postprocess_finished(self, item_id, paths):
+        self._finish_postprocessing(item_id)
+        self._deliver_item(item_id, paths[0], paths[1:])
+        self.save_queue()
+        self.check_all_finished()
+
+    def on_postprocess_error(self, error_msg, item_id):
+        # Not retried: the download itself succeeded, only the ffmpeg step failed
+        self._finish_postprocessing(item_id)
+        self._handle_download_end(item_id, ItemStatus.ERROR, f"[{ERROR_POSTPROCESS}] {error_msg}", is_pause=False)
+
+    def on_postprocess_cancelled(self, item_id):
+        self._finish_postprocessing(item_id)
+        self._handle_download_end(item_id, ItemStatus.CANCELLED, "پردازش لغو شد.", is_pause=False)
+
     def update_completed_table_row(self, row, item):
         self.completed_table.setRowCount(row + 1)
         self.completed_table.setItem(row, 0, QTableWidgetItem(item.get("title")))
         self.completed_table.setItem(row, 1, QTableWidgetItem(item.get("url")))
-        self.completed_table.setItem(row, 2, QTableWidgetItem(item.get("filesize_str")))
-        self.completed_table.setItem(row, 3, QTableWidgetItem(item.get("duration_str")))
+        self.completed_table.setItem(row, 2, QTableWidgetItem(item.filesize_str))
+        self.completed_table.setItem(row, 3, QTableWidgetItem(item.duration_str))
         self.completed_table.setItem(row, 4, QTableWidgetItem(item.get("quality")))
-        self.completed_table.setItem(row, 5, QTableWidgetItem(item.get("status")))
+        self.completed_table.setItem(row, 5, QTableWidgetItem(item.status.label))
         date_str = item.get('upload_date', '')
         if date_str:
             self.completed_table.setItem(row, 6, QTableWidgetItem(f"{date_str[:4]}/{date_str[4:6]}/{date_str[6:]}"))
         self.completed_table.setItem(row, 7, QTableWidgetItem(item.get("download_path")))
 
     def on_download_error(self, error_msg, item_id):
-        self._handle_download_end(item_id, "خطا", error_msg, is_pause=False)
+        kind = classify_download_error(error_msg)
+        # Network and rate-limit failures count against the proxy; a removed video or ffmpeg error does not
+        self._release_proxy(item_id, False if kind in (ERROR_TRANSIENT, ERROR_RATE_LIMITED) else None)
+        if kind in (ERROR_TRANSIENT, ERROR_RATE_LIMITED) and self._schedule_retry(item_id, kind):
+            # The slot is freed now; the retry timer restarts the item later
+            self._handle_download_end(item_id, ItemStatus.RETRY_WAIT, f"[{kind}] {error_msg}", is_pause=False)
+            return
+        self._handle_download_end(item_id, ItemStatus.ERROR, f"[{kind}] {error_msg}", is_pause=False)
 
     def on_download_cancelled(self, item_id):
         row = self.id_to_row.get(item_id)
         if row is not None:
             item = self.download_queue[row]
-            thread = next((t for t in self.active_downloads if t.id == item_id), None)
-            if thread:
-                if thread.is_paused:
-                    self._handle_download_end(item_id, "متوقف شده", "دانلود متوقف شد.", is_pause=True)
+            job = next((t for t in self.active_jobs if t.id == item_id), None)
+            if job:
+                if job.is_paused:
+                    self._handle_download_end(item_id, ItemStatus.PAUSED, "دانلود متوقف شد.", is_pause=True)
                 else:
-                    self._handle_download_end(item_id, "لغو شده", "دانلود لغو شد.", is_pause=False)
+                    self._handle_download_end(item_id, ItemStatus.CANCELLED, "دانلود لغو شد.", is_pause=False)
 
     def _handle_download_end(self, item_id, status, message, is_pause=False):
-        thread_index = self._find_thread_by_id(item_id)
-        if thread_index != -1:
-            thread = self.active_downloads.pop(thread_index)
-            if not thread.wait(timeout=5):  # Wait with timeout to prevent hang
-                thread.terminate()
-                thread.wait()
+        job_index = self._find_job_by_id(item_id)
+        if job_index != -1:
+            self._retire_worker(self.active_jobs.pop(job_index))
+            self._rebalance_rate_limits()
+        self.download_speeds.pop(item_id, None)
+        self._release_proxy(item_id, None)
 
         row = self.id_to_row.get(item_id)
         if row is not None and row < self.table.rowCount():
             item = self.download_queue[row]
-            self.table.setItem(row, 7, QTableWidgetItem(status))
+            # حجم دانلود شده در item حفظ می‌شود (حتی پس از لغو)
+            item.set_status(status)
+            self.table.setItem(row, 7, QTableWidgetItem(status.label))
             self.table.setItem(row, 10, QTableWidgetItem(""))  # Clear speed
             self.table.setItem(row, 11, QTableWidgetItem(""))  # Clear ETA
-            # حفظ حجم دانلود شده در item و سلول (حتی پس از لغو)
-            downloaded_item = self.table.item(row, 9)
-            if downloaded_item:
-                item['downloaded_size'] = downloaded_item.text()
-            item['status'] = status
-            if not is_pause and status == "لغو شده" and self.settings.get("delete_partial_on_cancel", False):
-                ext = 'mp3' if item.get('format') == "فقط صدا" else item.get('video_format', 'mp4')
-                delete_partial_files(self.settings.get("save_folder"), item['title'], ext)
-            self.log_message(f"'{item['title']}': {message} - وضعیت: {status}")
+            if not is_pause and status == ItemStatus.CANCELLED and self.settings.get("delete_partial_on_cancel", False):
+                ext = get_output_ext(item, self.settings)
+                delete_partial_files(item.get('work_folder') or self.settings.get("save_folder"), item['title'], ext)
+                delete_cached_source(item_id)
+            self.log_message(f"'{item['title']}': {message} - وضعیت: {status.label}")
         
         self.save_queue()
-        self.check_all_finished()
+        # Refill the freed slot first, or a queue run with nothing else active counts as finished
         if self.downloading_all:
             self._start_next_downloads()
+        self.check_all_finished()
 
-    def _find_thread_by_id(self, item_id):
-        return next((i for i, thread in enumerate(self.active_downloads) if thread.id == item_id), -1)
+    def _retire_worker(self, worker):
+        # Called from the worker's last signal, so it is about to return (a post-processing thread from run(),
+        # a download job from its QProcess handler); hold a reference until then instead of blocking on wait()
+        self.retired_workers = [w for w in self.retired_workers if w.isRunning()] + [worker]
+
+    def _find_job_by_id(self, item_id):
+        return next((i for i, job in enumerate(self.active_jobs) if job.id == item_id), -1)
 
     def remove_selected_items(self):
         selected_rows = sorted([index.row() for index in self.table.selectionModel().selectedRows()], reverse=True)
@@ -1586,65 +5461,153 @@ class App(QWidget):
             return
         item = self.download_queue[row]
         self.cancel_single_download(row)
+        if item.get('extra_outputs'):
+            delete_cached_source(item['id'])
         del self.id_to_row[item['id']]
         del self.download_queue[row]
         self.table.removeRow(row)
+        self._on_table_row_removed(row)
         self._update_id_to_row_map()
         self.save_queue()
 
+    def _on_table_row_removed(self, row):
+        # Keep the progressive-restore cursor pointing at the same queue item
+        if row < self.restore_cursor:
+            self.restore_cursor -= 1
+
     def _update_id_to_row_map(self):
         self.id_to_row = {item['id']: i for i, item in enumerate(self.download_queue)}
 
     def pause_single_download(self, row):
         if 0 <= row < len(self.download_queue):
             item = self.download_queue[row]
-            thread_index = self._find_thread_by_id(item['id'])
-            if thread_index != -1:
-                self.active_downloads[thread_index].is_paused = True
-                if not self.active_downloads[thread_index].wait(timeout=5):
-                    self.active_downloads[thread_index].terminate()
-                    self.active_downloads[thread_index].wait()
+            job_index = self._find_job_by_id(item['id'])
+            if job_index != -1:
+                job = self.active_jobs[job_index]
+                timeout_min = self.settings.get("pause_suspend_minutes", 5)
+                if timeout_min > 0 and job.suspend():
+                    # Short pause: the process is frozen and resumes in place without re-extraction
+                    token = self.suspend_tokens.get(item['id'], 0) + 1
+                    self.suspend_tokens[item['id']] = token
+                    QTimer.singleShot(timeout_min * 60 * 1000, lambda: self._expire_suspended_pause(item['id'], token))
+                    self._rebalance_rate_limits()
+                    # Its concurrency and proxy slots go to the next item meanwhile
+                    proxy = self.download_proxies.pop(item['id'], None)
+                    if proxy:
+                        self.suspended_proxies[item['id']] = proxy
+                        self.proxy_pool.release(proxy, None)
+                    if self.downloading_all:
+                        self._start_next_downloads()
+                    item.set_status(ItemStatus.PAUSED)
+                    self.table.setItem(row, 7, QTableWidgetItem(item.status.label))
+                    self.table.setItem(row, 10, QTableWidgetItem(""))
+                    self.table.setItem(row, 11, QTableWidgetItem(""))
+                    self.log_message(f"مکث دانلود (تعلیق فرآیند): {item['title']}")
+                    return
+                # The status changes in on_download_cancelled once the worker has stopped
+                job.is_paused = True
+                job.stop_process()
                 self.log_message(f"مکث دانلود: {item['title']}")
-                self._handle_download_end(item['id'], "متوقف شده", "دانلود مکث شد.", is_pause=True)
+
+    def _resume_suspended(self, row, item):
+        job_index = self._find_job_by_id(item['id'])
+        if job_index == -1 or not self.active_jobs[job_index].is_suspended:
+            return False
+        if not self.active_jobs[job_index].resume():
+            return False
+        self.suspend_tokens.pop(item['id'], None)
+        proxy = self.suspended_proxies.pop(item['id'], None)
+        if proxy:
+            # The frozen connections still go through it, whatever its load now
+            self.proxy_pool.reclaim(proxy)
+            self.download_proxies[item['id']] = proxy
+        # Its share (and the profile) may have changed while it was frozen
+        self._rebalance_rate_limits()
+        item.set_status(ItemStatus.DOWNLOADING)
+        self.table.setItem(row, 7, QTableWidgetItem(item.status.label))
+        return True
+
+    def _expire_suspended_pause(self, item_id, token):
+        # Long pause: fall back to terminating the process; resuming then uses --continue
+        if self.suspend_tokens.get(item_id) != token:
+            return
+        self.suspend_tokens.pop(item_id, None)
+        job_index = self._find_job_by_id(item_id)
+        if job_index != -1 and self.active_jobs[job_index].is_suspended:
+            job = self.active_jobs[job_index]
+            job.is_paused = True
+            job.stop_process()
+            self.log_message("مکث طولانی شد؛ فرآیند دانلود بسته شد و بعداً از ادامه فایل ناقص شروع می‌شود.")
 
     def resume_single_download(self, row):
         if 0 <= row < len(self.download_queue):
             item = self.download_queue[row]
-            if item['status'] == "متوقف شده":
-                self._start_single_download(row, item, resume=True)
+            if item.status == ItemStatus.PAUSED:
+                self._start_by_hand(row, item)
                 self.log_message(f"ادامه دانلود: {item['title']}")
 
     def cancel_single_download(self, row):
         if 0 <= row < len(self.download_queue):
             item = self.download_queue[row]
-            thread_index = self._find_thread_by_id(item['id'])
-            if thread_index != -1:
-                self.active_downloads[thread_index].is_cancelled = True
-                if not self.active_downloads[thread_index].wait(timeout=5):
-                    self.active_downloads[thread_index].terminate()
-                    self.active_downloads[thread_index].wait()
+            job_index = self._find_job_by_id(item['id'])
+            if job_index != -1:
+                self.active_jobs[job_index].is_cancelled = True
+                self.active_jobs[job_index].stop_process()
                 self.log_message(f"لغو دانلود تکی: {item['title']}")
+            self._cancel_retry(item['id'])
+            self._cancel_postprocessing(item['id'])
+
+    def _cancel_retry(self, item_id):
+        # A waiting retry has no worker; clearing retry_at disarms its pending timer
+        row = self.id_to_row.get(item_id)
+        if row is None or self.download_queue[row].status != ItemStatus.RETRY_WAIT:
+            return
+        self.download_queue[row]['retry_at'] = None
+        self._handle_download_end(item_id, ItemStatus.CANCELLED, "تلاش مجدد لغو شد.", is_pause=False)
+
+    def _cancel_postprocessing(self, item_id):
+        if any(job[0] == item_id for job in self.postprocess_queue):
+            self.postprocess_queue = [job for job in self.postprocess_queue if job[0] != item_id]
+            self._handle_download_end(item_id, ItemStatus.CANCELLED, "پردازش لغو شد.", is_pause=False)
+        for worker in self.active_postprocessing:
+            if worker.id == item_id:
+                process = worker.cancel()
+                if process is not None:
+                    self.reaper.reap(process)
 
     def start_single_download_from_menu(self, row):
         if 0 <= row < len(self.download_queue):
             self.downloading_all = False
             item = self.download_queue[row]
-            if item['status'] in ["در صف", "خطا", "لغو شده", "متوقف شده"]:
-                self._start_single_download(row, item, resume=item['status'] == "متوقف شده")
+            if item.status in STARTABLE_STATUSES:
+                self._start_by_hand(row, item)
                 self.log_message(f"شروع دانلود از منو: {item['title']}")
 
+    def _start_by_hand(self, row, item):
+        # A manual start gets a fresh set of retry attempts
+        item['retry_count'] = 0
+        self._start_single_download(row, item, resume=item.status in (ItemStatus.PAUSED, ItemStatus.RETRY_WAIT))
+
     def cancel_all_downloads(self):
-        for thread in list(self.active_downloads):
-            thread.is_cancelled = True
-            if not thread.wait(timeout=5):
-                thread.terminate()
-                thread.wait()
+        # Signal every child at once; rows update as each worker reports its exit
+        for job in list(self.active_jobs):
+            job.is_cancelled = True
+            job.stop_process()
+        for item_id in [job[0] for job in self.postprocess_queue]:
+            self._cancel_postprocessing(item_id)
+        for worker in list(self.active_postprocessing):
+            process = worker.cancel()
+            if process is not None:
+                self.reaper.reap(process)
         self.downloading_all = False
+        for item_id in [q['id'] for q in self.download_queue if q.status == ItemStatus.RETRY_WAIT]:
+            self._cancel_retry(item_id)
         self.log_message("لغو تمام دانلودها.")
         self.check_all_finished()
 
     def check_all_finished(self):
-        if not self.active_downloads and not any(q['status'] == "در حال دانلود..." for q in self.download_queue):
+        if (not self.active_jobs and not self.active_postprocessing and not self.postprocess_queue
+                and not any(q.status in BUSY_STATUSES for q in self.download_queue)):
             self.status_label.setText("عملیات دانلود به پایان رسید.")
             self.cancel_download_btn.setEnabled(False)
             self.start_download_btn.setEnabled(True)
@@ -1656,6 +5619,7 @@ class App(QWidget):
         self.ffmpeg_path = get_ffmpeg_path(ask_download=not silent)
         self.yt_dlp_version = get_yt_dlp_version(self.yt_dlp_path)
         self.ffmpeg_version = get_ffmpeg_version(self.ffmpeg_path)
+        self.ffprobe_path = get_ffprobe_path(self.ffmpeg_path)
 
         if not self.yt_dlp_path:
             if not silent:
@@ -1668,19 +5632,110 @@ class App(QWidget):
         return True
 
     def _refresh_ui(self):
-        for row in range(self.table.rowCount()):
-            progress_bar = self.table.cellWidget(row, 8)
+        queued = retrying = unknown = running_count = 0
+        running_remaining = queued_remaining = 0.0
+        for q in self.download_queue:
+            status = q.status
+            if status in WAITING_STATUSES:
+                queued += 1
+            elif status == ItemStatus.RETRY_WAIT:
+                retrying += 1
+            elif status != ItemStatus.DOWNLOADING:
+                continue
+            size = q.get('selected_size')
+            if size is None:
+                unknown += 1
+                continue
+            left = size * (1 - self.download_percent.get(q['id'], 0) / 100)
+            if status == ItemStatus.DOWNLOADING:
+                running_count += 1
+                running_remaining += left
+            else:
+                queued_remaining += left
+        remaining = running_remaining + queued_remaining
+        transferring = [t for t in self.active_jobs if not t.is_suspended]
+        if transferring:
+            sample = sum(self.download_speeds.get(t.id, 0) for t in transferring)
+            # Throttled samples say nothing about what an uncapped slot manages
+            if sample and (self.slot_speed is None or not self.profile['rate_limit']):
+                slot_sample = sample / len(transferring)
+                self.slot_speed = slot_sample if self.slot_speed is None else (
+                    THROUGHPUT_SMOOTHING * slot_sample + (1 - THROUGHPUT_SMOOTHING) * self.slot_speed)
+        totals = ""
+        if remaining:
+            totals = f" | باقی‌مانده: {format_file_size(remaining)}" + (f" (+{unknown} نامشخص)" if unknown else "")
+            if self.slot_speed:
+                now = time.time()
+                segments = schedule_segments(self.settings.get("schedule", []), self._default_profile(), now)
+                eta = schedule_eta(running_remaining, running_count, queued_remaining, self.slot_speed, segments, now)
+                if eta is not None:
+                    totals += f"، زمان تقریبی کل صف: {format_eta(eta)}"
+        cooling = self._cooling_hosts()
+        limits = ""
+        if self.profile['rate_limit']:
+            limits += f" | سقف پهنای باند: {format_speed(self.profile['rate_limit'])}"
+        if not self.profile['allow_starts']:
+            limits += " | شروع دانلود جدید متوقف (برنامه زمانی)"
+        self.pipeline_label.setText(
+            f"دانلود: {len(self._transferring_jobs())}/{self.profile['concurrency']} فعال، {queued} در صف"
+            f" | پردازش: {len(self.active_postprocessing)}/{POSTPROCESS_WORKERS} فعال، {len(self.postprocess_queue)} در انتظار"
+            + (f" | تلاش مجدد: {retrying}" if retrying else "")
+            + (f" | توقف موقت: {', '.join(sorted(cooling))}" if cooling else "")
+            + (f" | در انتظار فضای دیسک: {len(self.space_held)}" if self.space_held else "")
+            + limits
+            + totals
+        )
+        # Rows past the restore cursor have no widgets yet (and nothing to clear)
+        for row in range(min(self.restore_cursor, self.table.rowCount())):
             item = self.download_queue[row]
-            if progress_bar and progress_bar.value() == 0 and item['status'] != "در حال دانلود...":
+            if item.status in (ItemStatus.DOWNLOADING, ItemStatus.POSTPROCESSING):
+                continue
+            speed_item = self.table.item(row, 10)
+            if speed_item is None or not speed_item.text():
+                continue
+            progress_bar = self.table.cellWidget(row, 8)
+            if progress_bar and progress_bar.value() == 0:
                 self.table.setItem(row, 10, QTableWidgetItem(""))  # Clear speed
                 self.table.setItem(row, 11, QTableWidgetItem(""))  # Clear ETA
                 # حجم دانلود شده حفظ می‌شود و پاک نمی‌شود
 
     def closeEvent(self, event):
+        # All workers share one deadline, so closing takes at most SHUTDOWN_TIMEOUT_SECONDS
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT_SECONDS
+        self.fetch_cancelled = True
+        self.transfer_cancelled = True  # Imports and exports stop at their next row
+        self._terminate_fetch_processes()
+        self._terminate_fetch_processes(self.subscription_processes)
+        self.metadata_timer.stop()
+        self._terminate_fetch_processes(self.metadata_processes)
+        self.prefetch_timer.stop()
+        self._terminate_fetch_processes(self.prefetch_processes)
         self.cancel_all_downloads()
+        for worker in self.active_jobs + self.active_postprocessing + self.retired_workers:
+            if not worker.wait(max(0, int((deadline - time.monotonic()) * 1000))):
+                self.reaper.kill_all()
+                worker.terminate()
+                worker.wait(SHUTDOWN_KILL_WAIT_MS)
         self.ui_timer.stop()
+        self.stall_timer.stop()
+        self.schedule_timer.stop()
+        self.subscription_timer.stop()
         self.save_settings()
-        self.thread_pool.shutdown(wait=True)
+        # Pool tasks were told to stop above (transfers at their next row, lookups by terminating their
+        # yt-dlp children) and get what is left of the deadline. Stragglers are not joined at interpreter
+        # exit: the __main__ block ends the process without them
+        self.hash_stopping = True  # A file being hashed stops at its next chunk
+        self._terminate_fetch_processes(self.probe_processes)
+        # A copy in progress stops at its next chunk and removes its temporary file; the item resumes next start
+        self.move_stopping = True
+        self.space_timer.stop()
+        for pool in (self.thread_pool, self.metadata_pool, self.prefetch_pool, self.hash_pool, self.move_pool):
+            if not shutdown_pool(pool, deadline):
+                self.shutdown_stragglers += 1
+        self.archive.close()  # A Bloom filter load still running gives up at its next row
+        self.media_index.close()
+        self.proxy_pool.save()  # Throughput samples are otherwise only written along with an outcome
+        self.save_queue()
         if self.settings.get("clear_on_exit", False):
             if os.path.exists(QUEUE_PATH):
                 os.remove(QUEUE_PATH)
@@ -1694,4 +5749,10 @@ if __name__ == '__main__':
     ex = App()
     ex.setWindowIcon(QIcon(resource_path("icon.ico")))
     ex.show()
-    sys.exit(app.exec())
+    exit_code = app.exec()
+    if ex.shutdown_stragglers:
+        # Their threads would otherwise be joined at interpreter exit, past the close deadline
+        logging.warning(f"Exiting with {ex.shutdown_stragglers} worker pool(s) still busy")
+        logging.shutdown()
+        os._exit(exit_code)
+    sys.exit(exit_code)
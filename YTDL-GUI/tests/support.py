@@ -0,0 +1,17 @@
+"""Loads YTDL-GUI.py as the `ytdl_gui` module for the tests, with its config kept in a temp home."""
+import importlib.util
+import os
+import sys
+import tempfile
+
+if "ytdl_gui" in sys.modules:
+    ytdl_gui = sys.modules["ytdl_gui"]
+else:
+    # The app writes its config next to the user's home; keep that out of the real one
+    HOME = tempfile.mkdtemp()
+    os.environ["HOME"] = os.environ["APPDATA"] = HOME
+    _spec = importlib.util.spec_from_file_location(
+        "ytdl_gui", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "YTDL-GUI.py"))
+    ytdl_gui = importlib.util.module_from_spec(_spec)
+    sys.modules["ytdl_gui"] = ytdl_gui
+    _spec.loader.exec_module(ytdl_gui)
@@ -0,0 +1,114 @@
+"""BloomFilter and the SQLite download archive it fronts."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import ytdl_gui
+
+BloomFilter, DownloadArchive = ytdl_gui.BloomFilter, ytdl_gui.DownloadArchive
+
+
+class BloomFilterTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test_no_false_negatives_and_few_false_positives(self):
+        bloom = BloomFilter(10_000)
+        for i in range(10_000):
+            bloom.add(f"youtube {i:011d}")
+        self.assertTrue(all(f"youtube {i:011d}" in bloom for i in range(10_000)))
+        false_positives = sum(f"youtube x{i:010d}" in bloom for i in range(10_000))
+        self.assertLess(false_positives / 10_000, 2 * ytdl_gui.ARCHIVE_BLOOM_ERROR_RATE)
+
+    def test_save_and_load_round_trip(self):
+        bloom = BloomFilter(1000)
+        for key in ("youtube a", "youtube b"):
+            bloom.add(key)
+        bloom.last_rowid, bloom.identity = 42, b"i" * 16
+        path = os.path.join(self.dir, "archive.bloom")
+        bloom.save(path)
+        loaded = BloomFilter.load(path)
+        self.assertEqual((loaded.size, loaded.hashes, loaded.last_rowid, loaded.identity),
+                         (bloom.size, bloom.hashes, 42, b"i" * 16))
+        self.assertEqual(loaded.bits, bloom.bits)
+        self.assertIn("youtube a", loaded)
+        self.assertGreaterEqual(loaded.capacity, 999)
+
+    def test_foreign_and_truncated_files_are_rejected(self):
+        path = os.path.join(self.dir, "archive.bloom")
+        BloomFilter(1000).save(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        with open(path, 'wb') as f:
+            f.write(data[:-1])
+        self.assertRaises(ValueError, BloomFilter.load, path)
+        with open(path, 'wb') as f:
+            f.write(b"YTBF" + data[4:])  # Version 1 header
+        self.assertRaises(ValueError, BloomFilter.load, path)
+
+
+class DownloadArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.db_path = os.path.join(self.dir, "archive.db")
+        self.bloom_path = os.path.join(self.dir, "archive.bloom")
+
+    def open_archive(self):
+        archive = DownloadArchive(self.db_path, self.bloom_path)
+        archive.load()
+        return archive
+
+    def test_legacy_file_import_and_export(self):
+        legacy = os.path.join(self.dir, "archive.txt")
+        with open(legacy, 'w', encoding='utf-8') as f:
+            f.write("youtube aaaaaaaaaaa\n\nyoutube bbbbbbbbbbb\nyoutube aaaaaaaaaaa\n  youtube ccccccccccc  \n")
+        archive = self.open_archive()
+        self.assertEqual(archive.import_file(legacy, batch_size=2), 3)
+        self.assertEqual(archive.import_file(legacy), 0)
+        self.assertTrue(archive.contains("youtube ccccccccccc"))
+        self.assertFalse(archive.contains("youtube ddddddddddd"))
+        exported = os.path.join(self.dir, "export.txt")
+        archive.export_file(exported)
+        with open(exported, encoding='utf-8') as f:
+            self.assertEqual(f.read().split(), ["youtube", "aaaaaaaaaaa", "youtube", "bbbbbbbbbbb", "youtube", "ccccccccccc"])
+        archive.close()
+
+    def test_reopening_replays_rows_added_after_the_saved_filter(self):
+        archive = self.open_archive()
+        archive.add("youtube a")
+        archive.close()
+        saved = BloomFilter.load(self.bloom_path)
+        # Rows written by another session that did not save its filter
+        archive = DownloadArchive(self.db_path, self.bloom_path)
+        archive.add("youtube b")
+        archive.conn.close()
+        archive = self.open_archive()
+        self.assertEqual(archive.bloom.last_rowid, saved.last_rowid + 1)
+        self.assertIn("youtube b", archive.bloom)
+        self.assertTrue(archive.contains("youtube b"))
+        archive.close()
+
+    def test_filter_of_another_database_is_rebuilt(self):
+        archive = self.open_archive()
+        archive.add_many(["youtube a", "youtube b"])
+        archive.close()
+        os.remove(self.db_path)
+        archive = self.open_archive()
+        self.assertNotEqual(BloomFilter.load(self.bloom_path).identity, archive.identity)
+        self.assertEqual(archive.bloom.identity, archive.identity)
+        self.assertNotIn("youtube a", archive.bloom)
+        self.assertFalse(archive.contains("youtube a"))
+        archive.close()
+
+    def test_load_after_close_gives_up(self):
+        archive = DownloadArchive(self.db_path, self.bloom_path)
+        archive.close()
+        archive.load()
+        self.assertIsNone(archive.bloom)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Format selection and post-processing that remux instead of recoding when the codecs fit."""
+import unittest
+
+from support import ytdl_gui
+
+# format_id, ext, height, vcodec, acodec, size (INVENTORY_FIELDS)
+INVENTORY = [
+    ["140", "m4a", None, "none", "mp4a.40.2", 3_000_000],
+    ["251", "webm", None, "none", "opus", 3_200_000],
+    ["136", "mp4", 720, "avc1.4d401f", "none", 20_000_000],
+    ["247", "webm", 720, "vp9", "none", 18_000_000],
+    ["137", "mp4", 1080, "avc1.640028", "none", 40_000_000],
+    ["248", "webm", 1080, "vp9", "none", 35_000_000],
+]
+
+
+def picked_ids(selector):
+    return [fmt['format_id'] for fmt in ytdl_gui.select_formats(INVENTORY, selector)]
+
+
+class FormatSelectorTest(unittest.TestCase):
+    def test_prefers_streams_that_fit_the_container(self):
+        self.assertEqual(picked_ids(ytdl_gui.build_video_format_selector("بهترین", "mp4")), ["137", "140"])
+        self.assertEqual(picked_ids(ytdl_gui.build_video_format_selector("بهترین", "webm")), ["248", "251"])
+
+    def test_height_limit_and_worst(self):
+        self.assertEqual(picked_ids(ytdl_gui.build_video_format_selector("720p", "mp4")), ["136", "140"])
+        self.assertEqual(picked_ids(ytdl_gui.build_video_format_selector("بدترین", "mp4")), ["136", "140"])
+
+    def test_containers_without_codec_rules_take_anything(self):
+        selector = ytdl_gui.build_video_format_selector("بهترین", "mkv")
+        self.assertEqual(selector, "bestvideo+bestaudio/best")
+
+    def test_falls_back_to_any_codec(self):
+        selector = ytdl_gui.build_video_format_selector("بهترین", "avi")
+        self.assertTrue(selector.endswith("/bestvideo+bestaudio/best"))
+        # No mp3 audio here, so the codec-matched alternative is skipped and the file gets recoded
+        self.assertEqual(picked_ids(selector), ["248", "251"])
+
+
+class CopyOrRecodeTest(unittest.TestCase):
+    def test_codecs_fit_container(self):
+        self.assertTrue(ytdl_gui.codecs_fit_container("mp4", "avc1.640028", "mp4a.40.2"))
+        self.assertTrue(ytdl_gui.codecs_fit_container("webm", "VP9", "opus"))
+        self.assertTrue(ytdl_gui.codecs_fit_container("mkv", "vp9", "opus"))
+        self.assertTrue(ytdl_gui.codecs_fit_container("mp4", "avc1", None))
+        self.assertFalse(ytdl_gui.codecs_fit_container("mp4", "vp9", "opus"))
+        self.assertFalse(ytdl_gui.codecs_fit_container("webm", "vp9", "mp4a.40.2"))
+        self.assertFalse(ytdl_gui.codecs_fit_container("flv", "avc1", "mp4a"))
+
+    def test_variant_step_remuxes_or_converts(self):
+        step = ytdl_gui.output_variant_step("mp4", "avc1", "mp4a", "/out/a")
+        self.assertEqual(step['key'], 'FFmpegVideoRemuxer')
+        step = ytdl_gui.output_variant_step("mp4", "vp9", "opus", "/out/a")
+        self.assertEqual(step['key'], 'FFmpegVideoConvertor')
+        step = ytdl_gui.output_variant_step("m4a", "vp9", "mp4a.40.2", "/out/a")
+        self.assertEqual((step['key'], step['source_codec']), ('FFmpegExtractAudio', "mp4a.40.2"))
+
+    def test_remux_copies_streams(self):
+        cmd, dst = ytdl_gui.build_postprocess_command("ffmpeg", "/t/a.webm", {'key': 'FFmpegVideoRemuxer', 'preferedformat': 'mkv'})
+        self.assertEqual(dst, "/t/a.mkv")
+        self.assertEqual(cmd[-3:], ["-c", "copy", "/t/a.mkv"])
+
+    def test_audio_is_copied_when_the_codec_fits(self):
+        step = {'key': 'FFmpegExtractAudio', 'preferredcodec': 'm4a', 'source_codec': 'mp4a.40.2'}
+        cmd, dst = ytdl_gui.build_postprocess_command("ffmpeg", "/t/a.mp4", step)
+        self.assertEqual(cmd[-4:], ["-vn", "-c:a", "copy", "/t/a.m4a"])
+        # Already an m4a of that codec: nothing to do
+        self.assertEqual(ytdl_gui.build_postprocess_command("ffmpeg", "/t/a.m4a", step), (None, "/t/a.m4a"))
+
+    def test_audio_is_encoded_otherwise(self):
+        step = {'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'source_codec': 'opus'}
+        cmd, dst = ytdl_gui.build_postprocess_command("ffmpeg", "/t/a.webm", step)
+        self.assertEqual(dst, "/t/a.mp3")
+        self.assertIn("libmp3lame", cmd)
+
+    def test_in_place_output_goes_through_a_temp_file(self):
+        step = {'key': 'FFmpegVideoConvertor', 'preferedformat': 'avi'}
+        cmd, dst = ytdl_gui.build_postprocess_command("ffmpeg", "/t/a.avi", step)
+        self.assertEqual((cmd[-1], dst), ("/t/a.temp.avi", "/t/a.avi"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+"""Streaming a URL list file into the queue."""
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from support import ytdl_gui
+
+App = ytdl_gui.App
+
+
+class Signal:
+    def __init__(self):
+        self.calls = []
+
+    def emit(self, *args):
+        self.calls.append(args)
+
+
+class ImportFileTest(unittest.TestCase):
+    def import_file(self, lines, suffix=".txt"):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        self.addCleanup(os.remove, path)
+        app = SimpleNamespace(settings={"lazy_import_metadata": True}, yt_dlp_path=None,
+                              fetch_cancelled=False, fetch_stopped=False,
+                              video_info_loaded=Signal(), log_signal=Signal(), ui_update_signal=Signal())
+        app._iter_import_records = lambda f, file_path: App._iter_import_records(app, f, file_path)
+        with mock.patch.object(ytdl_gui, "QMetaObject"):
+            App._import_file_job(app, path)
+        return app
+
+    def test_placeholders_are_emitted_in_chunks(self):
+        count = 2 * ytdl_gui.IMPORT_CHUNK_SIZE + 5
+        app = self.import_file([f"https://www.youtube.com/watch?v={i:011d}" for i in range(count)])
+        chunks = [args[0] for args in app.video_info_loaded.calls]
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) <= ytdl_gui.IMPORT_CHUNK_SIZE for chunk in chunks))
+        self.assertEqual([info["id"] for chunk in chunks for info in chunk], [f"{i:011d}" for i in range(count)])
+        self.assertTrue(all(info.get("placeholder") for chunk in chunks for info in chunk))
+        # Progress is reported while the file is read, not only at the end
+        self.assertTrue(any(not done for _, done in app.ui_update_signal.calls))
+
+    def test_playlist_urls_are_skipped_without_yt_dlp(self):
+        app = self.import_file(["https://www.youtube.com/watch?v=aaaaaaaaaaa",
+                                "https://www.youtube.com/playlist?list=PL123",
+                                "not a url"])
+        chunks = [args[0] for args in app.video_info_loaded.calls]
+        self.assertEqual([info["id"] for chunk in chunks for info in chunk], ["aaaaaaaaaaa"])
+        self.assertEqual(len(app.log_signal.calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+"""ProxyPool against local stand-in proxies: one failing, one slow, two fast.
+
+Run from the YTDL-GUI folder with `python -m unittest discover tests`.
+"""
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from support import ytdl_gui
+
+PAYLOAD = b"x" * 64 * 1024
+CHUNK = 8 * 1024
+
+
+def make_handler(behaviour):
+    class StandInProxy(BaseHTTPRequestHandler):
+        # Answers proxied GETs (absolute request URIs) itself instead of forwarding them
+        def do_GET(self):
+            if behaviour == "failing":
+                self.send_error(502, "Bad Gateway")
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(PAYLOAD)))
+            self.end_headers()
+            for start in range(0, len(PAYLOAD), CHUNK):
+                self.wfile.write(PAYLOAD[start:start + CHUNK])
+                if behaviour == "slow":
+                    time.sleep(0.05)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StandInProxy
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ProxyPoolTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.servers = {}
+        for name in ("failing", "slow", "fast1", "fast2"):
+            server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(name.rstrip("12")))
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            cls.servers[f"http://127.0.0.1:{server.server_address[1]}"] = server
+        cls.proxies = list(cls.servers)
+        cls.failing, cls.slow = cls.proxies[0], cls.proxies[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers.values():
+            server.shutdown()
+            server.server_close()
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.pool = ytdl_gui.ProxyPool(self.proxies, capacity=1, clock=self.clock)
+
+    def fetch(self, proxy):
+        """Download the payload through `proxy`; returns bytes/s, or None on failure."""
+        opener = urllib.request.build_opener(urllib.request.ProxyHandler({"http": proxy}))
+        started = time.monotonic()
+        try:
+            with opener.open("http://media.invalid/video", timeout=5) as response:
+                size = len(response.read())
+        except (urllib.error.URLError, OSError):
+            return None
+        return size / max(time.monotonic() - started, 1e-6)
+
+    def run_round(self):
+        """Fill every free slot, as a busy queue does, and report each outcome back to the pool."""
+        claimed = []
+        while self.pool.has_capacity():
+            claimed.append(self.pool.acquire())
+        speeds = {}
+        workers = [threading.Thread(target=lambda p=proxy: speeds.__setitem__(p, self.fetch(p))) for proxy in claimed]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        for proxy in claimed:
+            self.pool.sample(proxy, speeds[proxy])
+            self.pool.release(proxy, speeds[proxy] is not None)
+
+    def test_failing_proxy_is_quarantined_and_fast_ones_win(self):
+        for _ in range(ytdl_gui.PROXY_QUARANTINE_FAILURES):
+            self.run_round()
+        self.assertTrue(self.pool.quarantined(self.failing))
+        self.assertNotIn(self.pool.best(), (self.failing, self.slow))
+        self.assertGreater(self.pool.stats[self.pool.best()]['speed'], self.pool.stats[self.slow]['speed'])
+        # Rounds keep going on the proxies left
+        self.run_round()
+        self.assertEqual(self.pool.stats[self.failing]['failures'], ytdl_gui.PROXY_QUARANTINE_FAILURES)
+
+    def test_capacity_limits_concurrent_assignments(self):
+        claimed = [self.pool.acquire() for _ in self.proxies]
+        self.assertCountEqual(claimed, self.proxies)
+        self.assertFalse(self.pool.has_capacity())
+        self.assertIsNone(self.pool.acquire())
+        self.pool.release(claimed[0], None)
+        self.assertEqual(self.pool.acquire(), claimed[0])
+
+    def test_quarantine_doubles_and_lifts_with_the_clock(self):
+        for _ in range(ytdl_gui.PROXY_QUARANTINE_FAILURES):
+            self.pool.record_failure(self.failing)
+        self.assertTrue(self.pool.quarantined(self.failing))
+        self.assertEqual(self.pool.next_release(), self.clock.now + ytdl_gui.PROXY_QUARANTINE_SECONDS)
+
+        self.clock.now += ytdl_gui.PROXY_QUARANTINE_SECONDS
+        self.assertTrue(self.pool.usable(self.failing))
+        # On probation: a single failure benches it again, for twice as long
+        self.assertTrue(self.pool.record_failure(self.failing))
+        self.assertEqual(self.pool.next_release(), self.clock.now + 2 * ytdl_gui.PROXY_QUARANTINE_SECONDS)
+
+        self.pool.reinstate(self.failing)
+        self.assertTrue(self.pool.usable(self.failing))
+
+
+if __name__ == "__main__":
+    unittest.main()
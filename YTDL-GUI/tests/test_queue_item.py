@@ -0,0 +1,91 @@
+"""QueueItem: the status transition table and loading queue.json records from older versions."""
+import logging
+import unittest
+from unittest import mock
+
+from support import ytdl_gui
+
+QueueItem, S = ytdl_gui.QueueItem, ytdl_gui.ItemStatus
+
+# Paths items take through the app, as the download, post-processing, retry and verification code drives them
+LIFECYCLES = [
+    [S.QUEUED, S.DOWNLOADING, S.POSTPROCESS_WAIT, S.POSTPROCESSING, S.MOVING, S.DONE],
+    [S.QUEUED, S.DOWNLOADING, S.MOVING, S.DONE, S.MISSING, S.QUEUED],
+    [S.QUEUED, S.DOWNLOADING, S.RETRY_WAIT, S.DOWNLOADING, S.ERROR, S.DOWNLOADING, S.DONE, S.TRUNCATED],
+    [S.QUEUED, S.DOWNLOADING, S.PAUSED, S.QUEUED, S.DOWNLOADING, S.CANCELLED, S.DOWNLOADING, S.DONE],
+    [S.QUEUED, S.DOWNLOADING, S.PAUSED, S.POSTPROCESS_WAIT, S.POSTPROCESSING, S.DONE, S.CORRUPT, S.QUEUED],
+    [S.QUEUED, S.DOWNLOADING, S.RETRY_WAIT, S.CANCELLED],
+    [S.QUEUED, S.ERROR],
+    [S.QUEUED, S.DONE],
+]
+
+
+class StatusTransitionTest(unittest.TestCase):
+    def test_table_covers_every_status(self):
+        self.assertEqual(set(ytdl_gui.STATUS_TRANSITIONS), set(S))
+        for targets in ytdl_gui.STATUS_TRANSITIONS.values():
+            self.assertTrue(targets <= set(S))
+
+    def test_every_status_is_reachable_and_can_be_left(self):
+        reached, frontier = {S.QUEUED}, [S.QUEUED]
+        while frontier:
+            for target in ytdl_gui.STATUS_TRANSITIONS[frontier.pop()] - reached:
+                reached.add(target)
+                frontier.append(target)
+        self.assertEqual(reached, set(S))
+        for status, targets in ytdl_gui.STATUS_TRANSITIONS.items():
+            self.assertTrue(targets - {status}, status)
+
+    def test_app_lifecycles_are_allowed(self):
+        for path in LIFECYCLES:
+            item = QueueItem(title="t")
+            with mock.patch.object(ytdl_gui.logging, "error") as error:
+                for status in path[1:]:
+                    item.set_status(status)
+            error.assert_not_called()
+            self.assertIs(item.status, path[-1])
+
+    def test_illegal_move_is_logged_and_made(self):
+        item = QueueItem(title="t", status=S.DONE)
+        with self.assertLogs(level=logging.ERROR) as logs:
+            item.set_status(S.DOWNLOADING)
+        self.assertIs(item.status, S.DOWNLOADING)
+        self.assertIn("done -> downloading", logs.output[0])
+
+
+class LegacyRecordTest(unittest.TestCase):
+    def test_display_strings_and_labels_are_parsed(self):
+        item = QueueItem.from_dict({'id': 'a', 'title': 't', 'status': "دانلود شده", 'filesize_str': "1.50 MB",
+                                    'duration_str': "1:02:03", 'downloaded_size': "512.00 KB"})
+        self.assertIs(item.status, S.DONE)
+        self.assertEqual(item.filesize, 1572864)
+        self.assertEqual(item.duration, 3723)
+        self.assertEqual(item.downloaded_bytes, 524288)
+        self.assertEqual(item.filesize_str, "1.50 MB")
+        self.assertNotIn('filesize_str', item.to_dict())
+
+    def test_unparsed_strings_and_unknown_keys_are_kept(self):
+        item = QueueItem.from_dict({'id': 'a', 'title': 't', 'status': "queued", 'filesize_str': "about 2 GB",
+                                    'duration_str': "نامشخص", 'custom': 1})
+        self.assertIsNone(item.filesize)
+        data = item.to_dict()
+        self.assertEqual(data['filesize_str'], "about 2 GB")
+        self.assertNotIn('duration_str', data)
+        self.assertEqual(data['custom'], 1)
+        self.assertEqual(data['status'], "queued")
+
+    def test_unknown_status_is_queued_again(self):
+        with self.assertLogs(level=logging.WARNING):
+            item = QueueItem.from_dict({'id': 'a', 'title': 't', 'status': "در حال دانلود (قدیمی)"})
+        self.assertIs(item.status, S.QUEUED)
+
+    def test_round_trip(self):
+        item = QueueItem(id='a', title='t', url='u', filesize=10, duration=5, retry_count=2)
+        item.set_status(S.DOWNLOADING)
+        again = QueueItem.from_dict(item.to_dict())
+        self.assertEqual(again.to_dict(), item.to_dict())
+        self.assertIs(again.status, S.DOWNLOADING)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+"""Which waiting items the scheduler starts next."""
+import unittest
+from types import SimpleNamespace
+
+from support import ytdl_gui
+
+S = ytdl_gui.ItemStatus
+
+
+def make_item(name, status=S.QUEUED, **fields):
+    return ytdl_gui.QueueItem(id=name, title=name, url=f"https://www.youtube.com/watch?v={name:_<11}", status=status, **fields)
+
+
+class UpcomingItemsTest(unittest.TestCase):
+    def upcoming(self, items, limit, cooling=()):
+        app = SimpleNamespace(download_queue=items, _cooling_hosts=lambda: set(cooling))
+        return [item['id'] for _, item in ytdl_gui.App._upcoming_items(app, set(), limit)]
+
+    def test_queue_order_and_waiting_items_only(self):
+        items = [make_item("a", S.DONE), make_item("b"), make_item("c", S.PAUSED), make_item("d", S.ERROR), make_item("e")]
+        self.assertEqual(self.upcoming(items, 5), ["b", "c", "e"])
+        self.assertEqual(self.upcoming(items, 1), ["b"])
+
+    def test_items_that_keep_stalling_go_last(self):
+        items = [make_item("a", stall_count=ytdl_gui.STALL_DEMOTE_THRESHOLD), make_item("b"),
+                 make_item("c", stall_count=ytdl_gui.STALL_DEMOTE_THRESHOLD - 1), make_item("d")]
+        self.assertEqual(self.upcoming(items, 1), ["b"])
+        self.assertEqual(self.upcoming(items, 4), ["b", "c", "d", "a"])
+        # Still started once nothing else is waiting
+        self.assertEqual(self.upcoming(items[:1], 1), ["a"])
+
+    def test_cooling_hosts_are_skipped(self):
+        items = [make_item("a"), make_item("b")]
+        self.assertEqual(self.upcoming(items, 2, cooling={"youtube.com"}), [])
+
+    def test_stall_stats_use_the_stream_host(self):
+        info = {'requested_formats': [{'url': "https://rr3---sn-abc.googlevideo.com/videoplayback?expire=1"},
+                                      {'url': "https://rr1---sn-xyz.googlevideo.com/videoplayback"}]}
+        self.assertEqual(ytdl_gui.media_host(info), "rr3---sn-abc.googlevideo.com")
+        self.assertIsNone(ytdl_gui.media_host(None))
+        self.assertIsNone(ytdl_gui.media_host({'title': "no formats yet"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
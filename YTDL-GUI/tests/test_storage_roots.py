@@ -0,0 +1,69 @@
+"""Placing output across several storage roots."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import ytdl_gui
+
+GB = 1024 ** 3
+
+
+def root(path, **rules):
+    return dict({'path': path}, **rules)
+
+
+class ChooseOutputRootTest(unittest.TestCase):
+    def test_most_weighted_free_space_per_writer_wins(self):
+        roots = [root("/a"), root("/b"), root("/c", weight=3)]
+        free = {"/a": 100 * GB, "/b": 50 * GB, "/c": 40 * GB}
+        self.assertEqual(ytdl_gui.choose_output_root(roots, "mp4", "youtube.com", GB, free, {}), "/c")
+        # Two downloads already writing to /c: 3 * 40 / 3 < 100
+        self.assertEqual(ytdl_gui.choose_output_root(roots, "mp4", "youtube.com", GB, free, {"/c": 2}), "/a")
+
+    def test_matching_rules_come_first_and_unmatched_rules_never_take_it(self):
+        roots = [root("/music", formats=["mp3", "m4a"]), root("/vimeo", sources=["vimeo.com"]), root("/any")]
+        free = {"/music": 10 * GB, "/vimeo": 500 * GB, "/any": 100 * GB}
+        choose = ytdl_gui.choose_output_root
+        self.assertEqual(choose(roots, "mp3", "youtube.com", GB, free, {}), "/music")
+        self.assertEqual(choose(roots, "mp4", "youtube.com", GB, free, {}), "/any")
+        self.assertEqual(choose(roots, "mp4", "vimeo.com", GB, free, {}), "/vimeo")
+        # A full ruled root falls back to the roots without rules
+        self.assertEqual(choose(roots, "mp3", "youtube.com", 20 * GB, free, {}), "/any")
+
+    def test_none_when_nothing_has_room(self):
+        roots = [root("/a"), root("/b")]
+        free = {"/a": GB, "/b": 2 * GB}
+        self.assertIsNone(ytdl_gui.choose_output_root(roots, "mp4", "youtube.com", 3 * GB, free, {}))
+        self.assertIsNone(ytdl_gui.choose_output_root([root("/m", formats=["mp3"])], "mp4", "youtube.com", 0, {"/m": GB}, {}))
+
+
+class RootLookupTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.roots = [os.path.join(self.dir, name) for name in ("disk1", "disk2")]
+        for folder in self.roots:
+            os.makedirs(folder)
+
+    def test_path_root(self):
+        disk1, disk2 = self.roots
+        self.assertEqual(ytdl_gui.path_root(os.path.join(disk2, "sub", "a.mp4"), self.roots), disk2)
+        self.assertEqual(ytdl_gui.path_root(disk1, self.roots), disk1)
+        # A sibling sharing the prefix is not inside the root
+        self.assertIsNone(ytdl_gui.path_root(disk1 + "-old" + os.sep + "a.mp4", self.roots))
+
+    def test_existing_files_are_found_on_any_root(self):
+        disk1, disk2 = self.roots
+        with open(os.path.join(disk2, "Clip.mp4"), 'w'):
+            pass
+        with open(os.path.join(disk2, "Other.mp4.part"), 'wb') as f:
+            f.write(b"x" * 10)
+        self.assertEqual(ytdl_gui.check_file_exists(self.roots, "Clip", "mp4"), (True, os.path.join(disk2, "Clip.mp4")))
+        self.assertEqual(ytdl_gui.check_file_exists(self.roots, "New", "mp4"), (False, os.path.join(disk1, "New.mp4")))
+        self.assertEqual(ytdl_gui.check_partial_file(self.roots, "Other", "mp4"),
+                         (True, os.path.join(disk2, "Other.mp4.part"), 10))
+
+
+if __name__ == "__main__":
+    unittest.main()